@@ -0,0 +1,45 @@
+"""Records/sec through singer.Transformer versus the compiled per-stream
+transformer, for prospects and for prospect_accounts with dynamic custom
+fields.
+
+Usage: python benchmarks/bench_compiled_transform.py [record_count]
+"""
+import sys
+
+from singer import Transformer
+
+from common import catalog_entry, generate_records, load_schema, timed
+
+from tap_pardot.sync import _transform_context
+from tap_pardot.transform import compile_transformer
+
+
+def compare(stream_name, count, custom_fields=0):
+    stream = catalog_entry(stream_name, custom_fields)
+    records = generate_records(load_schema(stream_name, custom_fields), count)
+    schema, mdata = _transform_context(stream)
+
+    def generic():
+        with Transformer() as transformer:
+            for rec in records:
+                transformer.transform(rec, schema, mdata)
+
+    def compiled():
+        with Transformer() as transformer:
+            transform = compile_transformer(schema, mdata, transformer)
+            for rec in records:
+                transform(rec)
+
+    before = timed("{} singer.Transformer".format(stream_name), count, generic)
+    after = timed("{} compiled".format(stream_name), count, compiled)
+    print("speedup: {:.2f}x".format(after / before))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    compare("prospects", count)
+    compare("prospect_accounts", count, custom_fields=50)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Requests and wall time for list_memberships queried one list at a time
+versus scanned across all lists, for an account with many small lists.
+
+The mock client answers like Pardot's query endpoints and sleeps for a fixed
+latency per request, so the timings are dominated by round-trips the way a
+real sync is.
+
+Usage: python benchmarks/bench_list_memberships.py [list_count] [latency_ms]
+"""
+import datetime
+import sys
+import time
+
+from common import BASE_DATE
+
+from tap_pardot.streams import ListMemberships
+
+PAGE_SIZE = 200
+MEMBERS_PER_LIST = 3
+
+
+def _datetime(minutes):
+    return (BASE_DATE + datetime.timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class MockClient:
+    """Serves lists and list memberships filtered and paged like Pardot."""
+
+    def __init__(self, list_count, latency):
+        self.latency = latency
+        self.requests = 0
+        self.lists = [
+            {"id": list_id, "updated_at": _datetime(list_id)}
+            for list_id in range(1, list_count + 1)
+        ]
+        self.memberships = [
+            {"id": (list_id - 1) * MEMBERS_PER_LIST + index + 1,
+             "list_id": list_id,
+             "prospect_id": index,
+             "updated_at": _datetime(list_id)}
+            for list_id in range(1, list_count + 1)
+            for index in range(MEMBERS_PER_LIST)
+        ]
+
+    def _page(self, data_key, matching):
+        self.requests += 1
+        time.sleep(self.latency)
+        if not matching:
+            return {"result": {"total_results": 0}}
+        return {"result": {"total_results": len(matching), data_key: matching[:PAGE_SIZE]}}
+
+    def get(self, endpoint, **params):
+        matching = [rec for rec in self.lists if rec["updated_at"] > params["updated_after"]]
+        return self._page("list", matching)
+
+    def post(self, endpoint, **params):
+        matching = [
+            rec for rec in self.memberships
+            if rec["id"] > params["id_greater_than"]
+            and rec["updated_at"] > params["updated_after"]
+            and ("list_id" not in params or rec["list_id"] == params["list_id"])
+        ]
+        return self._page("list_membership", matching)
+
+
+def run(list_count, latency, scan):
+    client = MockClient(list_count, latency)
+    config = {"start_date": "2023-12-31T00:00:00Z", "list_memberships_scan": scan}
+    stream = ListMemberships(client, config, {}, emit=False)
+    start = time.perf_counter()
+    records = list(stream.sync())
+    elapsed = time.perf_counter() - start
+    label = "scan across lists" if scan else "per list"
+    print("{:<20} {:>8,} records {:>8,} requests {:>8.2f} s".format(
+        label, len(records), client.requests, elapsed
+    ))
+    return sorted(rec["id"] for rec in records), elapsed
+
+
+def main():
+    list_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 5) / 1000
+    per_list, before = run(list_count, latency, False)
+    scanned, after = run(list_count, latency, True)
+    assert per_list == scanned, "both modes must emit the same memberships"
+    print("speedup: {:.2f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Records/sec from decoded page to transformed record, with and without
+projecting records onto the selected fields first, for prospect_accounts
+with many dynamic custom fields of which only a few are selected.
+
+Usage: python benchmarks/bench_projection.py [record_count] [custom_fields]
+"""
+import sys
+
+from singer import Transformer
+
+from common import catalog_entry, generate_records, load_schema, timed
+
+from tap_pardot.streams import ProspectAccounts
+from tap_pardot.sync import _transform_context
+from tap_pardot.transform import compile_transformer, selected_properties
+
+SELECTED = {"name", "created_at", "custom_field_0"}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    custom_fields = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    entry = catalog_entry("prospect_accounts", custom_fields, SELECTED)
+    schema, mdata = _transform_context(entry)
+    records = generate_records(load_schema("prospect_accounts", custom_fields), count)
+
+    stream = ProspectAccounts(None, {"start_date": "2024-01-01T00:00:00Z"}, {}, emit=False)
+    stream.selected_fields = selected_properties(schema, mdata)
+
+    def transform_only():
+        with Transformer() as transformer:
+            transform = compile_transformer(schema, mdata, transformer)
+            for rec in records:
+                transform(rec)
+
+    def project_then_transform():
+        with Transformer() as transformer:
+            transform = compile_transformer(schema, mdata, transformer)
+            for rec in records:
+                transform(stream._project_record(rec))  # pylint: disable=protected-access
+
+    before = timed("transform full records", count, transform_only)
+    after = timed("project, then transform", count, project_then_transform)
+    print("speedup: {:.2f}x".format(after / before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Peak memory and throughput of decoding a bulk prospects page whole versus
+streaming its records one at a time, for prospects with many custom fields.
+
+Each record is handed to a consumer that drops it straight away, the way a
+sync writes a record and moves on, so the streamed peak is what one record
+and a chunk of the body cost.
+
+Usage: python benchmarks/bench_streamed_pages.py [records] [custom_fields]
+"""
+import json
+import sys
+import tracemalloc
+
+from common import generate_records, load_schema, timed
+
+from tap_pardot.jsonstream import CHUNK_SIZE, StreamedPage
+
+
+def page_body(count, custom_fields):
+    schema = load_schema("prospects", custom_fields)
+    records = generate_records(schema, count)
+    page = {
+        "@attributes": {"stat": "ok", "version": 4},
+        "result": {"total_results": count, "prospect": records},
+    }
+    return json.dumps(page).encode("utf-8")
+
+
+def chunks(body):
+    return (body[index:index + CHUNK_SIZE] for index in range(0, len(body), CHUNK_SIZE))
+
+
+def decode_whole(body):
+    for _ in json.loads(body)["result"]["prospect"]:
+        pass
+
+
+def decode_streamed(body):
+    for _ in StreamedPage.open(chunks(body), "prospect").records():
+        pass
+
+
+def peak_memory(func, body):
+    tracemalloc.start()
+    func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    custom_fields = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    body = page_body(count, custom_fields)
+    print("page of {:,} records, {:,} bytes".format(count, len(body)))
+    for label, func in (("whole page", decode_whole), ("streamed", decode_streamed)):
+        peak = peak_memory(func, body)
+        timed("{} (peak {:,.1f} MiB)".format(label, peak / 2 ** 20), count, lambda: func(body))
+
+
+if __name__ == "__main__":
+    main()
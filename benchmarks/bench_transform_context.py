@@ -0,0 +1,40 @@
+"""Records/sec through the sync transform step, with the schema dict and
+metadata map rebuilt for every record (the old sync loop) versus built once
+per stream.
+
+Usage: python benchmarks/bench_transform_context.py [record_count]
+"""
+import sys
+
+from singer import Transformer, metadata
+
+from common import catalog_entry, generate_records, load_schema, timed
+
+from tap_pardot.sync import _transform_context
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    stream = catalog_entry("prospects")
+    records = generate_records(load_schema("prospects"), count)
+
+    def per_record():
+        with Transformer() as transformer:
+            for rec in records:
+                transformer.transform(
+                    rec, stream.schema.to_dict(), metadata.to_map(stream.metadata)
+                )
+
+    def hoisted():
+        schema, mdata = _transform_context(stream)
+        with Transformer() as transformer:
+            for rec in records:
+                transformer.transform(rec, schema, mdata)
+
+    before = timed("per-record schema/metadata", count, per_record)
+    after = timed("per-stream transform context", count, hoisted)
+    print("speedup: {:.2f}x".format(after / before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Shared helpers for the benchmark scripts in this directory.
+
+Pages are generated the way Pardot's bulk query output looks: ids as
+integers, datetimes as 'YYYY-MM-DD HH:MM:SS' strings and everything else as
+strings, so the transform work matches a real sync.
+"""
+import datetime
+import json
+import os
+import time
+
+from singer import CatalogEntry, Schema, metadata
+
+SCHEMAS_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "tap_pardot", "schemas"
+)
+BASE_DATE = datetime.datetime(2024, 1, 1)
+
+
+def load_schema(stream_name, custom_fields=0):
+    with open(os.path.join(SCHEMAS_DIR, stream_name + ".json")) as schema_file:
+        schema = json.load(schema_file)
+    # Mirrors what discovery adds for dynamic custom fields.
+    for index in range(custom_fields):
+        schema["properties"]["custom_field_{}".format(index)] = {
+            "type": ["null", "string", "object"],
+            "properties": {"value": {"type": ["null", "integer", "string"]}},
+        }
+    return schema
+
+
+def catalog_entry(stream_name, custom_fields=0, selected_fields=None):
+    schema = load_schema(stream_name, custom_fields)
+    mdata = metadata.to_map(
+        metadata.get_standard_metadata(
+            schema=schema, key_properties=["id"], valid_replication_keys=["id"]
+        )
+    )
+    mdata[()]["selected"] = True
+    for breadcrumb in mdata:
+        if breadcrumb:
+            field = breadcrumb[-1]
+            mdata[breadcrumb]["selected"] = (
+                selected_fields is None or field in selected_fields or field == "id"
+            )
+    return CatalogEntry(
+        tap_stream_id=stream_name,
+        stream=stream_name,
+        schema=Schema.from_dict(schema),
+        metadata=metadata.to_list(mdata),
+    )
+
+
+def _value(name, field_schema, seed):
+    types = field_schema.get("type", ["string"])
+    if not isinstance(types, list):
+        types = [types]
+    if field_schema.get("format") == "date-time":
+        return (BASE_DATE + datetime.timedelta(minutes=seed)).strftime("%Y-%m-%d %H:%M:%S")
+    if "integer" in types:
+        return seed
+    if "number" in types:
+        return "{}.5".format(seed)
+    if "boolean" in types:
+        return seed % 2 == 0
+    if "object" in types and "string" in types:
+        return "custom {} {}".format(name, seed)
+    if "object" in types:
+        return {}
+    if "array" in types:
+        return []
+    return "{} {}".format(name, seed)
+
+
+def generate_records(schema, count, start_id=1):
+    properties = schema["properties"]
+    return [
+        {name: _value(name, field_schema, start_id + offset)
+         for name, field_schema in properties.items()}
+        for offset in range(count)
+    ]
+
+
+def timed(label, count, func, repeat=3):
+    """Run func repeat times and print the best records/sec."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("{:<40} {:>12,.0f} records/sec".format(label, count / best))
+    return count / best
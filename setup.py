@@ -22,6 +22,9 @@ setup(
             'coverage',
             'parameterized',
         ],
+        'fast': [
+            'orjson',
+        ],
     },
     entry_points="""
     [console_scripts]
@@ -0,0 +1,376 @@
+import asyncio
+import gzip
+import json
+import ssl
+import zlib
+from urllib.parse import urlencode, urlsplit
+
+import backoff
+import requests
+import singer
+
+from .client import (
+    DEFAULT_POOL_MAXSIZE,
+    Pardot401Error,
+    Pardot5xxError,
+    Pardot89Error,
+    PardotException,
+    is_not_retryable_pardot_exception,
+)
+from .config import get_bool, get_int
+
+LOGGER = singer.get_logger()
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class AsyncResponse:
+    """Status, headers and body of one response read by HostConnectionPool,
+    with the parts of requests.Response the JSON codec and error handling
+    use."""
+
+    def __init__(self, url, status_code, reason, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise requests.HTTPError(
+                "{} Error: {} for url: {}".format(self.status_code, self.reason, self.url),
+                response=self,
+            )
+
+
+class HostConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one host over asyncio streams.
+
+    At most maxsize requests are on the wire at a time, each on a connection
+    of its own; the rest wait for one to come back to the pool. A pooled
+    connection the server closed while it sat idle is replaced with a new
+    one and the request sent again.
+    """
+
+    def __init__(self, scheme, host, port, maxsize=DEFAULT_POOL_MAXSIZE,
+                 connect_timeout=None, read_timeout=None, keep_alive=True):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.maxsize = max(1, maxsize)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+        self._idle = []
+        # Made on first use, on the loop that runs the requests.
+        self._slots = None
+
+    @classmethod
+    def for_url(cls, url, **kwargs):
+        parts = urlsplit(url)
+        return cls(
+            parts.scheme,
+            parts.hostname,
+            parts.port or DEFAULT_PORTS[parts.scheme],
+            **kwargs,
+        )
+
+    @property
+    def host_header(self):
+        if self.port == DEFAULT_PORTS[self.scheme]:
+            return self.host
+        return "{}:{}".format(self.host, self.port)
+
+    async def request(self, method, target, headers):
+        """Send method target with headers and return its AsyncResponse."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.maxsize)
+        async with self._slots:
+            while self._idle:
+                connection = self._idle.pop()
+                try:
+                    return await self._exchange(connection, method, target, headers)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    LOGGER.info("Pooled connection to %s was closed, reconnecting.", self.host)
+            return await self._exchange(await self._connect(), method, target, headers)
+
+    async def _connect(self):
+        ssl_context = ssl.create_default_context() if self.scheme == "https" else None
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_context),
+            self.connect_timeout,
+        )
+
+    async def _exchange(self, connection, method, target, headers):
+        reader, writer = connection
+        reusable = False
+        try:
+            writer.write(self._request_head(method, target, headers))
+            await writer.drain()
+            response, reusable = await asyncio.wait_for(
+                self._read_response(reader, target), self.read_timeout
+            )
+            return response
+        finally:
+            if reusable and self.keep_alive:
+                self._idle.append(connection)
+            else:
+                writer.close()
+
+    def _request_head(self, method, target, headers):
+        lines = [
+            "{} {} HTTP/1.1".format(method.upper(), target),
+            "Host: {}".format(self.host_header),
+            "Accept: */*",
+            "Accept-Encoding: gzip, deflate",
+            "Connection: {}".format("keep-alive" if self.keep_alive else "close"),
+        ]
+        if method.upper() == "POST":
+            # Pardot takes POSTed queries in the query string.
+            lines.append("Content-Length: 0")
+        lines.extend("{}: {}".format(name, value) for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _read_response(self, reader, target):
+        version, status, reason = await self._read_status(reader)
+        headers = await self._read_headers(reader)
+        while 100 <= status < 200:
+            # Interim responses like 100 Continue come before the real one.
+            version, status, reason = await self._read_status(reader)
+            headers = await self._read_headers(reader)
+
+        reusable = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if status in (204, 304):
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            body = await self._read_chunked(reader)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # Delimited by the server closing the connection.
+            body = await reader.read()
+            reusable = False
+
+        encoding = headers.get("content-encoding", "").lower()
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "deflate":
+            body = zlib.decompress(body)
+        url = "{}://{}{}".format(self.scheme, self.host_header, target)
+        return AsyncResponse(url, status, reason, headers, body), reusable
+
+    @staticmethod
+    async def _read_status(reader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionResetError("Connection closed before a response arrived")
+        version, status, reason = (line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+        return version, int(status), reason
+
+    @staticmethod
+    async def _read_headers(reader):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    @staticmethod
+    async def _read_chunked(reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";", 1)[0].strip(), 16)
+            if not size:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        # Trailers, if any, up to the blank line that ends the body.
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        return b"".join(chunks)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+
+class AsyncClient:
+    """asyncio counterpart of Client with the same get/post/describe surface.
+
+    Requests go over asyncio streams on a HostConnectionPool of pool_maxsize
+    keep-alive connections to the API host, so pages of many streams are in
+    flight on one event loop without threads. Everything else belongs to
+    the blocking client it is made from and is shared with it: credentials
+    and api_version, the concurrency limiter, the daily quota, the response
+    cache and the JSON codec. Errors are classified the same way, as
+    Pardot401Error, Pardot89Error, Pardot5xxError or PardotException, and
+    error code 66 shrinks the limiter and is retried.
+
+    Logging in again or refreshing the token is left to the blocking client.
+    It happens about once an hour, and every request needs the new
+    credential before it can go out anyway.
+    """
+
+    # pylint: disable=protected-access
+
+    def __init__(self, client):
+        self.client = client
+        connect_timeout, read_timeout = client.timeout
+        self.pool = HostConnectionPool.for_url(
+            client.endpoint_base,
+            maxsize=get_int(client.creds, "pool_maxsize", DEFAULT_POOL_MAXSIZE),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            keep_alive=get_bool(client.creds, "keep_alive", True),
+        )
+        self._slot_released = None
+
+    @property
+    def api_version(self):
+        return self.client.api_version
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        await self.pool.close()
+
+    @backoff.on_exception(
+        backoff.expo,
+        (PardotException,Pardot5xxError),
+        giveup=is_not_retryable_pardot_exception,
+    )
+    async def describe(self, endpoint, **kwargs):
+        url = (self.client.endpoint_base + self.client.describe_url).format(endpoint, '{}')
+
+        params = {"format": "json", "output": "bulk", **kwargs}
+
+        return await self._request_endpoint("get", endpoint, url, params, "describing endpoint")
+
+    async def get(self, endpoint, format_params=None, **kwargs):
+        return await self._fetch("get", endpoint, format_params, **kwargs)
+
+    async def post(self, endpoint, format_params=None, **kwargs):
+        return await self._fetch("post", endpoint, format_params, **kwargs)
+
+    @backoff.on_exception(
+        backoff.expo,
+        (PardotException,Pardot5xxError),
+        giveup=is_not_retryable_pardot_exception,
+        jitter=None,
+    )
+    async def _fetch(self, method, endpoint, format_params, **kwargs):
+        base_formatting = [endpoint, '{}']
+        if format_params:
+            base_formatting.extend(format_params)
+        url = (self.client.endpoint_base + self.client.get_url).format(*base_formatting)
+
+        params = {"format": "json", "output": "bulk", **kwargs}
+
+        return await self._request_endpoint(method, endpoint, url, params, "retrieving endpoint")
+
+    async def _request_endpoint(self, method, endpoint, url, params, activity):
+        client = self.client
+        if client.cache is not None and client.cache.replaying:
+            return client._replay(method, url, params)
+
+        delay = client.quota.pace(endpoint)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        content = await self._make_request(method, url, params, endpoint)
+
+        client._check_error(content, activity)
+        client._record(method, url, params, content)
+        return content
+
+    @backoff.on_exception(
+        backoff.expo,
+        (Pardot401Error,Pardot89Error),
+        max_tries=3,
+        giveup=is_not_retryable_pardot_exception,
+    )
+    async def _make_request(self, method, url, params, endpoint):
+        client = self.client
+        full_url = url.format(client.api_version)
+        LOGGER.info(
+            "%s - Making request to %s endpoint %s, with params %s",
+            full_url,
+            method.upper(),
+            full_url,
+            params,
+        )
+
+        client._ensure_fresh_credentials()
+        credential = client._current_credential()
+        response = await self._send(method, full_url, params, endpoint)
+
+        if response.status_code == 401:
+            if client.has_oauth_values():
+                LOGGER.warning("Received a 401 unauthenticated error from Pardot. Reauthing and retrying the request.")
+                client._reauthenticate(credential)
+                raise Pardot401Error
+
+        # 5xx errors should be retried
+        if response.status_code >= 500:
+            raise Pardot5xxError()
+
+        response.raise_for_status()
+
+        content = client.codec.decode_response(response)
+        error_message = content.get("err")
+
+        if error_message:
+            error_code = content["@attributes"]["err_code"]
+
+            # Error code 1 indicates a bad api_key or user_key
+            if error_code == 1:
+                LOGGER.info("API key or user key expired -- Reauthenticating once")
+                client._reauthenticate(credential)
+                response = await self._send(method, full_url, params, endpoint)
+                content = client.codec.decode_response(response)
+            if error_code == 89:
+                client._use_api_version_3()
+                raise Pardot89Error
+
+        client._update_limiter(content)
+        return content
+
+    async def _send(self, method, full_url, params, endpoint):
+        self.client.quota.record_call(endpoint)
+        parts = urlsplit(full_url)
+        target = parts.path
+        if params:
+            target += "?" + urlencode(params, doseq=True)
+        await self._acquire_slot()
+        try:
+            return await self.pool.request(method, target, self.client._get_auth_header())
+        finally:
+            self._release_slot()
+
+    async def _acquire_slot(self):
+        # The limiter's own acquire() would block the loop. Every slot taken
+        # here is given back by _release_slot, which wakes the waiters.
+        if self._slot_released is None:
+            self._slot_released = asyncio.Event()
+        while not self.client.limiter.try_acquire():
+            self._slot_released.clear()
+            await self._slot_released.wait()
+
+    def _release_slot(self):
+        self.client.limiter.release()
+        self._slot_released.set()
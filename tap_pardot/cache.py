@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import singer
+
+from .config import get_int
+
+LOGGER = singer.get_logger()
+
+RECORD = "record"
+REPLAY = "replay"
+
+API_VERSION_FILE = "api_version"
+
+# Once a put takes the cache past max_bytes it is trimmed to this share of it,
+# so the puts that follow have room before the directory is walked again.
+EVICT_LOW_WATER = 0.9
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+class ResponseCache:
+    """On-disk, content-addressed cache of Pardot API responses.
+
+    In record mode every successful response is stored, gzip-compressed,
+    under a hash of the method, endpoint, API version and normalized request
+    params. In replay mode responses are served from disk only, so a run can
+    be repeated deterministically without touching the API. Entries are
+    evicted oldest first once they exceed max_age seconds or the cache grows
+    past max_bytes.
+    """
+
+    def __init__(self, directory, mode, max_bytes=None, max_age=None):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(
+                "http_cache_mode must be '{}' or '{}', got {!r}".format(RECORD, REPLAY, mode)
+            )
+        self.directory = directory
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = self.evict()
+
+    @classmethod
+    def from_config(cls, config):
+        directory = config.get("http_cache_dir")
+        if not directory:
+            return None
+        return cls(
+            directory,
+            config.get("http_cache_mode") or RECORD,
+            max_bytes=get_int(config, "http_cache_max_bytes", None),
+            max_age=get_int(config, "http_cache_max_age", None),
+        )
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    @staticmethod
+    def key(method, endpoint, api_version, params):
+        normalized = {
+            str(name): str(value) for name, value in params.items() if value is not None
+        }
+        material = json.dumps(
+            [method.lower(), endpoint, str(api_version), normalized], sort_keys=True
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json.gz")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json.gz"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _expired(self, mtime):
+        return self.max_age is not None and time.time() - mtime > self.max_age
+
+    def evict(self, target_bytes=None):
+        """Drop expired entries, then the oldest ones until the rest fit in
+        target_bytes, max_bytes by default.
+
+        Returns the size of what is left.
+        """
+        if target_bytes is None:
+            target_bytes = self.max_bytes
+        entries = []
+        for mtime, size, path in self._entries():
+            if self._expired(mtime):
+                os.remove(path)
+            else:
+                entries.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if target_bytes is not None and total > target_bytes:
+            for _, size, path in sorted(entries):
+                os.remove(path)
+                total -= size
+                if total <= target_bytes:
+                    break
+        return total
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                return None
+            with gzip.open(path, "rt", encoding="utf-8") as cached:
+                return json.load(cached)
+        except FileNotFoundError:
+            return None
+
+    def replay(self, key, description):
+        content = self.get(key)
+        if content is None:
+            raise CacheMissError(
+                "No recorded response for {} in {}".format(description, self.directory)
+            )
+        return content
+
+    def put(self, key, content):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so an interrupted run never leaves a
+        # truncated entry behind for replay to trip over.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as cached:
+            json.dump(content, cached)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += os.path.getsize(path)
+            if self.max_bytes is not None and self._size > self.max_bytes:
+                self._size = self.evict(int(self.max_bytes * EVICT_LOW_WATER))
+
+    def load_api_version(self):
+        try:
+            with open(os.path.join(self.directory, API_VERSION_FILE)) as version_file:
+                return version_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def save_api_version(self, api_version):
+        with open(os.path.join(self.directory, API_VERSION_FILE), "w") as version_file:
+            version_file.write(str(api_version))
@@ -0,0 +1,81 @@
+import time
+
+import singer
+
+from .config import get_float, get_int
+
+PAGE = "page"
+RECORDS = "records"
+SECONDS = "seconds"
+
+DEFAULT_CHECKPOINT_RECORDS = 1000
+DEFAULT_CHECKPOINT_SECONDS = 30
+
+
+class Checkpointer:
+    """Decides when the bookmarks a stream keeps in memory are emitted as STATE.
+
+    Streams mark the state dirty whenever they move a bookmark, and report
+    every record they hand out and every page they finish. STATE is written
+    only on a flush: after each page, every N records or every T seconds
+    depending on the policy, plus once when the stream ends. Flushes happen
+    after the records they cover have been emitted, so a resumed run never
+    skips a record that didn't make it out.
+    """
+
+    def __init__(self, state, emit=True, policy=PAGE,
+                 every_records=DEFAULT_CHECKPOINT_RECORDS,
+                 every_seconds=DEFAULT_CHECKPOINT_SECONDS,
+                 clock=time.monotonic):
+        if policy not in (PAGE, RECORDS, SECONDS):
+            raise ValueError(
+                "state_checkpoint_policy must be one of '{}', '{}' or '{}', got {!r}".format(
+                    PAGE, RECORDS, SECONDS, policy
+                )
+            )
+        self.state = state
+        self.emit = emit
+        self.policy = policy
+        self.every_records = max(1, every_records)
+        self.every_seconds = every_seconds
+        # None means singer.write_state, looked up when flushing.
+        self.write_state = None
+        self._clock = clock
+        self._dirty = False
+        self._records_since_flush = 0
+        self._last_flush = clock()
+
+    @classmethod
+    def from_config(cls, config, state, emit=True):
+        return cls(
+            state,
+            emit=emit,
+            policy=config.get("state_checkpoint_policy") or PAGE,
+            every_records=get_int(
+                config, "state_checkpoint_records", DEFAULT_CHECKPOINT_RECORDS
+            ),
+            every_seconds=get_float(
+                config, "state_checkpoint_seconds", DEFAULT_CHECKPOINT_SECONDS
+            ),
+        )
+
+    def mark(self):
+        self._dirty = True
+
+    def record_done(self):
+        self._records_since_flush += 1
+        if self.policy == RECORDS and self._records_since_flush >= self.every_records:
+            self.flush()
+        elif self.policy == SECONDS and self._clock() - self._last_flush >= self.every_seconds:
+            self.flush()
+
+    def page_done(self):
+        if self.policy == PAGE:
+            self.flush()
+
+    def flush(self):
+        if self._dirty and self.emit:
+            (self.write_state or singer.write_state)(self.state)
+        self._dirty = False
+        self._records_since_flush = 0
+        self._last_flush = self._clock()
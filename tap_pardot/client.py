@@ -1,15 +1,44 @@
+import threading
+import time
+
+from urllib.parse import urljoin
+
 import backoff
 import requests
 import singer
 
 from base64 import b64encode
 
+from requests.adapters import HTTPAdapter
+
+from .cache import ResponseCache
+from .concurrency import ConcurrencyLimiter
+from .config import get_bool, get_float, get_int
+from .credentials import CredentialCache, is_fresh
+from .jsoncodec import JsonCodec
+from .jsonstream import CHUNK_SIZE, StreamedPage
+from .quota import QuotaBudgeter
+
 LOGGER = singer.get_logger()
 
 AUTH_URL = "https://pi.pardot.com/api/login/version/3"
 ENDPOINT_BASE = "https://pi.pardot.com/api/"
 REFRESH_URL = "https://login.salesforce.com/services/oauth2/token"
 
+# Every page of every stream goes to the same host, so a single pool sized for
+# the number of requests we may have in flight is enough.
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+
+# Salesforce doesn't return a lifetime with refreshed tokens; its default
+# session timeout is two hours. Pardot api_keys are valid for one hour.
+DEFAULT_ACCESS_TOKEN_TTL = 7200
+API_KEY_TTL = 3600
+# Refresh this long before the known expiry so in-flight pages never race it.
+DEFAULT_TOKEN_REFRESH_MARGIN = 300
+
 
 class Pardot5xxError(Exception):
     pass
@@ -44,6 +73,33 @@ def is_not_retryable_pardot_exception(exc):
     return True
 
 
+class HeldResponse:
+    """A streamed response that keeps its ConcurrencyLimiter slot until it is
+    closed, since its body is still on the wire after the headers arrive."""
+
+    def __init__(self, response, limiter):
+        self._response = response
+        self._limiter = limiter
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._limiter.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 class Client:
     """Lightweight Client wrapper to allow switching between version 3 and 4 API based
     on availability, if desired."""
@@ -53,8 +109,23 @@ class Client:
     creds = None
     endpoint_base = ENDPOINT_BASE
 
+    _session = None
+    _limiter = None
+    _quota = None
+    _cache = None
+    _cache_loaded = False
+    _recorded_api_version = None
+    _credential_cache = None
+    _credential_cache_loaded = False
+    _codec = None
+
+    token_expires_at = None
+    api_key_expires_at = None
+
     get_url = "{}/version/{}/do/query"
     describe_url = "{}/version/{}/do/describe"
+    v5_url = "v5/objects/{}"
+    exports_url = "v5/exports"
 
     @staticmethod
     def _normalize_endpoint_base(endpoint_base):
@@ -63,17 +134,116 @@ class Client:
 
     def __init__(self, creds):
         self.creds = creds
+        # Held while re-authenticating so concurrent requests that all notice
+        # an expired credential trigger a single refresh between them.
+        self._auth_lock = threading.Lock()
         self.api_version = "4"
         self.endpoint_base = self._normalize_endpoint_base(
             creds.get('pardot_api_url', ENDPOINT_BASE)
         )
+        self._limiter = ConcurrencyLimiter.from_config(creds)
+        self._quota = QuotaBudgeter.from_config(creds)
+        if self.cache is not None and self.cache.replaying:
+            # Replay never goes to the network, so there is nothing to
+            # authenticate against.
+            LOGGER.info("Replaying recorded responses from %s", self.cache.directory)
+            self.api_version = self.cache.load_api_version() or self.api_version
+            return
+
+        cached = self.credential_cache.load() if self.credential_cache else {}
+        self.api_version = cached.get("api_version") or self.api_version
+
         if self.has_oauth_values():
-            self.refresh_credentials()
+            if cached.get("access_token") and is_fresh(cached.get("access_token_expires_at")):
+                LOGGER.info("Reusing cached access token")
+                self.creds["access_token"] = cached["access_token"]
+                self.token_expires_at = cached["access_token_expires_at"]
+            else:
+                self.refresh_credentials()
         elif self.has_api_key_auth_values():
-            self.login()
+            if cached.get("api_key") and is_fresh(cached.get("api_key_expires_at")):
+                LOGGER.info("Reusing cached api_key")
+                self.api_key = cached["api_key"]
+                self.api_key_expires_at = cached["api_key_expires_at"]
+            else:
+                self.login()
         else:
             raise AuthCredsMissingError("Requires OAuth credentials refresh token, client id, client secret, or Pardot Business Unit Id.")
 
+    @property
+    def session(self):
+        """Pooled keep-alive session shared by every request this client makes."""
+        if self._session is None:
+            self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=get_int(self.creds, "pool_connections", DEFAULT_POOL_CONNECTIONS),
+            pool_maxsize=get_int(self.creds, "pool_maxsize", DEFAULT_POOL_MAXSIZE),
+            # Block instead of opening throwaway connections once the per-host
+            # limit is reached.
+            pool_block=True,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not get_bool(self.creds, "keep_alive", True):
+            session.headers["Connection"] = "close"
+        return session
+
+    @property
+    def limiter(self):
+        """Concurrency governor every Pardot API request goes through."""
+        if self._limiter is None:
+            self._limiter = ConcurrencyLimiter.from_config(self.creds)
+        return self._limiter
+
+    @property
+    def quota(self):
+        """Daily API call budget every Pardot API request is charged to."""
+        if self._quota is None:
+            self._quota = QuotaBudgeter.from_config(self.creds)
+        return self._quota
+
+    @property
+    def cache(self):
+        """Record/replay response cache, or None when http_cache_dir is unset."""
+        if not self._cache_loaded:
+            self._cache = ResponseCache.from_config(self.creds)
+            self._cache_loaded = True
+        return self._cache
+
+    @property
+    def credential_cache(self):
+        """Cross-run credential cache, or None when credentials_cache_path is unset."""
+        if not self._credential_cache_loaded:
+            self._credential_cache = CredentialCache.from_config(self.creds)
+            self._credential_cache_loaded = True
+        return self._credential_cache
+
+    @property
+    def codec(self):
+        """JSON backend Pardot pages are decoded with."""
+        if self._codec is None:
+            self._codec = JsonCodec.from_config(self.creds)
+        return self._codec
+
+    def _save_credentials(self, **values):
+        if self.credential_cache is not None:
+            self.credential_cache.save(api_version=self.api_version, **values)
+
+    @property
+    def timeout(self):
+        return (
+            get_float(self.creds, "connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+            get_float(self.creds, "request_timeout", DEFAULT_READ_TIMEOUT),
+        )
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
     def has_oauth_values(self):
         return self.creds.get('refresh_token') and self.creds.get('client_id') and self.creds.get('client_secret') and self.creds.get('pardot_business_unit_id')
@@ -82,7 +252,7 @@ class Client:
         return self.creds.get('email') and self.creds.get('password') and self.creds.get('user_key')
 
     def login(self):
-        response = requests.post(
+        response = self.session.post(
             AUTH_URL,
             data={
                 "email": self.creds["email"],
@@ -90,6 +260,7 @@ class Client:
                 "user_key": self.creds["user_key"],
             },
             params={"format": "json"},
+            timeout=self.timeout,
         )
 
         # This will only work if they use HTTP codes. Handling Pardot
@@ -102,7 +273,10 @@ class Client:
 
 
         self.api_key = content["api_key"]
-
+        self.api_key_expires_at = time.time() + API_KEY_TTL
+        self._save_credentials(
+            api_key=self.api_key, api_key_expires_at=self.api_key_expires_at
+        )
 
     def _check_error(self, content, activity):
         error_message = content.get("err")
@@ -145,18 +319,68 @@ class Client:
         }
         method = "POST"
 
-        response = requests.request(
+        response = self.session.request(
             method,
             REFRESH_URL,
             headers=headers,
-            params=params
+            params=params,
+            timeout=self.timeout,
         )
 
         response.raise_for_status()
         response = response.json()
 
         self.creds['access_token'] = response["access_token"]
+        self.token_expires_at = self._token_expiry(response)
+        self._save_credentials(
+            access_token=self.creds["access_token"],
+            access_token_expires_at=self.token_expires_at,
+        )
+
+    def _current_credential(self):
+        if self.has_oauth_values():
+            return self.creds.get("access_token")
+        return self.api_key
+
+    def _credential_expiry(self):
+        return self.token_expires_at if self.has_oauth_values() else self.api_key_expires_at
+
+    def _reauthenticate(self, stale_credential, refresh_margin=None):
+        """Refresh the token (or log in again) unless another request already
+        replaced stale_credential while we waited for the lock. With
+        refresh_margin, also skip it if the credential has become fresh for
+        that long since."""
+        with self._auth_lock:
+            if self._current_credential() != stale_credential:
+                return
+            if refresh_margin is not None and is_fresh(self._credential_expiry(), refresh_margin):
+                return
+            if self.has_oauth_values():
+                self.refresh_credentials()
+            else:
+                self.login()
 
+    def _ensure_fresh_credentials(self):
+        # Read before the expiry, so a refresh finishing in between shows up
+        # as a changed credential in _reauthenticate.
+        credential = self._current_credential()
+        expires_at = self._credential_expiry()
+        # Without a known expiry we rely on the 401 / error code 1 handling.
+        if expires_at is None:
+            return
+        margin = get_float(self.creds, "token_refresh_margin", DEFAULT_TOKEN_REFRESH_MARGIN)
+        if not is_fresh(expires_at, margin):
+            LOGGER.info("Credentials expire within %s seconds, refreshing ahead of time", margin)
+            self._reauthenticate(credential, margin)
+
+    def _token_expiry(self, response):
+        if response.get("expires_in"):
+            return time.time() + float(response["expires_in"])
+        ttl = get_float(self.creds, "access_token_ttl", DEFAULT_ACCESS_TOKEN_TTL)
+        if response.get("issued_at"):
+            # issued_at is in milliseconds since the epoch
+            return float(response["issued_at"]) / 1000 + ttl
+        return time.time() + ttl
 
     @backoff.on_exception(
         backoff.expo,
@@ -164,7 +388,7 @@ class Client:
         max_tries=3,
         giveup=is_not_retryable_pardot_exception,
     )
-    def _make_request(self, method, url, params=None):
+    def _make_request(self, method, url, params=None, endpoint=None, json_body=None):
         full_url = url.format(self.api_version)
         LOGGER.info(
             "%s - Making request to %s endpoint %s, with params %s",
@@ -174,14 +398,14 @@ class Client:
             params,
         )
 
-        response = requests.request(
-            method, full_url, headers=self._get_auth_header(), params=params
-        )
+        self._ensure_fresh_credentials()
+        credential = self._current_credential()
+        response = self._send(method, full_url, params, endpoint, json_body)
 
         if response.status_code == 401:
             if self.has_oauth_values():
                 LOGGER.warning("Received a 401 unauthenticated error from Pardot. Reauthing and retrying the request.")
-                self.refresh_credentials()
+                self._reauthenticate(credential)
                 raise Pardot401Error
 
         # 5xx errors should be retried
@@ -190,7 +414,7 @@ class Client:
 
         response.raise_for_status()
 
-        content = response.json()
+        content = self.codec.decode_response(response)
         error_message = content.get("err")
 
         if error_message:
@@ -203,20 +427,56 @@ class Client:
 
             if error_code == 1:
                 LOGGER.info("API key or user key expired -- Reauthenticating once")
-                self.login()
-                response = requests.request(
-                    method, full_url, headers=self._get_auth_header(), params=params
-                )
-                content = response.json()
+                self._reauthenticate(credential)
+                response = self._send(method, full_url, params, endpoint, json_body)
+                content = self.codec.decode_response(response)
             if error_code == 89:
-                # 89 specifically means you are using api version 4 and should use 3
-                # https://developer.pardot.com/kb/error-codes-messages/#error-code-89
-                LOGGER.info("Pardot returned error code 89, switching to api version 3")
-                self.api_version = "3"
+                self._use_api_version_3()
                 raise Pardot89Error
 
+        self._update_limiter(content)
         return content
 
+    def _use_api_version_3(self):
+        # 89 specifically means you are using api version 4 and should use 3
+        # https://developer.pardot.com/kb/error-codes-messages/#error-code-89
+        LOGGER.info("Pardot returned error code 89, switching to api version 3")
+        self.api_version = "3"
+        self._save_credentials()
+
+    def _update_limiter(self, content):
+        if content.get("err") and content["@attributes"]["err_code"] == 66:
+            self.limiter.on_limit_exceeded()
+        elif not content.get("err"):
+            self.limiter.on_success()
+
+    def _request(self, method, full_url, params, endpoint, json_body=None, stream=False):
+        self.quota.record_call(endpoint)
+        return self.session.request(
+            method,
+            full_url,
+            headers=self._get_auth_header(),
+            params=params,
+            json=json_body,
+            timeout=self.timeout,
+            stream=stream,
+        )
+
+    def _send(self, method, full_url, params, endpoint=None, json_body=None):
+        with self.limiter:
+            return self._request(method, full_url, params, endpoint, json_body)
+
+    def _send_streamed(self, full_url, params, endpoint):
+        """GET full_url, holding a limiter slot until the HeldResponse
+        returned is closed."""
+        self.limiter.acquire()
+        try:
+            response = self._request("get", full_url, params, endpoint, stream=True)
+        except BaseException:
+            self.limiter.release()
+            raise
+        return HeldResponse(response, self.limiter)
+
     @backoff.on_exception(
         backoff.expo,
         (PardotException,Pardot5xxError),
@@ -227,11 +487,7 @@ class Client:
 
         params = {"format": "json", "output": "bulk", **kwargs}
 
-        content = self._make_request("get", url, params)
-
-        self._check_error(content, "describing endpoint")
-
-        return content
+        return self._request_endpoint("get", endpoint, url, params, "describing endpoint")
 
     @backoff.on_exception(
         backoff.expo,
@@ -247,12 +503,132 @@ class Client:
 
         params = {"format": "json", "output": "bulk", **kwargs}
 
-        content = self._make_request(method, url, params)
+        return self._request_endpoint(method, endpoint, url, params, "retrieving endpoint")
 
-        self._check_error(content, "retrieving endpoint")
+    def _request_endpoint(self, method, endpoint, url, params, activity):
+        if self.cache is not None and self.cache.replaying:
+            return self._replay(method, url, params)
 
+        self.quota.before_call(endpoint)
+        content = self._make_request(method, url, params, endpoint=endpoint)
+
+        self._check_error(content, activity)
+        self._record(method, url, params, content)
         return content
 
+    def _replay(self, method, url, params):
+        cache_key = self.cache.key(method, url, self.api_version, params)
+        return self.cache.replay(cache_key, "{} {} {}".format(method.upper(), url, params))
+
+    def _record(self, method, url, params, content):
+        if self.cache is None:
+            return
+        # Keyed after the request, since a version switch changes the key.
+        cache_key = self.cache.key(method, url, self.api_version, params)
+        self.cache.put(cache_key, content)
+        if self._recorded_api_version != self.api_version:
+            self.cache.save_api_version(self.api_version)
+            self._recorded_api_version = self.api_version
+
+    @backoff.on_exception(
+        backoff.expo,
+        (PardotException,Pardot5xxError),
+        giveup=is_not_retryable_pardot_exception,
+        jitter=None,
+    )
+    def get_v5(self, object_name, **params):
+        """Query one page of a v5 object. v5 takes OAuth credentials only."""
+        url = self.endpoint_base + self.v5_url.format(object_name)
+        return self._request_endpoint("get", object_name, url, params, "retrieving v5 object")
+
+    @backoff.on_exception(
+        backoff.expo,
+        (PardotException,Pardot5xxError),
+        giveup=is_not_retryable_pardot_exception,
+        jitter=None,
+    )
+    def create_export(self, body):
+        """Start a v5 bulk export job and return it.
+
+        Export jobs change state between calls, so they bypass the response
+        cache; a replayed run would otherwise poll a job forever.
+        """
+        self.quota.before_call("exports")
+        return self._make_request(
+            "post", self.endpoint_base + self.exports_url, endpoint="exports", json_body=body
+        )
+
+    @backoff.on_exception(
+        backoff.expo,
+        (PardotException,Pardot5xxError),
+        giveup=is_not_retryable_pardot_exception,
+        jitter=None,
+    )
+    def get_export(self, export_id):
+        self.quota.before_call("exports")
+        url = "{}{}/{}".format(self.endpoint_base, self.exports_url, export_id)
+        return self._make_request("get", url, endpoint="exports")
+
+    def open_export_result(self, result_ref):
+        """Streamed response for one result file of a finished export.
+
+        result_ref is one of the job's resultRefs, absolute or relative to
+        the API base. The caller reads the body as it arrives and closes it.
+        """
+        url = urljoin(self.endpoint_base, result_ref)
+        self.quota.before_call("exports")
+        return self._open_stream(url, None, "exports")
+
+    @backoff.on_exception(
+        backoff.expo,
+        (Pardot401Error,Pardot5xxError),
+        max_tries=5,
+        jitter=None,
+    )
+    def _open_stream(self, url, params, endpoint):
+        """Send a GET and return a HeldResponse once its headers are in,
+        leaving the body to be read as it arrives. The caller closes it."""
+        LOGGER.info("Streaming GET from %s, with params %s", url, params)
+        self._ensure_fresh_credentials()
+        credential = self._current_credential()
+        response = self._send_streamed(url, params, endpoint)
+        if response.status_code == 401 and self.has_oauth_values():
+            response.close()
+            self._reauthenticate(credential)
+            raise Pardot401Error
+        if response.status_code >= 500:
+            response.close()
+            raise Pardot5xxError()
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
+    def get_streamed(self, endpoint, data_key, **kwargs):
+        """Like get(), but returns a StreamedPage whose records are decoded
+        one at a time while the response is read.
+
+        Pages answered with an error are small and requested again through
+        get(), which knows how to recover from each error code. So are all
+        pages while the response cache is in use, since it stores whole
+        pages.
+        """
+        if self.cache is not None:
+            return StreamedPage.from_data(self.get(endpoint, **kwargs), data_key)
+
+        url = (self.endpoint_base + self.get_url).format(endpoint, self.api_version)
+        params = {"format": "json", "output": "bulk", **kwargs}
+        self.quota.before_call(endpoint)
+        response = self._open_stream(url, params, endpoint)
+        page = StreamedPage.open(response.iter_content(CHUNK_SIZE), data_key, response.close)
+        if page.data.get("err"):
+            page.close()
+            return StreamedPage.from_data(self.get(endpoint, **kwargs), data_key)
+        self.limiter.on_success()
+        return page
+
     def get(self, endpoint, format_params=None, **kwargs):
         return self._fetch("get", endpoint, format_params, **kwargs)
 
@@ -0,0 +1,86 @@
+import threading
+
+import singer
+
+from .config import get_int
+
+LOGGER = singer.get_logger()
+
+# Pardot allows five concurrent API requests per business unit by default.
+DEFAULT_MAX_CONCURRENT_REQUESTS = 5
+
+
+class ConcurrencyLimiter:
+    """AIMD governor for the number of Pardot requests in flight.
+
+    Every request holds a slot while it is on the wire. The limit starts low
+    and grows by one slot after a full window of successful requests; when
+    Pardot answers with error code 66 (concurrent request limit exceeded) the
+    limit is halved and the level that failed becomes a ceiling the limit
+    never grows back to for the rest of the run.
+    """
+
+    def __init__(self, initial_limit=1, max_limit=DEFAULT_MAX_CONCURRENT_REQUESTS):
+        self.max_limit = max(1, max_limit)
+        self.limit = min(max(1, initial_limit), self.max_limit)
+        self.ceiling = self.max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            initial_limit=get_int(config, "initial_concurrent_requests", 1),
+            max_limit=get_int(
+                config, "max_concurrent_requests", DEFAULT_MAX_CONCURRENT_REQUESTS
+            ),
+        )
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        """Take a slot if one is free, without waiting."""
+        with self._condition:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def on_success(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.ceiling:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    def on_limit_exceeded(self):
+        with self._condition:
+            failed_limit = self.limit
+            self.ceiling = max(1, min(self.ceiling, failed_limit - 1))
+            self.limit = max(1, min(failed_limit // 2, self.ceiling))
+            self._successes = 0
+        LOGGER.warning(
+            "Pardot concurrent request limit hit at %s in-flight requests, "
+            "reducing limit to %s (ceiling %s).",
+            failed_limit,
+            self.limit,
+            self.ceiling,
+        )
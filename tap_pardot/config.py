@@ -0,0 +1,38 @@
+"""Helpers for reading optional tuning values out of the tap config.
+
+Config files written by hand carry native JSON types, but configs passed
+through orchestration layers often arrive with every value as a string, so
+these helpers accept both.
+"""
+
+
+def get_int(config, key, default):
+    value = config.get(key)
+    if value in (None, ""):
+        return default
+    return int(value)
+
+
+def get_float(config, key, default):
+    value = config.get(key)
+    if value in (None, ""):
+        return default
+    return float(value)
+
+
+def get_bool(config, key, default):
+    value = config.get(key)
+    if value in (None, ""):
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes", "on")
+    return bool(value)
+
+
+def get_list(config, key, default=None):
+    value = config.get(key)
+    if value in (None, ""):
+        return list(default or [])
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return list(value)
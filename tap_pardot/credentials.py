@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Keep a little headroom so a token isn't used right as it expires.
+EXPIRY_MARGIN_SECONDS = 60
+
+
+def _identity(config):
+    """Fingerprint of the credentials a cache file belongs to."""
+    fields = (
+        "client_id",
+        "pardot_business_unit_id",
+        "refresh_token",
+        "email",
+        "user_key",
+        "pardot_api_url",
+    )
+    material = json.dumps([config.get(field) for field in fields])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class CredentialCache:
+    """Persists the access token, api_key and detected API version between
+    runs so a tap started every few minutes can skip the auth round-trip and
+    the version 4 to 3 downgrade.
+
+    The file is tied to a fingerprint of the configured credentials, so
+    changing them invalidates whatever was cached before.
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.identity = _identity(config)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        path = config.get("credentials_cache_path")
+        if not path:
+            return None
+        return cls(path, config)
+
+    def load(self):
+        try:
+            with open(self.path) as cache_file:
+                cached = json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            LOGGER.warning("Ignoring unreadable credentials cache %s", self.path)
+            return {}
+
+        if cached.get("identity") != self.identity:
+            return {}
+        return cached
+
+    def save(self, **values):
+        with self._lock:
+            cached = self.load()
+            cached.update(values)
+            cached["identity"] = self.identity
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            # mkstemp creates the file readable by its owner only, which is
+            # what we want for tokens.
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as cache_file:
+                json.dump(cached, cache_file)
+            os.replace(tmp_path, self.path)
+
+
+def is_fresh(expires_at, margin=EXPIRY_MARGIN_SECONDS):
+    return expires_at is not None and time.time() + margin < expires_at
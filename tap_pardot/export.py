@@ -0,0 +1,148 @@
+"""Backfills through Pardot's v5 bulk export API.
+
+An export job runs one of the object's procedures, such as
+filter_by_created_at, over a date range of at most a year. Pardot builds the
+result in the background and then serves it as one or more CSV files, so a
+large history costs a handful of calls instead of one per 200 records.
+"""
+import csv
+import datetime
+import io
+import time
+
+import singer
+
+from .v5 import from_v5_value, to_snake
+
+LOGGER = singer.get_logger()
+
+EXPORT_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+
+DEFAULT_EXPORT_WINDOW_DAYS = 90
+# Shorter backfills page through the query endpoints as usual.
+DEFAULT_EXPORT_MIN_DAYS = 30
+DEFAULT_EXPORT_POLL_SECONDS = 15
+DEFAULT_EXPORT_TIMEOUT_SECONDS = 6 * 3600
+
+EXPORT_COMPLETE = "complete"
+EXPORT_FAILED = "failed"
+
+
+class ExportFailedError(Exception):
+    pass
+
+
+def to_utc(value):
+    """value as an aware UTC datetime; naive values are taken as UTC."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+def export_windows(start, end, window_days):
+    """Split [start, end) into consecutive (dateTimeStart, dateTimeEnd) pairs
+    of at most window_days, as UTC datetime strings an export accepts."""
+    step = datetime.timedelta(days=window_days)
+    windows = []
+    window_start = to_utc(start)
+    end = to_utc(end)
+    while window_start < end:
+        window_end = min(window_start + step, end)
+        windows.append((
+            window_start.strftime(EXPORT_DATETIME_FORMAT),
+            window_end.strftime(EXPORT_DATETIME_FORMAT),
+        ))
+        window_start = window_end
+    return windows
+
+
+def _export_value(value, property_schema):
+    if value == "":
+        return None
+    types = property_schema.get("type") or []
+    if not isinstance(types, list):
+        types = [types]
+    try:
+        if "integer" in types:
+            return int(value)
+        if "number" in types:
+            return float(value)
+    except ValueError:
+        # Left to the Transformer, which reports it against the schema.
+        return value
+    if "boolean" in types:
+        return value.lower() in ("true", "1")
+    return from_v5_value(value)
+
+
+def from_export_row(row, schema, schema_names=None):
+    """A CSV row of an export as a record of the same object's bulk query.
+
+    Columns are named as in schema_names, a map from v5 to schema names, or
+    converted to snake_case. CSV carries every value as text, so values are
+    converted to the types the stream's schema gives them. Empty cells
+    become None.
+    """
+    properties = (schema or {}).get("properties", {})
+    schema_names = schema_names or {}
+    record = {}
+    for name, value in row.items():
+        name = schema_names.get(name) or to_snake(name)
+        record[name] = _export_value(value, properties.get(name, {}))
+    return record
+
+
+def wait_for_export(client, job, poll_seconds, timeout_seconds):
+    """Poll job until Pardot has built its result files and return it."""
+    deadline = time.monotonic() + timeout_seconds
+    while job["state"].lower() not in (EXPORT_COMPLETE, EXPORT_FAILED):
+        if time.monotonic() >= deadline:
+            raise ExportFailedError(
+                "Export {} did not finish within {} seconds.".format(job["id"], timeout_seconds)
+            )
+        LOGGER.info("Export %s is %s, checking again in %s seconds.", job["id"], job["state"], poll_seconds)
+        time.sleep(poll_seconds)
+        job = client.get_export(job["id"])
+
+    if job["state"].lower() == EXPORT_FAILED:
+        raise ExportFailedError("Export {} failed: {}".format(job["id"], job))
+    return job
+
+
+def _result_rows(response):
+    """Rows of one CSV result file, parsed as the body streams in."""
+    with response:
+        response.raw.decode_content = True
+        # Otherwise urllib3 closes the body at EOF, before the text wrapper
+        # is done with it.
+        response.raw.auto_close = False
+        text = io.TextIOWrapper(response.raw, encoding="utf-8-sig", newline="")
+        yield from csv.DictReader(text)
+
+
+def export_records(client, object_name, procedure, window, field_map, schema,
+                   poll_seconds=DEFAULT_EXPORT_POLL_SECONDS,
+                   timeout_seconds=DEFAULT_EXPORT_TIMEOUT_SECONDS):
+    """Records of one export of object_name over window, with the fields in
+    field_map, a v5_field_map.
+
+    The job is created and waited on when the first record is asked for,
+    and result files are downloaded one at a time while their rows are
+    consumed, so memory use doesn't grow with the size of the export.
+    """
+    date_time_start, date_time_end = window
+    job = client.create_export({
+        "object": object_name,
+        "procedure": {
+            "name": procedure,
+            "arguments": {"dateTimeStart": date_time_start, "dateTimeEnd": date_time_end},
+        },
+        "fields": list(field_map.values()),
+    })
+    LOGGER.info("Created export %s of %s from %s to %s.", job["id"], object_name, date_time_start, date_time_end)
+    job = wait_for_export(client, job, poll_seconds, timeout_seconds)
+
+    schema_names = {v5_name: name for name, v5_name in field_map.items()}
+    for result_ref in job.get("resultRefs") or []:
+        for row in _result_rows(client.open_export_result(result_ref)):
+            yield from_export_row(row, schema, schema_names)
@@ -0,0 +1,81 @@
+import math
+
+import singer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# orjson is a C extension pylint can't look into.
+# pylint: disable=no-member
+
+LOGGER = singer.get_logger()
+
+AUTO = "auto"
+ORJSON = "orjson"
+STDLIB = "json"
+
+
+class JsonCodec:
+    """Decodes Pardot pages and encodes Singer messages, with orjson when it
+    is installed and the same stdlib/simplejson path as before otherwise.
+
+    orjson output is compact and kept only when it is plain ASCII; anything
+    orjson can't represent the way singer does (non-ASCII text, which singer
+    escapes, Decimals, integers over 64 bits, invalid JSON from the API) goes
+    through the standard path instead, so targets see the same values and
+    errors whichever backend is in use. That includes NaN and infinity,
+    which orjson writes as null where singer refuses the record.
+    """
+
+    def __init__(self, backend=AUTO):
+        if backend not in (AUTO, ORJSON, STDLIB):
+            raise ValueError(
+                "json_backend must be one of '{}', '{}' or '{}', got {!r}".format(
+                    AUTO, ORJSON, STDLIB, backend
+                )
+            )
+        if backend == ORJSON and orjson is None:
+            LOGGER.warning("json_backend is orjson but it isn't installed, using json.")
+            backend = STDLIB
+        if backend == AUTO:
+            backend = ORJSON if orjson is not None else STDLIB
+        self.backend = backend
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("json_backend") or AUTO)
+
+    def decode_response(self, response):
+        if self.backend == ORJSON:
+            try:
+                return orjson.loads(response.content)
+            except (orjson.JSONDecodeError, TypeError):
+                pass
+        return response.json()
+
+    def encode_message(self, message):
+        if self.backend == ORJSON:
+            try:
+                encoded = orjson.dumps(message.asdict())
+            except TypeError:
+                pass
+            else:
+                # orjson writes non-finite floats as null, so only output
+                # with a null in it can be hiding one.
+                if encoded.isascii() and not (
+                    b"null" in encoded and _has_non_finite(message.asdict())
+                ):
+                    return encoded.decode("ascii")
+        return singer.format_message(message)
+
+
+def _has_non_finite(value):
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(item) for item in value)
+    return False
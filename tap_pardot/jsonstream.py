@@ -0,0 +1,190 @@
+"""Incremental parsing of Pardot bulk pages.
+
+A bulk page is one JSON object with the records in an array under
+result.<data_key>. Decoding it in one go keeps the response body, its text
+and every record of the page in memory at once. StreamedPage instead reads
+the body chunk by chunk and decodes one record at a time, so only the record
+being emitted and the unread rest of the current chunk are held.
+"""
+import codecs
+import json
+
+# Bytes read from the response at a time.
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+_HEADER_DONE = object()
+
+
+class _Scanner:
+    """Reads JSON tokens and values from an iterator of byte chunks,
+    keeping only the part of the text that hasn't been read yet."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._text = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Append the next chunk to the unread text; False at the end."""
+        while not self._eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                text = self._utf8.decode(b"", final=True)
+            else:
+                text = self._utf8.decode(chunk)
+            if text:
+                self._text = self._text[self._pos:] + text
+                self._pos = 0
+                return True
+        return False
+
+    def error(self, message):
+        return json.JSONDecodeError(message, self._text, self._pos)
+
+    def peek(self):
+        """The next character that isn't whitespace, or "" at the end."""
+        while True:
+            while self._pos < len(self._text) and self._text[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, allowed):
+        char = self.peek()
+        if not char or char not in allowed:
+            raise self.error("Expecting one of {!r}".format(allowed))
+        self._pos += 1
+        return char
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number running up to the end of the text may carry on in
+            # the next chunk.
+            if end == len(self._text) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def _members(scanner):
+    """Keys of the object whose "{" was just read. The caller reads each
+    member's value before asking for the next key."""
+    if scanner.peek() == "}":
+        scanner.expect("}")
+        return
+    while True:
+        key = scanner.value()
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting a property name", str(key), 0)
+        scanner.expect(":")
+        yield key
+        if scanner.expect(",}") == "}":
+            return
+
+
+def _records(scanner):
+    """Records of the value under result.<data_key>: an array of them, or
+    a single object when Pardot returns just one."""
+    if scanner.peek() != "[":
+        value = scanner.value()
+        if isinstance(value, dict):
+            yield value
+        return
+    scanner.expect("[")
+    if scanner.peek() == "]":
+        scanner.expect("]")
+        return
+    while True:
+        yield scanner.value()
+        if scanner.expect(",]") == "]":
+            return
+
+
+def _parse(scanner, data, data_key):
+    """Decode a page into data, except for its records, which are yielded
+    one by one once everything before them is in data."""
+    header_done = False
+    scanner.expect("{")
+    for key in _members(scanner):
+        if key != "result" or scanner.peek() != "{":
+            data[key] = scanner.value()
+            continue
+        scanner.expect("{")
+        result = data[key] = {}
+        for result_key in _members(scanner):
+            if result_key == data_key and not header_done:
+                header_done = True
+                yield _HEADER_DONE
+                yield from _records(scanner)
+            else:
+                result[result_key] = scanner.value()
+    if scanner.peek():
+        raise scanner.error("Extra data")
+    if not header_done:
+        yield _HEADER_DONE
+
+
+class StreamedPage:
+    """One bulk page with its records parsed while they are read.
+
+    data is the page without its records: "@attributes", "err" and
+    "result" with total_results. Members that come before the records, as
+    all of these do in Pardot's responses, are there as soon as the page is
+    opened; any that follow are added once records() has been exhausted.
+    """
+
+    def __init__(self, data, records, close=None):
+        self.data = data
+        self._records = records
+        self._close = close
+
+    @classmethod
+    def open(cls, chunks, data_key, close=None):
+        """Parse a page from byte chunks up to its first record."""
+        data = {}
+        records = _parse(_Scanner(chunks), data, data_key)
+        try:
+            next(records)
+        except Exception:
+            if close is not None:
+                close()
+            raise
+        return cls(data, records, close)
+
+    @classmethod
+    def from_data(cls, data, data_key):
+        """A page that was already decoded, like one replayed from the cache."""
+        result = data.get("result")
+        if not isinstance(result, dict):
+            return cls(data, iter([]))
+        records = result.get(data_key) or []
+        if isinstance(records, dict):
+            records = [records]
+        data = dict(data, result={key: value for key, value in result.items() if key != data_key})
+        return cls(data, iter(records))
+
+    def records(self):
+        try:
+            yield from self._records
+        finally:
+            self.close()
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
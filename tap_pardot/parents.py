@@ -0,0 +1,86 @@
+import threading
+
+import singer
+
+from .config import get_int
+
+LOGGER = singer.get_logger()
+
+DEFAULT_PARENT_CACHE_RECORDS = 500000
+
+
+class ParentScan:
+    """Replication key and id of every record one parent stream emitted in
+    this run, in the order it emitted them.
+
+    start is the bookmark the parent synced from. The scan is only usable
+    once it has finished without being cut short; one that failed, was
+    deferred or outgrew max_records keeps no keys.
+    """
+
+    def __init__(self, max_records):
+        self.max_records = max_records
+        self.start = None
+        self.keys = []
+        self.complete = False
+        self._done = threading.Event()
+
+    def add(self, replication_value, record_id):
+        if self.keys is None:
+            return
+        if len(self.keys) >= self.max_records:
+            self.keys = None
+            return
+        self.keys.append((replication_value, record_id))
+
+    def finish(self, complete):
+        self.complete = complete and self.keys is not None
+        if not self.complete:
+            self.keys = None
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+
+
+class ParentKeyCache:
+    """Lets child streams reuse the ids their parent stream emitted earlier
+    in the same run instead of paging through the parent again.
+
+    sync() expects a scan for every parent that is selected ahead of one of
+    its children and syncs from a bookmark that covers the child's. The
+    parent records into it while it syncs, and a child asking for the keys
+    waits for that scan to finish. A child with no scan expected for its
+    parent gets None right away and scans the parent itself.
+    """
+
+    def __init__(self, max_records=DEFAULT_PARENT_CACHE_RECORDS):
+        self.max_records = max_records
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(get_int(config, "parent_cache_records", DEFAULT_PARENT_CACHE_RECORDS))
+
+    def expect(self, stream_name):
+        with self._lock:
+            self._scans.setdefault(stream_name, ParentScan(self.max_records))
+
+    def scan(self, stream_name):
+        """The scan the parent should record into, or None if no child needs it."""
+        with self._lock:
+            return self._scans.get(stream_name)
+
+    def keys_since(self, stream_name, start):
+        """(replication value, id) pairs past start, or None if the parent's
+        scan in this run doesn't cover everything since start."""
+        scan = self.scan(stream_name)
+        if scan is None:
+            return None
+        scan.wait()
+        if not scan.complete or scan.start is None or scan.start > start:
+            return None
+        keys = [key for key in scan.keys if key[0] > start]
+        LOGGER.info("Reusing %d %s ids synced earlier in this run.", len(keys), stream_name)
+        return keys
@@ -0,0 +1,151 @@
+import datetime
+import heapq
+import itertools
+
+PARDOT_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DEFAULT_PARTITION_WORKERS = 1
+DEFAULT_PARTITION_WINDOW_DAYS = 30
+DEFAULT_PARTITION_PREFETCH_PAGES = 50
+
+DEFAULT_BATCH_WORKERS = 1
+# Characters of comma-joined ids per request, well under the URL length
+# servers and proxies commonly accept.
+DEFAULT_BATCH_MAX_LENGTH = 4000
+
+
+def time_windows(start, end, window_days):
+    """Split [start, end) into (created_after, created_before) pairs.
+
+    start and end are datetimes; the pairs are Pardot datetime strings. The
+    first window starts at start itself and the last one is left open (None)
+    so records created while the sync runs are still picked up. Every other
+    window starts a second early, since created_after is exclusive, so a
+    record stamped exactly on a boundary falls into a window either way.
+    """
+    step = datetime.timedelta(days=window_days)
+    boundaries = [start]
+    while boundaries[-1] + step < end:
+        boundaries.append(boundaries[-1] + step)
+
+    windows = []
+    for index, window_start in enumerate(boundaries):
+        if index:
+            window_start -= datetime.timedelta(seconds=1)
+        window_end = boundaries[index + 1] if index + 1 < len(boundaries) else None
+        windows.append((
+            window_start.strftime(PARDOT_DATETIME_FORMAT),
+            window_end.strftime(PARDOT_DATETIME_FORMAT) if window_end else None,
+        ))
+    return windows
+
+
+def id_shards(low, high, count):
+    """Split ids in (low, high] into count (id_greater_than, id_less_than)
+    ranges. The last one is left open (None) so records created while the
+    sync runs are still picked up."""
+    step = max(1, -(-(high - low) // count))
+    starts = list(range(low, high, step)) or [low]
+    return [
+        (start, starts[index + 1] + 1 if index + 1 < len(starts) else None)
+        for index, start in enumerate(starts)
+    ]
+
+
+class MergeOrderError(Exception):
+    """Raised by merge_ascending when a source starts below a key it has
+    already yielded."""
+
+
+def merge_ascending(sources, key, max_active):
+    """Merge sorted iterators into one ascending sequence.
+
+    sources yields zero-argument callables that open one iterator each;
+    opening one should already start fetching in the background. At most
+    max_active are open at a time and the next one is opened as soon as one
+    runs out, so sources must be ordered by where their keys start. A
+    source opened late whose first key is below one already yielded raises
+    MergeOrderError instead of being merged out of order. An item with the
+    same key as the one just yielded, like a record returned by two adjacent
+    windows, is dropped.
+    """
+    sources = iter(sources)
+    counter = itertools.count()
+    heap = []
+
+    def push_head(iterator):
+        for item in iterator:
+            heapq.heappush(heap, (key(item), next(counter), item, iterator))
+            return True
+        return False
+
+    def open_next():
+        # Keep going past sources that turn out to be empty.
+        for source in sources:
+            if push_head(source()):
+                return
+
+    try:
+        for iterator in [source() for source in itertools.islice(sources, max_active)]:
+            if not push_head(iterator):
+                open_next()
+
+        last_key = None
+        while heap:
+            item_key, _, item, iterator = heapq.heappop(heap)
+            if item_key != last_key:
+                last_key = item_key
+                yield item
+            if not push_head(iterator):
+                open_next()
+            if heap and heap[0][0] < last_key:
+                raise MergeOrderError(
+                    "a source starts at {!r}, below {!r} already yielded".format(heap[0][0], last_key)
+                )
+    finally:
+        for entry in heap:
+            close = getattr(entry[3], "close", None)
+            if close is not None:
+                close()
+
+
+class IdBatcher:
+    """Cuts parent ids into batches sized so each child request comes back
+    in about one page of target records.
+
+    Child records per parent id are estimated from the batches observed so
+    far; before anything has been observed every id counts as one record.
+    A batch's ids never join to more than max_length characters, however
+    few records they are expected to have.
+    """
+
+    def __init__(self, target, max_length=DEFAULT_BATCH_MAX_LENGTH):
+        self.target = target
+        self.max_length = max_length
+        self._parents = 0
+        self._children = 0
+
+    def observe(self, parents, children):
+        self._parents += parents
+        self._children += children
+
+    def batch_size(self):
+        # Smoothed so parents without any children don't divide by zero.
+        per_parent = (self._children + 1) / (self._parents + 1)
+        return max(1, int(self.target / per_parent))
+
+    def batches(self, ids):
+        size = self.batch_size()
+        batches = []
+        batch, length = [], 0
+        for _id in ids:
+            id_length = len(str(_id)) + (1 if batch else 0)
+            if batch and (len(batch) >= size or length + id_length > self.max_length):
+                batches.append(batch)
+                batch, length = [], 0
+                id_length = len(str(_id))
+            batch.append(_id)
+            length += id_length
+        if batch:
+            batches.append(batch)
+        return batches
@@ -0,0 +1,82 @@
+import queue
+import threading
+
+DEFAULT_PREFETCH_PAGES = 1
+
+# Producer checks for close() this often while the queue is full.
+_PUT_INTERVAL_SECONDS = 0.1
+
+_DONE = object()
+
+
+class PagePipeline:
+    """Requests pages on a background thread ahead of the stream consuming them.
+
+    The producer starts from params, fetches a page, queues it and works out
+    the next page's params from the page it just got, so page N+1 is in
+    flight while page N is transformed and written. At most depth pages wait
+    in the queue; the producer blocks once it is full.
+
+    Prefetched pages are speculative: take() only hands a page over when it
+    was requested with exactly the params the stream would use itself, and
+    otherwise closes the pipeline so the stream carries on fetching its own
+    pages. An error fetching a page is raised from take() for that page, so
+    a page that is never consumed never fails the stream.
+    """
+
+    def __init__(self, fetch, params, next_params, depth=DEFAULT_PREFETCH_PAGES):
+        self._fetch = fetch
+        self._next_params = next_params
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._produce, args=(params,), name="page-prefetch", daemon=True
+        )
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=_PUT_INTERVAL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, params):
+        while params is not None:
+            try:
+                page = self._fetch(params)
+            except Exception as ex:  # pylint: disable=broad-except
+                self._put((params, None, ex))
+                return
+            if not self._put((params, page, None)):
+                return
+            params = self._next_params(params, page)
+        self._put(_DONE)
+
+    def take(self, params):
+        """Return the prefetched page for params, or None if there isn't one.
+
+        After None the pipeline is closed and the caller fetches pages itself.
+        """
+        if self._closed.is_set():
+            return None
+        item = self._queue.get()
+        if item is _DONE or item[0] != params:
+            self.close()
+            return None
+        _, page, error = item
+        if error is not None:
+            self.close()
+            raise error
+        return page
+
+    def close(self):
+        self._closed.set()
+        # Unblock a producer waiting on a full queue.
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
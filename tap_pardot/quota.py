@@ -0,0 +1,150 @@
+import datetime
+import threading
+import time
+
+import singer
+
+from .config import get_float, get_int, get_list
+
+LOGGER = singer.get_logger()
+
+STATE_KEY = "api_quota"
+
+
+class QuotaExhaustedError(Exception):
+    """Raised to stop a stream when the daily API call budget won't cover it."""
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class QuotaBudgeter:
+    """Tracks API calls per stream against a daily budget shared with other
+    integrations on the same Pardot account.
+
+    Counts are kept per UTC day in the tap state so they carry over between
+    runs. Once usage passes the pacing threshold, calls are spread over the
+    rest of the day and low-priority streams are deferred to a later run;
+    once the budget is spent, every stream is deferred.
+    """
+
+    def __init__(self, daily_budget=None, low_priority_streams=None,
+                 pacing_threshold=0.8, max_pace_seconds=30,
+                 now=_utc_now, sleep=time.sleep):
+        self.daily_budget = daily_budget
+        self.low_priority_streams = set(low_priority_streams or [])
+        self.pacing_threshold = pacing_threshold
+        self.max_pace_seconds = max_pace_seconds
+        self.endpoint_streams = {}
+        self._now = now
+        self._sleep = sleep
+        self._state = None
+        self._date = self._today()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            daily_budget=get_int(config, "daily_api_call_budget", None),
+            low_priority_streams=get_list(config, "low_priority_streams"),
+            pacing_threshold=get_float(config, "quota_pacing_threshold", 0.8),
+            max_pace_seconds=get_float(config, "quota_max_pace_seconds", 30),
+        )
+
+    def _today(self):
+        return self._now().date().isoformat()
+
+    @property
+    def total(self):
+        return sum(self._counts.values())
+
+    def bind_state(self, state, endpoint_streams=None):
+        """Load today's counts from state and keep them updated there."""
+        self.endpoint_streams = dict(endpoint_streams or {})
+        saved = state.get(STATE_KEY) or {}
+        with self._lock:
+            self._state = state
+            self._date = self._today()
+            if saved.get("date") == self._date:
+                self._counts = dict(saved.get("streams") or {})
+            else:
+                self._counts = {}
+            self._persist()
+
+    def _persist(self):
+        if self._state is None:
+            return
+        # Replace the whole value so a concurrent write_state never sees the
+        # nested dict change size while it is being serialized.
+        self._state[STATE_KEY] = {
+            "date": self._date,
+            "total": self.total,
+            "streams": dict(self._counts),
+        }
+
+    def _roll_over(self):
+        today = self._today()
+        if today != self._date:
+            self._date = today
+            self._counts = {}
+
+    def _seconds_left_today(self):
+        now = self._now()
+        tomorrow = datetime.datetime.combine(
+            now.date() + datetime.timedelta(days=1), datetime.time(), now.tzinfo
+        )
+        return max((tomorrow - now).total_seconds(), 0)
+
+    def before_call(self, endpoint):
+        """Pace or refuse a call to endpoint based on today's usage."""
+        delay = self.pace(endpoint)
+        if delay > 0:
+            self._sleep(delay)
+
+    def pace(self, endpoint):
+        """Seconds to wait before a call to endpoint based on today's usage.
+        Raises QuotaExhaustedError if it shouldn't be made at all."""
+        if not self.daily_budget:
+            return 0
+
+        stream = self.endpoint_streams.get(endpoint, endpoint)
+        with self._lock:
+            self._roll_over()
+            used = self.total
+
+        if used >= self.daily_budget:
+            raise QuotaExhaustedError(
+                "Daily API call budget of {} is spent; deferring {}.".format(
+                    self.daily_budget, stream
+                )
+            )
+
+        if used < self.daily_budget * self.pacing_threshold:
+            return 0
+
+        if stream in self.low_priority_streams:
+            raise QuotaExhaustedError(
+                "{} of {} daily API calls used; deferring low-priority stream {}.".format(
+                    used, self.daily_budget, stream
+                )
+            )
+
+        delay = min(
+            self._seconds_left_today() / (self.daily_budget - used),
+            self.max_pace_seconds,
+        )
+        if delay > 0:
+            LOGGER.info(
+                "%s of %s daily API calls used, pacing %s by %.2f seconds.",
+                used, self.daily_budget, stream, delay,
+            )
+        return delay
+
+    def record_call(self, endpoint):
+        stream = self.endpoint_streams.get(endpoint, endpoint)
+        with self._lock:
+            self._roll_over()
+            self._counts[stream] = self._counts.get(stream, 0) + 1
+            self._persist()
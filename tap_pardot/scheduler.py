@@ -0,0 +1,137 @@
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import singer
+
+from .writer import MessageWriter
+
+LOGGER = singer.get_logger()
+
+
+class StreamCancelled(Exception):
+    """Raised inside a stream's worker once another stream has failed."""
+
+
+class StreamBuffer(MessageWriter):
+    """Output buffer for one stream running under the StreamScheduler.
+
+    Messages are rendered on the stream's own thread and handed to the
+    shared writer in batches. STATE is never written as given: the stream's
+    bookmarks are merged into the scheduler's state first, and that state is
+    written right after the records it covers.
+    """
+
+    def __init__(self, scheduler, stream_id, max_bytes, max_seconds, codec):
+        super().__init__(max_bytes=max_bytes, max_seconds=max_seconds, codec=codec)
+        self.scheduler = scheduler
+        self.stream_id = stream_id
+
+    def write_record(self, stream_name, record, time_extracted=None):
+        if self.scheduler.cancelled:
+            raise StreamCancelled()
+        super().write_record(stream_name, record, time_extracted)
+
+    def write_state(self, value):
+        with self._lock:
+            lines, self._buffer, self._size = self._buffer, [], 0
+            self.scheduler.commit(self.stream_id, lines, value)
+            self._last_flush = self._clock()
+
+    def _flush(self):
+        if self._buffer:
+            self.scheduler.commit(self.stream_id, self._buffer)
+            self._buffer = []
+            self._size = 0
+        self._last_flush = self._clock()
+
+
+class StreamScheduler:
+    """Runs selected streams on a pool of worker threads.
+
+    Every stream syncs against its own copy of the state and writes into its
+    own StreamBuffer, so a slow backfill doesn't hold up the other streams.
+    Batches from different streams are interleaved on stdout, but each
+    stream's records always come out before the STATE that covers them, and
+    that STATE only carries bookmarks other streams have already written
+    records for. Requests from all streams share the client's concurrency
+    limiter, which is the global request budget.
+
+    currently_syncing names the first stream, in catalog order, that hasn't
+    finished yet, so an interrupted run resumes from there like a sequential
+    one would.
+    """
+
+    def __init__(self, writer, state, max_workers):
+        self.writer = writer
+        self.state = state
+        self.max_workers = max_workers
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._unfinished = []
+
+    def stream_state(self):
+        with self._lock:
+            return copy.deepcopy(self.state)
+
+    def commit(self, stream_id, lines, stream_state=None):
+        with self._lock:
+            if stream_state is not None:
+                self._merge_bookmarks(stream_id, stream_state)
+                lines = lines + [self.writer.render(singer.StateMessage(value=self.state))]
+            self.writer.write_lines(lines, force_flush=stream_state is not None)
+
+    def _merge_bookmarks(self, stream_id, stream_state):
+        bookmarks = self.state.setdefault("bookmarks", {})
+        stream_bookmarks = stream_state.get("bookmarks", {}).get(stream_id)
+        if stream_bookmarks is None:
+            bookmarks.pop(stream_id, None)
+        else:
+            bookmarks[stream_id] = copy.deepcopy(stream_bookmarks)
+
+    def _set_currently_syncing(self):
+        singer.set_currently_syncing(
+            self.state, self._unfinished[0] if self._unfinished else None
+        )
+
+    def _run_stream(self, stream, sync_stream):
+        stream_id = stream.tap_stream_id
+        if self.cancelled:
+            return
+        output = StreamBuffer(
+            self, stream_id, self.writer.max_bytes, self.writer.max_seconds, self.writer.codec
+        )
+        try:
+            with output:
+                sync_stream(stream, self.stream_state(), output)
+        except StreamCancelled:
+            LOGGER.info("Stopped stream %s after another stream failed.", stream_id)
+            return
+        except Exception:
+            self.cancelled = True
+            raise
+
+        with self._lock:
+            self._unfinished.remove(stream_id)
+            self._set_currently_syncing()
+
+    def run(self, streams, sync_stream):
+        """Call sync_stream(stream, state, output) for every stream, at most
+        max_workers at a time, and raise the first error any of them hit."""
+        streams = list(streams)
+        with self._lock:
+            self._unfinished = [stream.tap_stream_id for stream in streams]
+            self._set_currently_syncing()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._run_stream, stream, sync_stream)
+                for stream in streams
+            ]
+            errors = [future.exception() for future in futures]
+
+        for error in errors:
+            if error is not None:
+                raise error
+
+        self.writer.write_state(self.state)
@@ -1,10 +1,44 @@
+import copy
+import datetime
 import inspect
+from concurrent.futures import ThreadPoolExecutor
 
 import singer
 from dateutil.parser import parse as parse_datetime
 
+from .checkpoint import Checkpointer
+from .config import get_bool, get_float, get_int
+from .export import (
+    DEFAULT_EXPORT_MIN_DAYS,
+    DEFAULT_EXPORT_POLL_SECONDS,
+    DEFAULT_EXPORT_TIMEOUT_SECONDS,
+    DEFAULT_EXPORT_WINDOW_DAYS,
+    export_records,
+    export_windows,
+    to_utc,
+)
+from .partition import (
+    DEFAULT_BATCH_MAX_LENGTH,
+    DEFAULT_BATCH_WORKERS,
+    DEFAULT_PARTITION_PREFETCH_PAGES,
+    DEFAULT_PARTITION_WINDOW_DAYS,
+    DEFAULT_PARTITION_WORKERS,
+    IdBatcher,
+    MergeOrderError,
+    id_shards,
+    merge_ascending,
+    time_windows,
+)
+from .prefetch import DEFAULT_PREFETCH_PAGES, PagePipeline
+from .v5 import DEFAULT_V5_PAGE_SIZE, to_v5_datetime, v5_field_map, v5_pages
+
+LOGGER = singer.get_logger()
+
 PARDOT_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# Records per page of Pardot's bulk output.
+PAGE_SIZE = 200
+
 
 def _normalize_datetime(dt_str):
     """Normalize a datetime string to Pardot API format for consistent comparison.
@@ -18,6 +52,29 @@ def _normalize_datetime(dt_str):
     return dt_str
 
 
+def _window_params(params, created_after, created_before):
+    params = dict(params, created_after=created_after)
+    if created_before is not None:
+        params["created_before"] = created_before
+    return params
+
+
+def _shard_params(params, id_greater_than, id_less_than):
+    params = dict(params, id_greater_than=id_greater_than)
+    if id_less_than is not None:
+        params["id_less_than"] = id_less_than
+    return params
+
+
+class PageRequest:
+    """Yielded by sync_page, under sync_async only, for the page it needs
+    next. sync_async fetches it and resumes sync_page with the page in
+    _pending_page."""
+
+    def __init__(self, params):
+        self.params = params
+
+
 class Stream:
     stream_name = None
     data_key = None
@@ -27,17 +84,44 @@ class Stream:
     replication_method = None
     is_dynamic = False
 
+    # Request param that moves to the next page and the record field it is
+    # read from, for streams whose pages can be prefetched.
+    cursor_param = None
+    cursor_field = None
+
     client = None
     config = None
     state = None
 
+    # Object name under Pardot's v5 API, for streams that can sync from it.
+    v5_object = None
+    # Object and procedure of the v5 bulk export that can backfill the stream.
+    export_object = None
+    export_procedure = None
+
+    # ParentKeyCache shared by the streams of one run, if any.
+    parent_keys = None
+    # Top-level fields selected in the catalog, set by sync.
+    selected_fields = None
+    # Fields the stream reads from its records itself, kept by projection
+    # whether or not they are selected.
+    projection_fields = []
+    # JSON schema of the stream's records, set by sync.
+    schema = None
+
     _last_bookmark_value = None
+    _pending_page = None
+    _last_page = False
+    _awaits_pages = False
+    _projection = None
+    _v5_fields = None
 
     def __init__(self, client, config, state, emit=True):
         self.client = client
         self.state = state
         self.config = config
         self.emit = emit
+        self.checkpointer = Checkpointer.from_config(config, state, emit)
 
     def get_default_start(self):
         return _normalize_datetime(self.config["start_date"])
@@ -57,8 +141,7 @@ class Stream:
         singer.bookmarks.write_bookmark(
             self.state, self.stream_name, self.replication_keys[0], bookmark_value
         )
-        if self.emit:
-            singer.write_state(self.state)
+        self.checkpointer.mark()
 
     def pre_sync(self):
         """Function to run arbitrary code before a full sync starts."""
@@ -67,8 +150,80 @@ class Stream:
         """Function to run arbitrary code after a full sync completes."""
 
     def get_records(self):
-        data = self.client.get(self.endpoint, **self.get_params())
-
+        if self._pending_page is not None:
+            data, self._pending_page = self._pending_page, None
+        elif get_bool(self.config, "stream_pages", False):
+            return self._streamed_records(self.get_params())
+        else:
+            data = self._project_page(self.client.get(self.endpoint, **self.get_params()))
+
+        self._last_page = self._is_last_page(data)
+        return self._page_records(data)
+
+    def _next_records(self):
+        """get_records() for sync_page, which takes it with `yield from` so
+        that under sync_async a PageRequest can be yielded out for the page
+        first."""
+        if self._awaits_pages and self._pending_page is None:
+            yield PageRequest(self.get_params())
+        return self.get_records()
+
+    def _streamed_records(self, params):
+        """Records of one page, decoded from the response as they're read.
+
+        Whether the page is the last one is only known once it has been
+        read to the end, so _last_page is set after the last record.
+        """
+        self._last_page = False
+        page = self.client.get_streamed(self.endpoint, self.data_key, **params)
+        count = 0
+        for rec in page.records():
+            count += 1
+            yield self._project_record(rec)
+        self._last_page = self._is_last_count(page.data, count)
+
+    def _projected_fields(self):
+        """Selected fields plus the ones syncing reads itself, in catalog
+        order."""
+        fields = list(self.selected_fields or [])
+        needed = self.key_properties + self.replication_keys + [self.cursor_field]
+        for name in needed + self.projection_fields:
+            if name is not None and name not in fields:
+                fields.append(name)
+        return fields
+
+    def _v5_field_map(self):
+        """v5 names of the projected fields that v5 serves."""
+        if self._v5_fields is None:
+            self._v5_fields = v5_field_map(self.stream_name, self._projected_fields())
+        return self._v5_fields
+
+    def _project_record(self, record):
+        if self.selected_fields is None or not isinstance(record, dict):
+            return record
+        if self._projection is None:
+            self._projection = frozenset(self._projected_fields())
+        return {name: value for name, value in record.items() if name in self._projection}
+
+    def _project_page(self, data):
+        """Cut the records of a freshly decoded page down to the projected
+        fields, in place.
+
+        Pages are projected as they arrive, before anything else looks at
+        their records, so unselected fields are dropped once instead of being
+        carried through paging and filtered out again by the Transformer.
+        """
+        result = data.get("result") if isinstance(data, dict) else None
+        if self.selected_fields is None or not isinstance(result, dict):
+            return data
+        records = result.get(self.data_key)
+        if isinstance(records, list):
+            result[self.data_key] = [self._project_record(rec) for rec in records]
+        elif records:
+            result[self.data_key] = self._project_record(records)
+        return data
+
+    def _page_records(self, data):
         if data["result"] is None or data["result"].get("total_results") == 0:
             return []
 
@@ -77,6 +232,82 @@ class Stream:
             records = [records]
         return records
 
+    def _is_last_page(self, data, offset=0):
+        return self._is_last_count(data, len(self._page_records(data)), offset)
+
+    def _is_last_count(self, data, count, offset=0):
+        """Whether a page of count records with data's total_results is
+        known to be the last page of its query, so the request that would
+        only come back empty can be skipped.
+
+        total_results counts every record matching the query, so a page is
+        the last one once it reaches that count. Without total_results only
+        a page short of PAGE_SIZE counts as the last one; after a full page
+        the next one is still requested.
+        """
+        if not count:
+            return True
+
+        total_results = data["result"].get("total_results")
+        if total_results is not None:
+            try:
+                return offset + count >= int(total_results)
+            except (TypeError, ValueError):
+                pass
+        return count < PAGE_SIZE
+
+    def _next_page_params(self, params, data):
+        records = self._page_records(data)
+        if not records or self._is_last_page(data):
+            return None
+        return dict(params, **{self.cursor_param: records[-1][self.cursor_field]})
+
+    def _start_prefetch(self):
+        depth = get_int(self.config, "prefetch_pages", DEFAULT_PREFETCH_PAGES)
+        if self.cursor_param is None or depth < 1:
+            return None
+        if get_bool(self.config, "stream_pages", False):
+            # The next page's cursor is only known once a streamed page has
+            # been read to the end.
+            return None
+        return PagePipeline(
+            lambda params: self._project_page(self.client.get(self.endpoint, **params)),
+            self.get_params(),
+            self._next_page_params,
+            depth,
+        )
+
+    def _partition_source(self, params, depth, next_params=None):
+        """Opener for merge_ascending that pages through one partition of
+        the stream, described by params, on its own prefetch thread.
+        next_params gives the params of the page after one, by default
+        _next_page_params."""
+        next_params = next_params or self._next_page_params
+
+        def open_partition():
+            pipeline = PagePipeline(
+                lambda page_params: self._project_page(
+                    self.client.get(self.endpoint, **page_params)
+                ),
+                params,
+                next_params,
+                depth,
+            )
+            return self._partition_records(pipeline, params, next_params)
+
+        return open_partition
+
+    def _partition_records(self, pipeline, params, next_params):
+        try:
+            while params is not None:
+                page = pipeline.take(params)
+                if page is None:
+                    return
+                yield from self._page_records(page)
+                params = next_params(params, page)
+        finally:
+            pipeline.close()
+
     def check_order(self, current_bookmark_value):
         if self._last_bookmark_value is None:
             self._last_bookmark_value = current_bookmark_value
@@ -91,7 +322,8 @@ class Stream:
         self._last_bookmark_value = current_bookmark_value
 
     def sync_page(self):
-        for rec in self.get_records():
+        records = yield from self._next_records()
+        for rec in records:
             current_bookmark_value = rec[self.replication_keys[0]]
             self.check_order(current_bookmark_value)
             self.update_bookmark(current_bookmark_value)
@@ -102,14 +334,190 @@ class Stream:
 
         records_synced = 0
         last_records_synced = -1
+        self._last_page = False
 
-        while records_synced != last_records_synced:
-            last_records_synced = records_synced
-            for rec in self.sync_page():
-                records_synced += 1
+        pipeline = self._start_prefetch()
+        try:
+            while records_synced != last_records_synced and not self._last_page:
+                last_records_synced = records_synced
+                if pipeline is not None:
+                    # Falls back to fetching here if the prefetched page was
+                    # requested with a different cursor than the bookmarks give.
+                    self._pending_page = pipeline.take(self.get_params())
+                    if self._pending_page is None:
+                        pipeline = None
+                for rec in self.sync_page():
+                    records_synced += 1
+                    yield rec
+                    self.checkpointer.record_done()
+                self.checkpointer.page_done()
+        finally:
+            if pipeline is not None:
+                pipeline.close()
+
+        self.post_sync()
+        self.checkpointer.flush()
+
+    async def sync_async(self, async_client):
+        """Counterpart of sync() that awaits every page from an AsyncClient.
+
+        sync_page runs as it does under sync(), including the id paging of
+        ties, but yields a PageRequest whenever it needs a page, which is
+        fetched here while the event loop gets on with other streams.
+        Bookmarks move exactly as they do under sync(). Pages aren't
+        prefetched and partitions aren't split up: the other streams' pages
+        keep the connections busy instead.
+        """
+        self.pre_sync()
+
+        records_synced = 0
+        last_records_synced = -1
+        self._last_page = False
+        self._awaits_pages = True
+        try:
+            while records_synced != last_records_synced and not self._last_page:
+                last_records_synced = records_synced
+                for rec in self.sync_page():
+                    if isinstance(rec, PageRequest):
+                        self._pending_page = self._project_page(
+                            await async_client.get(self.endpoint, **rec.params)
+                        )
+                        continue
+                    records_synced += 1
+                    yield rec
+                    self.checkpointer.record_done()
+                self.checkpointer.page_done()
+        finally:
+            self._awaits_pages = False
+
+        self.post_sync()
+        self.checkpointer.flush()
+
+    def v5_params(self):
+        """Filters and order of a v5 query for everything past the bookmark."""
+        raise NotImplementedError("{} can't sync from the v5 API.".format(type(self).__name__))
+
+    def sync_v5_page(self, records):
+        for rec in records:
+            current_bookmark_value = rec[self.replication_keys[0]]
+            self.check_order(current_bookmark_value)
+            self.update_bookmark(current_bookmark_value)
+            yield rec
+
+    def sync_v5(self):
+        """Counterpart of sync() that reads the stream's v5 object.
+
+        The whole sync is one query paged by nextPageToken, so pages are
+        never requested twice and only the selected fields are transferred.
+        Bookmarks move record by record as they do on v3/v4, so an
+        interrupted sync resumes from them with a fresh query on either API.
+        """
+        self.pre_sync()
+
+        for page in v5_pages(
+            self.client,
+            self.v5_object,
+            self.v5_params(),
+            self._v5_field_map(),
+            get_int(self.config, "v5_page_size", DEFAULT_V5_PAGE_SIZE),
+        ):
+            for rec in self.sync_v5_page(page):
                 yield rec
+                self.checkpointer.record_done()
+            self.checkpointer.page_done()
 
+        self.finish_v5()
         self.post_sync()
+        self.checkpointer.flush()
+
+    def finish_v5(self):
+        """Function to run once a v5 query has been read to the end."""
+
+    def export_start(self):
+        """Where an export backfill of this stream starts, or None to page.
+
+        Only a stream without a bookmark, or one whose backfill an earlier
+        run left unfinished, is exported, and only if the range to cover is
+        at least export_min_days long.
+        """
+        export_through = singer.bookmarks.get_bookmark(
+            self.state, self.stream_name, "export_through"
+        )
+        if export_through is not None:
+            return parse_datetime(export_through)
+        if singer.bookmarks.get_bookmark(
+            self.state, self.stream_name, self.replication_keys[0]
+        ) is not None:
+            return None
+
+        start = to_utc(parse_datetime(self.config["start_date"]))
+        min_days = get_int(self.config, "export_min_days", DEFAULT_EXPORT_MIN_DAYS)
+        if datetime.datetime.now(datetime.timezone.utc) - start < datetime.timedelta(days=min_days):
+            return None
+        return start
+
+    def sync_export(self, incremental):
+        """Backfill the stream through v5 bulk exports, then carry on with
+        incremental, the sync() or sync_v5() generator of this stream.
+
+        The range from start_date to now is exported in windows of
+        export_window_days. Export rows come in no particular order, so the
+        bookmark only moves, to the newest value exported, once a whole
+        window has been emitted, and export_through records the end of that
+        window. An interrupted backfill resumes with the window it stopped
+        in; incremental starts from wherever the last window left the
+        bookmark.
+        """
+        start = self.export_start()
+        if start is not None:
+            yield from self._sync_exports(start)
+        yield from incremental
+
+    def _sync_exports(self, start):
+        replication_key = self.replication_keys[0]
+        windows = export_windows(
+            start,
+            datetime.datetime.now(datetime.timezone.utc),
+            get_int(self.config, "export_window_days", DEFAULT_EXPORT_WINDOW_DAYS),
+        )
+        for window in windows:
+            newest = None
+            for rec in export_records(
+                self.client,
+                self.export_object,
+                self.export_procedure,
+                window,
+                self._v5_field_map(),
+                self.schema,
+                get_float(self.config, "export_poll_seconds", DEFAULT_EXPORT_POLL_SECONDS),
+                get_float(self.config, "export_timeout_seconds", DEFAULT_EXPORT_TIMEOUT_SECONDS),
+            ):
+                value = rec.get(replication_key)
+                if value is not None and (newest is None or value > newest):
+                    newest = value
+                yield rec
+                self.checkpointer.record_done()
+            self._finish_export_window(window[1], newest)
+            self.checkpointer.page_done()
+
+        singer.bookmarks.clear_bookmark(self.state, self.stream_name, "export_through")
+        self.checkpointer.mark()
+
+    def _finish_export_window(self, window_end, newest):
+        bookmark = singer.bookmarks.get_bookmark(
+            self.state, self.stream_name, self.replication_keys[0]
+        )
+        if newest is None:
+            newest = bookmark if bookmark is not None else self.get_default_start()
+        elif bookmark is not None:
+            newest = max(newest, bookmark)
+        singer.bookmarks.write_bookmark(
+            self.state, self.stream_name, self.replication_keys[0], newest
+        )
+        singer.bookmarks.write_bookmark(
+            self.state, self.stream_name, "export_through", window_end
+        )
+        self.checkpointer.mark()
 
 
 class IdReplicationStream(Stream):
@@ -125,6 +533,9 @@ class IdReplicationStream(Stream):
     replication_keys = ["id"]
     replication_method = "INCREMENTAL"
 
+    cursor_param = "id_greater_than"
+    cursor_field = "id"
+
     def get_default_start(self):
         return 0
 
@@ -136,6 +547,81 @@ class IdReplicationStream(Stream):
             "sort_order": "ascending",
         }
 
+    def v5_params(self):
+        return {
+            "createdAtAfter": to_v5_datetime(self.config["start_date"]),
+            "idGreaterThan": self.get_bookmark(),
+            "orderBy": "id ASC",
+        }
+
+    def sync(self):
+        workers = get_int(self.config, "partition_workers", DEFAULT_PARTITION_WORKERS)
+        # Windows span everything since start_date, so once there is an id
+        # bookmark every one of them would be queried again for the few
+        # records past it. Only a backfill from scratch is partitioned.
+        if workers > 1 and not self.get_bookmark():
+            yield from self._sync_partitioned(workers)
+        else:
+            yield from super(IdReplicationStream, self).sync()
+
+    def _sync_partitioned(self, workers):
+        """Split the created_after range into windows of
+        partition_window_days, page through up to `workers` windows at once
+        and emit their records merged back into ascending id order.
+
+        Records only leave the merge once every open window has moved past
+        their id, so the id bookmark never gets ahead of a record that hasn't
+        been emitted and a resumed sync picks up where this one stopped.
+
+        This assumes ids rise with created_at, so a window opened later
+        starts past the ids already emitted. If one doesn't, the windows are
+        abandoned and the stream is paged serially from the first id again,
+        emitting some records twice rather than skipping any.
+        """
+        self.pre_sync()
+
+        params = self.get_params()
+        windows = time_windows(
+            parse_datetime(params["created_after"]).replace(tzinfo=None),
+            datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None),
+            get_int(self.config, "partition_window_days", DEFAULT_PARTITION_WINDOW_DAYS),
+        )
+        depth = get_int(
+            self.config, "partition_prefetch_pages", DEFAULT_PARTITION_PREFETCH_PAGES
+        )
+        records = merge_ascending(
+            (
+                self._partition_source(_window_params(params, after, before), depth)
+                for after, before in windows
+            ),
+            key=lambda rec: rec["id"],
+            max_active=workers,
+        )
+
+        records_synced = 0
+        try:
+            for rec in records:
+                self.check_order(rec["id"])
+                self.update_bookmark(rec["id"])
+                records_synced += 1
+                yield rec
+                self.checkpointer.record_done()
+                if records_synced % PAGE_SIZE == 0:
+                    self.checkpointer.page_done()
+        except MergeOrderError as ex:
+            LOGGER.warning(
+                "%s ids don't rise with created_at across windows (%s), "
+                "syncing serially from the first id.", self.stream_name, ex
+            )
+            self._last_bookmark_value = None
+            self.update_bookmark(self.get_default_start())
+            yield from super(IdReplicationStream, self).sync()
+            return
+        self.checkpointer.page_done()
+
+        self.post_sync()
+        self.checkpointer.flush()
+
 
 class UpdatedAtReplicationStream(Stream):
     """
@@ -151,16 +637,168 @@ class UpdatedAtReplicationStream(Stream):
     replication_keys = ["updated_at"]
     replication_method = "INCREMENTAL"
 
+    cursor_param = "updated_after"
+    cursor_field = "updated_at"
+
     def get_params(self):
+        tie_updated_at = self._tie_updated_at()
+        if tie_updated_at is None:
+            return {
+                "updated_after": self.get_bookmark(),
+                "sort_by": "updated_at",
+                "sort_order": "ascending",
+            }
+
+        # Exactly tie_updated_at, as Pardot datetimes have whole seconds.
+        moment = parse_datetime(tie_updated_at)
+        second = datetime.timedelta(seconds=1)
         return {
-            "updated_after": self.get_bookmark(),
-            "sort_by": "updated_at",
+            "updated_after": (moment - second).strftime(PARDOT_DATETIME_FORMAT),
+            "updated_before": (moment + second).strftime(PARDOT_DATETIME_FORMAT),
+            "id_greater_than": self._tie_id(),
+            "sort_by": "id",
             "sort_order": "ascending",
         }
 
+    def v5_params(self):
+        tie_updated_at = self._tie_updated_at()
+        if tie_updated_at is None:
+            return {
+                "updatedAtAfter": to_v5_datetime(self.get_bookmark()),
+                "orderBy": "updatedAt ASC",
+            }
+        # Ties before the id bookmark are dropped in sync_v5_page.
+        return {
+            "updatedAtAfterOrEqualTo": to_v5_datetime(tie_updated_at),
+            "orderBy": "updatedAt ASC",
+        }
+
+    def sync_v5_page(self, records):
+        """v5 pages the query itself, so ties need no cursor. What's left
+        of one an interrupted v3/v4 sync was paging through by id is read
+        again and the ids it already emitted are skipped."""
+        tie_updated_at = self._tie_updated_at()
+        for rec in records:
+            current_bookmark_value = rec[self.replication_keys[0]]
+            if tie_updated_at is not None:
+                if current_bookmark_value == tie_updated_at and rec["id"] <= self._tie_id():
+                    continue
+                if current_bookmark_value > tie_updated_at:
+                    self._finish_tie()
+                    tie_updated_at = None
+            self.check_order(current_bookmark_value)
+            self.update_bookmark(current_bookmark_value)
+            yield rec
+
+    def finish_v5(self):
+        if self._tie_id() is not None:
+            self._finish_tie()
+
+    def _tie_id(self):
+        return singer.bookmarks.get_bookmark(self.state, self.stream_name, "id")
+
+    def _tie_updated_at(self):
+        """The updated_at being paged through by id, if the cursor is on one."""
+        if self._tie_id() is None:
+            return None
+        return _normalize_datetime(self.get_bookmark())
+
+    def _start_tie(self, updated_at):
+        singer.bookmarks.write_bookmark(
+            self.state, self.stream_name, self.replication_keys[0], updated_at
+        )
+        singer.bookmarks.write_bookmark(self.state, self.stream_name, "id", 0)
+        self.checkpointer.mark()
+
+    def _update_tie_id(self, record_id):
+        singer.bookmarks.write_bookmark(self.state, self.stream_name, "id", record_id)
+        self.checkpointer.mark()
+
+    def _finish_tie(self):
+        singer.bookmarks.clear_bookmark(self.state, self.stream_name, "id")
+        self.checkpointer.mark()
+
+    def _next_page_params(self, params, data):
+        records = self._page_records(data)
+        if not records or self._is_last_page(data):
+            return None
+        ready = self._ready_records(records)
+        if not ready:
+            return None
+        return dict(params, updated_after=ready[-1][self.cursor_field])
+
+    def _ready_records(self, records):
+        """Records of a full page that are safe to emit: everything before
+        the page's last updated_at, which may carry on into the next page."""
+        boundary = records[-1][self.cursor_field]
+        return [rec for rec in records if rec[self.cursor_field] < boundary]
+
     def sync_page(self):
-        bookmark = _normalize_datetime(self.get_bookmark())
-        for rec in self.get_records():
+        """Emit the next page of records past the cursor.
+
+        The cursor is the updated_at bookmark, plus an id bookmark while
+        working through records that share one updated_at. Only the
+        records before a full page's last updated_at are emitted; the rest
+        are fetched again with the next page, so records sharing an
+        updated_at are never split across pages. When a whole page shares
+        one updated_at, those records are paged through by id instead,
+        with the id bookmark persisted in state, so a block of ties larger
+        than a page is neither skipped nor requested over and over.
+
+        Records are emitted as soon as a later one shows they aren't part
+        of the page's last updated_at, so only that run of ties is held at
+        a time, whether the page was decoded up front or is being streamed.
+        """
+        while True:
+            tie_updated_at = self._tie_updated_at()
+            records = yield from self._next_records()
+
+            if tie_updated_at is not None:
+                emitted = 0
+                for rec in records:
+                    # Sorted by id, so the cursor moves past the neighbours
+                    # the one second window lets in as well as the ties.
+                    self._update_tie_id(rec["id"])
+                    if rec[self.replication_keys[0]] != tie_updated_at:
+                        continue
+                    self.check_order(tie_updated_at)
+                    emitted += 1
+                    yield rec
+                if not self._last_page:
+                    if emitted:
+                        return
+                    continue
+                # The scan by updated_at goes on from here.
+                self._finish_tie()
+                self._last_page = False
+                if emitted:
+                    return
+                continue
+
+            bookmark = _normalize_datetime(self.get_bookmark())
+            emitted = 0
+            held = []
+            for rec in records:
+                if held and rec[self.replication_keys[0]] != held[-1][self.replication_keys[0]]:
+                    for ready in self._records_past(held, bookmark):
+                        emitted += 1
+                        yield ready
+                    held = []
+                held.append(rec)
+
+            if self._last_page:
+                yield from self._records_past(held, bookmark)
+                return
+            if emitted:
+                return
+            boundary = held[-1][self.replication_keys[0]]
+            if bookmark and boundary <= bookmark:
+                # Nothing past the bookmark on a full page.
+                return
+            self._start_tie(boundary)
+
+    def _records_past(self, records, bookmark):
+        for rec in records:
             current_bookmark_value = rec[self.replication_keys[0]]
             # Client-side filter: skip records at or below the bookmark in case
             # the API returns stale records despite the updated_after parameter.
@@ -186,8 +824,7 @@ class ComplexBookmarkStream(Stream):
 
     def clear_bookmark(self, bookmark_key):
         singer.bookmarks.clear_bookmark(self.state, self.stream_name, bookmark_key)
-        if self.emit:
-            singer.write_state(self.state)
+        self.checkpointer.mark()
 
     def get_bookmark(self, bookmark_key):
         return singer.bookmarks.get_bookmark(
@@ -198,8 +835,7 @@ class ComplexBookmarkStream(Stream):
         singer.bookmarks.write_bookmark(
             self.state, self.stream_name, bookmark_key, bookmark_value
         )
-        if self.emit:
-            singer.write_state(self.state)
+        self.checkpointer.mark()
 
     def sync_page(self):
         raise NotImplementedError("ComplexBookmarkStreams need a custom sync method.")
@@ -221,16 +857,24 @@ class NoUpdatedAtSortingStream(ComplexBookmarkStream):
     replication_keys = ["id", "updated_at"]
     replication_method = "INCREMENTAL"
 
+    # No cursor_param: the id bookmark only moves on records updated since
+    # the last sync, so the next page of the serial scan can't be predicted
+    # and isn't prefetched.
+
     max_updated_at = None
     last_updated_at = None
 
     def __init__(self, *args, **kwargs):
         super(NoUpdatedAtSortingStream, self).__init__(*args, **kwargs)
         self.last_updated_at = self.get_bookmark("updated_at")
-        self.max_updated_at = self.last_updated_at
+        # An interrupted sharded scan leaves the max updated_at it had seen.
+        self.max_updated_at = max(
+            self.last_updated_at, self.get_bookmark("max_updated_at") or self.last_updated_at
+        )
 
     def post_sync(self):
         self.clear_bookmark("id")
+        self.clear_bookmark("max_updated_at")
         self.update_bookmark("updated_at", self.max_updated_at)
         super(NoUpdatedAtSortingStream, self).post_sync()
 
@@ -243,7 +887,8 @@ class NoUpdatedAtSortingStream(ComplexBookmarkStream):
         }
 
     def sync_page(self):
-        for rec in self.get_records():
+        records = yield from self._next_records()
+        for rec in records:
             current_id = rec["id"]
             if rec["updated_at"] <= self.last_updated_at:
                 continue
@@ -253,6 +898,77 @@ class NoUpdatedAtSortingStream(ComplexBookmarkStream):
             self.update_bookmark("id", current_id)
             yield rec
 
+    def sync(self):
+        workers = get_int(self.config, "partition_workers", DEFAULT_PARTITION_WORKERS)
+        if workers > 1:
+            yield from self._sync_sharded(workers)
+        else:
+            yield from super(NoUpdatedAtSortingStream, self).sync()
+
+    def _next_shard_params(self, params, data):
+        """A shard scans every id in its range, so its next page starts
+        after the last id of this one."""
+        records = self._page_records(data)
+        if not records or self._is_last_page(data):
+            return None
+        return dict(params, id_greater_than=records[-1]["id"])
+
+    def _probe_max_id(self, params):
+        data = self.client.get(
+            self.endpoint,
+            **dict(params, sort_order="descending", limit=1),
+        )
+        records = self._page_records(data)
+        return max(rec["id"] for rec in records) if records else None
+
+    def _sync_sharded(self, workers):
+        """Scan ids past the bookmark in `workers` shards at once.
+
+        The highest id is probed first and the range up to it cut into
+        id_greater_than/id_less_than shards, the last one left open. Shards
+        are merged back into ascending id order, so the id bookmark only
+        covers records that have been scanned, and max_updated_at is kept in
+        the state next to it until the scan finishes so a resumed scan still
+        moves the updated_at bookmark far enough.
+        """
+        self.pre_sync()
+
+        params = self.get_params()
+        max_id = self._probe_max_id(params)
+        if max_id is not None:
+            depth = get_int(
+                self.config, "partition_prefetch_pages", DEFAULT_PARTITION_PREFETCH_PAGES
+            )
+            records = merge_ascending(
+                (
+                    self._partition_source(
+                        _shard_params(params, after, before), depth, self._next_shard_params
+                    )
+                    for after, before in id_shards(params["id_greater_than"], max_id, workers)
+                ),
+                key=lambda rec: rec["id"],
+                max_active=workers,
+            )
+
+            records_synced = 0
+            for rec in records:
+                if rec["updated_at"] <= self.last_updated_at:
+                    continue
+                self.check_order(rec["id"])
+                if rec["updated_at"] > self.max_updated_at:
+                    self.max_updated_at = rec["updated_at"]
+                    self.update_bookmark("max_updated_at", self.max_updated_at)
+                self.update_bookmark("id", rec["id"])
+                records_synced += 1
+                yield rec
+                self.checkpointer.record_done()
+                if records_synced % PAGE_SIZE == 0:
+                    self.checkpointer.page_done()
+        self.checkpointer.page_done()
+
+        self.post_sync()
+        self.checkpointer.flush()
+
 
 class UpdatedAtSortByIdReplicationStream(ComplexBookmarkStream):
     """
@@ -274,6 +990,9 @@ class UpdatedAtSortByIdReplicationStream(ComplexBookmarkStream):
     replication_keys = ["id"]
     replication_method = "INCREMENTAL"
 
+    cursor_param = "id_greater_than"
+    cursor_field = "id"
+
     start_time = None
 
     def pre_sync(self):
@@ -299,7 +1018,8 @@ class UpdatedAtSortByIdReplicationStream(ComplexBookmarkStream):
         }
 
     def sync_page(self):
-        for rec in self.get_records():
+        records = yield from self._next_records()
+        for rec in records:
             current_id = rec["id"]
             self.check_order(current_id)
             self.update_bookmark("id", current_id)
@@ -325,31 +1045,58 @@ class ChildStream(ComplexBookmarkStream):
 
     def get_records(self):
         params = self.get_params()
-        data = self.client.post(self.endpoint, **params)
-        self.update_bookmark("offset", params.get("offset", 0) + 200)
+        data = self._project_page(self.client.post(self.endpoint, **params))
+        offset = params.get("offset", 0)
+        self.update_bookmark("offset", offset + PAGE_SIZE)
 
-        if data["result"] is None or data["result"].get("total_results") == 0:
-            return []
-
-        records = data["result"][self.data_key]
-        if isinstance(records, dict):
-            records = [records]
-
-        return records
+        self._last_page = self._is_last_page(data, offset)
+        return self._page_records(data)
 
 
     def sync_page(self, parent_ids):
         for rec in self.get_records():
             yield rec
 
-    def get_parent_ids(self, parent):
+    def parent_start(self):
+        """Bookmark this run pages the parent from for its ids, read from
+        state before syncing."""
+        # pylint: disable=E1102
+        parent = self.parent_class(
+            self.client, self.config, self.get_bookmark("parent_bookmark") or {}, emit=False
+        )
+        return _normalize_datetime(parent.get_bookmark())
+
+    def _cached_parent_keys(self, parent):
+        if self.parent_keys is None:
+            return None
+        return self.parent_keys.keys_since(
+            parent.stream_name, _normalize_datetime(parent.get_bookmark())
+        )
+
+    def _parent_pages(self, parent):
+        """Ids of each page of parent records, taken from the parent stream's
+        sync earlier in this run when it covers them and paged through the
+        parent otherwise. Either way the parent's bookmark moves past a page
+        as it is handed out."""
+        keys = self._cached_parent_keys(parent)
+        if keys is not None:
+            for index in range(0, len(keys), PAGE_SIZE):
+                page = keys[index:index + PAGE_SIZE]
+                parent.update_bookmark(page[-1][0])
+                yield [record_id for _, record_id in page]
+            return
+
         while True:
             parent_ids = [rec["id"] for rec in parent.sync_page()]
-            if len(parent_ids):
+            if parent_ids:
                 yield parent_ids
-                self.update_bookmark("parent_bookmark", self.parent_bookmark)
-            else:
-                break
+            if not parent_ids or parent._last_page:
+                return
+
+    def get_parent_ids(self, parent):
+        for parent_ids in self._parent_pages(parent):
+            yield parent_ids
+            self.update_bookmark("parent_bookmark", self.parent_bookmark)
 
     def sync(self):
         self.pre_sync()
@@ -361,15 +1108,19 @@ class ChildStream(ComplexBookmarkStream):
         for parent_ids in self.get_parent_ids(parent):
             records_synced = 0
             last_records_synced = -1
+            self._last_page = False
 
-            while records_synced != last_records_synced:
+            while records_synced != last_records_synced and not self._last_page:
                 last_records_synced = records_synced
                 for rec in self.sync_page(parent_ids):
                     records_synced += 1
                     yield rec
+                    self.checkpointer.record_done()
+                self.checkpointer.page_done()
             self.clear_bookmark("offset")
 
         self.post_sync()
+        self.checkpointer.flush()
 
 
 class EmailClicks(IdReplicationStream):
@@ -386,6 +1137,9 @@ class VisitorActivities(IdReplicationStream):
     endpoint = "visitorActivity"
 
     is_dynamic = False
+    v5_object = "visitor-activities"
+    export_object = "visitorActivity"
+    export_procedure = "filter_by_created_at"
 
 
 class ProspectAccounts(UpdatedAtReplicationStream):
@@ -402,6 +1156,9 @@ class Prospects(UpdatedAtReplicationStream):
     endpoint = "prospect"
 
     is_dynamic = False
+    v5_object = "prospects"
+    export_object = "prospect"
+    export_procedure = "filter_by_updated_at"
 
 
 class Opportunities(NoUpdatedAtSortingStream):
@@ -426,14 +1183,10 @@ class Visitors(UpdatedAtReplicationStream):
     endpoint = "visitor"
 
     is_dynamic = False
+    v5_object = "visitors"
 
     def get_params(self):
-        return {
-            "updated_after": self.get_bookmark(),
-            "sort_by": "updated_at",
-            "sort_order": "ascending",
-            "only_identified": "false"
-        }
+        return dict(super(Visitors, self).get_params(), only_identified="false")
 
 class Visits(ChildStream, NoUpdatedAtSortingStream):
     stream_name = "visits"
@@ -444,6 +1197,7 @@ class Visits(ChildStream, NoUpdatedAtSortingStream):
 
     parent_class = Visitors
     parent_id_param = "visitor_ids"
+    projection_fields = ["visitor_page_views"]
 
     def fix_page_views(self, record):
         page_views = record["visitor_page_views"]["visitor_page_view"]
@@ -451,9 +1205,12 @@ class Visits(ChildStream, NoUpdatedAtSortingStream):
             record["visitor_page_views"]["visitor_page_view"] = [page_views]
 
     def get_params(self):
+        return self._visit_params(self.get_bookmark("offset"), self.parent_ids)
+
+    def _visit_params(self, offset, visitor_ids):
         return {
-            "offset": self.get_bookmark("offset"),
-            self.parent_id_param: ",".join(str(_id) for _id in self.parent_ids)
+            "offset": offset,
+            self.parent_id_param: ",".join(str(_id) for _id in visitor_ids)
         }
 
     def sync_page(self, parent_ids):
@@ -470,6 +1227,80 @@ class Visits(ChildStream, NoUpdatedAtSortingStream):
             self.max_updated_at = max(self.max_updated_at, rec["updated_at"])
             yield rec
 
+    def sync(self):
+        workers = get_int(self.config, "visit_batch_workers", DEFAULT_BATCH_WORKERS)
+        if workers > 1:
+            yield from self._sync_batched(workers)
+        else:
+            yield from super(Visits, self).sync()
+
+    def _fetch_visits(self, visitor_ids):
+        """Every visit for visitor_ids, paging through offsets."""
+        records = []
+        offset = 0
+        while True:
+            data = self._project_page(
+                self.client.post(self.endpoint, **self._visit_params(offset, visitor_ids))
+            )
+            records.extend(self._page_records(data))
+            if self._is_last_page(data, offset):
+                return records
+            offset += PAGE_SIZE
+
+    def _parent_id_rounds(self, parent, batcher, workers):
+        """Visitor ids from as many parent pages as it takes to give every
+        worker a full batch, so rounds aren't capped at one parent page."""
+        visitor_ids = []
+        for page_ids in self._parent_pages(parent):
+            visitor_ids.extend(page_ids)
+            if len(visitor_ids) >= workers * batcher.batch_size():
+                yield visitor_ids
+                visitor_ids = []
+        if visitor_ids:
+            yield visitor_ids
+
+    def _sync_batched(self, workers):
+        """Fetch visits for batches of visitor ids on `workers` threads.
+
+        Batch sizes come from an IdBatcher, which aims for one page of
+        visits per request based on the visits per visitor seen so far.
+        Visitors are paged on a copy of the parent bookmark that is only
+        saved once every batch of a round has been emitted, so STATE never
+        covers visitors whose visits are still in flight. Offsets are
+        tracked per batch in memory instead of in the offset bookmark.
+        """
+        self.pre_sync()
+        self.clear_bookmark("offset")
+        # pylint: disable=E1102
+        parent = self.parent_class(
+            self.client, self.config, copy.deepcopy(self.parent_bookmark), emit=False
+        )
+        batcher = IdBatcher(
+            PAGE_SIZE,
+            get_int(self.config, "visit_batch_max_length", DEFAULT_BATCH_MAX_LENGTH),
+        )
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="visits") as executor:
+            for visitor_ids in self._parent_id_rounds(parent, batcher, workers):
+                batches = batcher.batches(visitor_ids)
+                futures = [executor.submit(self._fetch_visits, batch) for batch in batches]
+                for batch, future in zip(batches, futures):
+                    records = future.result()
+                    batcher.observe(len(batch), len(records))
+                    for rec in records:
+                        if rec["updated_at"] <= self.last_updated_at:
+                            continue
+                        self.fix_page_views(rec)
+                        self.max_updated_at = max(self.max_updated_at, rec["updated_at"])
+                        yield rec
+                        self.checkpointer.record_done()
+                self.parent_bookmark = copy.deepcopy(parent.state)
+                self.update_bookmark("parent_bookmark", self.parent_bookmark)
+                self.checkpointer.page_done()
+
+        self.post_sync()
+        self.checkpointer.flush()
+
 
 class Lists(UpdatedAtReplicationStream):
     stream_name = "lists"
@@ -477,6 +1308,7 @@ class Lists(UpdatedAtReplicationStream):
     endpoint = "list"
 
     is_dynamic = False
+    v5_object = "lists"
 
 
 class ListMemberships(ChildStream, NoUpdatedAtSortingStream):
@@ -506,16 +1338,62 @@ class ListMemberships(ChildStream, NoUpdatedAtSortingStream):
             self.parent_id_param: self.parent_ids
         }
 
+    def sync(self):
+        if get_bool(self.config, "list_memberships_scan", False):
+            yield from self._sync_scan()
+        else:
+            yield from super(ListMemberships, self).sync()
+
+    def _scan_params(self):
+        params = self.get_params()
+        del params[self.parent_id_param]
+        return params
+
+    def _sync_scan(self):
+        """Page through memberships of every list at once by id, instead of
+        querying each list on its own, and drop memberships of lists the
+        parent scan didn't return.
+
+        The id bookmark moves past every membership scanned, kept or not, and
+        max_updated_at is kept next to it, so an interrupted scan resumes
+        where it stopped. Lists are always
+        scanned in full from a copy of the parent bookmark, so a resumed scan
+        still knows every list it filters by.
+        """
+        self.pre_sync()
+        # pylint: disable=E1102
+        parent = self.parent_class(
+            self.client, self.config, copy.deepcopy(self.parent_bookmark), emit=False
+        )
+        list_ids = {
+            list_id for parent_ids in self._parent_pages(parent) for list_id in parent_ids
+        }
+
+        while True:
+            data = self._project_page(self.client.post(self.endpoint, **self._scan_params()))
+            records = self._page_records(data)
+            for rec in records:
+                self.check_order(rec["id"])
+                self.update_bookmark("id", rec["id"])
+                if rec["list_id"] not in list_ids or rec["updated_at"] <= self.last_updated_at:
+                    continue
+                if rec["updated_at"] > self.max_updated_at:
+                    self.max_updated_at = rec["updated_at"]
+                    self.update_bookmark("max_updated_at", self.max_updated_at)
+                yield rec
+                self.checkpointer.record_done()
+            self.checkpointer.page_done()
+            if self._is_last_page(data):
+                break
+
+        self.post_sync()
+        self.checkpointer.flush()
+
     def get_parent_ids(self, parent):
         """ListMemberships take only 1 parent id at a time."""
-        records_synced = 0
-        last_records_synced = -1
-
-        while records_synced != last_records_synced:
-            last_records_synced = records_synced
-            for rec in parent.sync_page():
-                records_synced += 1
-                yield rec["id"]
+        for parent_ids in self._parent_pages(parent):
+            for parent_id in parent_ids:
+                yield parent_id
                 self.update_bookmark("parent_bookmark", self.parent_bookmark)
 
     def sync_page(self, parent_id):
@@ -1,36 +1,293 @@
+import asyncio
+
 import singer
 from singer import Transformer, metadata, utils
 
-from .streams import STREAM_OBJECTS
+from .async_client import AsyncClient
+from .config import get_bool, get_int, get_list
+from .parents import ParentKeyCache
+from .quota import QuotaExhaustedError
+from .scheduler import StreamScheduler
+from .streams import STREAM_OBJECTS, ChildStream, _normalize_datetime
+from .transform import compile_transformer, selected_properties
+from .writer import MessageWriter
 
 LOGGER = singer.get_logger()
 
 
-def sync(client, config, state, catalog):
-    selected_streams = catalog.get_selected_streams(state)
+def _get_stream_object(client, config, state, stream, schema, writer, parent_keys=None):
+    stream_id = stream.tap_stream_id
+    stream_object = STREAM_OBJECTS.get(stream_id)(client, config, state)
+
+    if stream_object is None:
+        raise Exception("Attempted to sync unknown stream {}".format(stream_id))
+
+    stream_object.parent_keys = parent_keys
+    # STATE goes through the same buffer so it stays behind its records.
+    stream_object.checkpointer.write_state = writer.write_state
+    writer.write_schema(
+        stream_id,
+        schema,
+        stream_object.key_properties,
+        stream_object.replication_keys,
+    )
+
+    return stream_object
+
+
+def _transform_context(stream):
+    """Schema and metadata map the Transformer needs, built once per stream
+    instead of once per record."""
+    return stream.schema.to_dict(), metadata.to_map(stream.metadata)
+
+
+def _record_transformer(config, transformer, schema, mdata):
+    if get_bool(config, "compiled_transform", True):
+        return compile_transformer(schema, mdata, transformer)
+    return lambda rec: transformer.transform(rec, schema, mdata)
+
+
+def _parent_stream_name(stream):
+    parent_class = getattr(STREAM_OBJECTS.get(stream.tap_stream_id), "parent_class", None)
+    return parent_class.stream_name if parent_class is not None else None
+
+
+def _children_after_parents(selected_streams):
+    """Move every child stream selected ahead of its parent to just after
+    it, so the child can reuse the ids the parent emits."""
+    ordered = list(selected_streams)
+    for stream in list(ordered):
+        stream_ids = [entry.tap_stream_id for entry in ordered]
+        parent_name = _parent_stream_name(stream)
+        if parent_name in stream_ids and stream_ids.index(parent_name) > stream_ids.index(stream.tap_stream_id):
+            ordered.remove(stream)
+            ordered.insert(stream_ids.index(parent_name), stream)
+    return ordered
 
+
+def _expect_parent_scans(client, config, state, selected_streams, parent_keys):
+    """Have every parent stream that is synced ahead of one of its selected
+    children record the ids it emits for them.
+
+    Only a parent whose bookmark is no later than the one the child pages it
+    from covers every id the child needs; otherwise the child would wait for
+    the parent just to page through it again, so no scan is kept.
+    """
+    seen = set()
     for stream in selected_streams:
-        stream_id = stream.tap_stream_id
-        stream_schema = stream.schema
-        stream_object = STREAM_OBJECTS.get(stream_id)(client, config, state)
-
-        if stream_object is None:
-            raise Exception("Attempted to sync unknown stream {}".format(stream_id))
-
-        singer.write_schema(
-            stream_id,
-            stream_schema.to_dict(),
-            stream_object.key_properties,
-            stream_object.replication_keys,
+        parent_name = _parent_stream_name(stream)
+        if parent_name is not None and parent_name in seen:
+            child = STREAM_OBJECTS[stream.tap_stream_id](client, config, state, emit=False)
+            parent = STREAM_OBJECTS[parent_name](client, config, state, emit=False)
+            if _normalize_datetime(parent.get_bookmark()) <= child.parent_start():
+                parent_keys.expect(parent_name)
+            else:
+                LOGGER.info("%s pages %s itself: the parent syncs from a later bookmark.",
+                            stream.tap_stream_id, parent_name)
+        seen.add(stream.tap_stream_id)
+
+
+def _uses_v5(client, config, stream_id):
+    """Whether the config opts stream_id into the v5 API and it can use it."""
+    stream_class = STREAM_OBJECTS.get(stream_id)
+    if getattr(stream_class, "v5_object", None) is None:
+        return False
+    if stream_id not in get_list(config, "v5_streams"):
+        return False
+    if not client.has_oauth_values():
+        LOGGER.warning("Syncing %s from the v3/v4 API: v5 needs OAuth credentials.", stream_id)
+        return False
+    return True
+
+
+def _uses_export(client, config, stream_id):
+    """Whether the config lets stream_id backfill through v5 bulk exports."""
+    stream_class = STREAM_OBJECTS.get(stream_id)
+    if getattr(stream_class, "export_object", None) is None:
+        return False
+    if stream_id not in get_list(config, "export_streams"):
+        return False
+    if not client.has_oauth_values():
+        LOGGER.warning("Backfilling %s from the v3/v4 API: exports need OAuth credentials.", stream_id)
+        return False
+    if client.cache is not None and client.cache.replaying:
+        LOGGER.warning("Backfilling %s from the v3/v4 API: exports are not recorded for replay.", stream_id)
+        return False
+    return True
+
+
+def _syncs_async(client, config, stream_id):
+    """Whether Stream.sync_async can sync stream_id. Child streams page
+    through their parent alongside their own endpoint, and v5 and export
+    syncs page in ways of their own, so those stay on the blocking client."""
+    stream_class = STREAM_OBJECTS.get(stream_id)
+    if stream_class is None or issubclass(stream_class, ChildStream):
+        return False
+    return not _uses_v5(client, config, stream_id) and not _uses_export(client, config, stream_id)
+
+
+def _prepare_stream(client, config, state, stream, writer, parent_keys, scan):
+    schema, mdata = _transform_context(stream)
+    stream_object = _get_stream_object(
+        client, config, state, stream, schema, writer, parent_keys
+    )
+    stream_object.selected_fields = selected_properties(schema, mdata)
+    stream_object.schema = schema
+    if scan is not None:
+        scan.start = _normalize_datetime(stream_object.get_bookmark())
+    return stream_object, schema, mdata
+
+
+def _sync_stream(client, config, state, stream, writer, parent_keys=None):
+    stream_id = stream.tap_stream_id
+    scan = parent_keys.scan(stream_id) if parent_keys is not None else None
+    complete = False
+    try:
+        stream_object, schema, mdata = _prepare_stream(
+            client, config, state, stream, writer, parent_keys, scan
         )
 
-        LOGGER.info("Syncing stream: " + stream_id)
+        if _uses_v5(client, config, stream_id):
+            LOGGER.info("Syncing stream from the v5 API: " + stream_id)
+            records = stream_object.sync_v5()
+        else:
+            LOGGER.info("Syncing stream: " + stream_id)
+            records = stream_object.sync()
+        if _uses_export(client, config, stream_id):
+            records = stream_object.sync_export(records)
+
+        try:
+            with Transformer() as transformer:
+                transform = _record_transformer(config, transformer, schema, mdata)
+                for rec in records:
+                    if scan is not None:
+                        scan.add(rec[stream_object.replication_keys[0]], rec["id"])
+                    writer.write_record(stream_id, transform(rec))
+            complete = True
+        except QuotaExhaustedError as ex:
+            _defer_stream(stream_id, state, ex, writer)
+    finally:
+        if scan is not None:
+            scan.finish(complete)
+
+
+async def _sync_stream_async(async_client, config, state, stream, writer, parent_keys=None):
+    stream_id = stream.tap_stream_id
+    scan = parent_keys.scan(stream_id) if parent_keys is not None else None
+    complete = False
+    try:
+        stream_object, schema, mdata = _prepare_stream(
+            async_client.client, config, state, stream, writer, parent_keys, scan
+        )
+
+        LOGGER.info("Syncing stream on the event loop: " + stream_id)
+        try:
+            with Transformer() as transformer:
+                transform = _record_transformer(config, transformer, schema, mdata)
+                async for rec in stream_object.sync_async(async_client):
+                    if scan is not None:
+                        scan.add(rec[stream_object.replication_keys[0]], rec["id"])
+                    writer.write_record(stream_id, transform(rec))
+            complete = True
+        except QuotaExhaustedError as ex:
+            _defer_stream(stream_id, state, ex, writer)
+    finally:
+        if scan is not None:
+            scan.finish(complete)
+
+
+async def sync_async(client, config, state, selected_streams, writer, parent_keys=None):
+    """Sync the selected streams on one event loop, without threads.
+
+    Every stream Stream.sync_async can sync runs as a task of its own, so
+    their page requests are in flight together on an AsyncClient. Records
+    and STATE are written from the loop, a STATE only ever after the records
+    its bookmarks cover. The remaining streams run afterwards on the
+    blocking client, one after another, by which time every parent scan
+    they could reuse has finished.
+
+    currently_syncing names the first stream, in catalog order, that hasn't
+    finished yet, so an interrupted run resumes from there.
+    """
+    loop_streams = [
+        stream for stream in selected_streams
+        if _syncs_async(client, config, stream.tap_stream_id)
+    ]
+    unfinished = [stream.tap_stream_id for stream in selected_streams]
+
+    def set_currently_syncing():
+        singer.set_currently_syncing(state, unfinished[0] if unfinished else None)
+
+    async def run(async_client, stream):
+        await _sync_stream_async(async_client, config, state, stream, writer, parent_keys)
+        unfinished.remove(stream.tap_stream_id)
+        set_currently_syncing()
+
+    set_currently_syncing()
+    writer.write_state(state)
+    if loop_streams:
+        async with AsyncClient(client) as async_client:
+            tasks = [asyncio.ensure_future(run(async_client, stream)) for stream in loop_streams]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+    for stream in selected_streams:
+        if stream in loop_streams:
+            continue
+        set_currently_syncing()
+        writer.write_state(state)
+        _sync_stream(client, config, state, stream, writer, parent_keys)
+        unfinished.remove(stream.tap_stream_id)
+
+    set_currently_syncing()
+    writer.write_state(state)
+
+
+def _defer_stream(stream_id, state, ex, writer):
+    # Bookmarks already written for the records emitted so far, so the next
+    # run resumes this stream where it stopped.
+    LOGGER.warning("Deferring stream %s to a later run: %s", stream_id, ex)
+    writer.write_state(state)
+
+
+def sync(client, config, state, catalog):
+    endpoint_streams = {cls.endpoint: name for name, cls in STREAM_OBJECTS.items()}
+    endpoint_streams.update(
+        {cls.v5_object: name for name, cls in STREAM_OBJECTS.items() if cls.v5_object}
+    )
+    client.quota.bind_state(state, endpoint_streams)
+
+    with MessageWriter.from_config(config) as writer:
+        # Starts from currently_syncing when resuming an interrupted run.
+        selected_streams = _children_after_parents(catalog.get_selected_streams(state))
+        parent_keys = ParentKeyCache.from_config(config)
+        _expect_parent_scans(client, config, state, selected_streams, parent_keys)
+
+        if get_bool(config, "async_sync", False):
+            asyncio.run(
+                sync_async(client, config, state, selected_streams, writer, parent_keys)
+            )
+            return
+
+        max_workers = get_int(config, "max_concurrent_streams", 1)
+        if max_workers > 1:
+            StreamScheduler(writer, state, max_workers).run(
+                selected_streams,
+                lambda stream, stream_state, output: _sync_stream(
+                    client, config, stream_state, stream, output, parent_keys
+                ),
+            )
+            return
+
+        for stream in selected_streams:
+            singer.set_currently_syncing(state, stream.tap_stream_id)
+            writer.write_state(state)
+            _sync_stream(client, config, state, stream, writer, parent_keys)
 
-        with Transformer() as transformer:
-            for rec in stream_object.sync():
-                singer.write_record(
-                    stream_id,
-                    transformer.transform(
-                        rec, stream.schema.to_dict(), metadata.to_map(stream.metadata),
-                    ),
-                )
+        singer.set_currently_syncing(state, None)
+        writer.write_state(state)
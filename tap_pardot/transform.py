@@ -0,0 +1,203 @@
+import datetime
+import re
+
+from singer.transform import NO_INTEGER_DATETIME_PARSING, breadcrumb_path
+from singer.utils import strftime
+
+# Datetime strings whose parse by datetime.fromisoformat is known to agree
+# with dateutil's: Pardot's own 'YYYY-MM-DD HH:MM:SS' and plain ISO 8601.
+_DATETIME_PATTERN = re.compile(
+    r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d{3}|\.\d{6})?(Z|[+-]\d{2}:\d{2})?$"
+)
+
+
+class _Fallback(Exception):
+    """Raised by a compiled converter to hand the record to singer.Transformer."""
+
+
+def _null(value):
+    if value is None or value == "":
+        return True, None
+    return False, None
+
+
+def _string(value):
+    if value is None:
+        return False, None
+    try:
+        return True, str(value)
+    except Exception:
+        return False, None
+
+
+def _integer(value):
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    try:
+        return True, int(value)
+    except Exception:
+        return False, None
+
+
+def _number(value):
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    try:
+        return True, float(value)
+    except Exception:
+        return False, None
+
+
+def _boolean(value):
+    if isinstance(value, str) and value.lower() == "false":
+        return True, False
+    try:
+        return True, bool(value)
+    except Exception:
+        return False, None
+
+
+def _datetime(value):
+    if value is None or value == "":
+        return False, None
+    if not isinstance(value, str) or not _DATETIME_PATTERN.match(value):
+        raise _Fallback()
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError as ex:
+        raise _Fallback() from ex
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    else:
+        parsed = parsed.astimezone(datetime.timezone.utc)
+    return True, strftime(parsed)
+
+
+_SCALAR_STEPS = {
+    "null": _null,
+    "integer": _integer,
+    "number": _number,
+    "boolean": _boolean,
+}
+
+
+def _identity(value):
+    return value
+
+
+def _compile_property(name, schema, transformer):
+    if "anyOf" not in schema and "type" not in schema:
+        # singer.Transformer leaves untyped values alone
+        return _identity
+
+    types = schema.get("type")
+    if not isinstance(types, list):
+        types = [types]
+    steps = []
+    for typ in [t for t in types if t != "null"] + [t for t in types if t == "null"]:
+        if typ == "string" and schema.get("format") == "date-time":
+            steps.append(_datetime)
+        elif typ == "string" and "format" not in schema:
+            steps.append(_string)
+        elif typ in _SCALAR_STEPS:
+            steps.append(_SCALAR_STEPS[typ])
+        else:
+            steps = None
+            break
+
+    if steps is None:
+        # Objects, arrays, anyOf and other formats go through singer itself.
+        def generic(value):
+            errors = len(transformer.errors)
+            success, transformed = transformer.transform_recur(value, schema, [name])
+            if not success:
+                del transformer.errors[errors:]
+                raise _Fallback()
+            return transformed
+
+        return generic
+
+    def convert(value):
+        for step in steps:
+            success, transformed = step(value)
+            if success:
+                return transformed
+        raise _Fallback()
+
+    return convert
+
+
+def _compilable(schema, mdata):
+    types = schema.get("type")
+    if not isinstance(types, list):
+        types = [types]
+    if "object" not in types or "anyOf" in schema or schema.get("patternProperties"):
+        return False
+    if not schema.get("properties"):
+        return False
+    # Metadata below the top level would need singer's recursive filtering.
+    return all(len(breadcrumb) <= 2 for breadcrumb in (mdata or {}))
+
+
+def _filtered_properties(mdata):
+    """Top-level properties the Transformer drops from every record."""
+    filtered = set()
+    for breadcrumb, field_metadata in (mdata or {}).items():
+        if len(breadcrumb) != 2 or field_metadata.get("inclusion") == "automatic":
+            continue
+        if field_metadata.get("selected") is False or field_metadata.get("inclusion") == "unsupported":
+            filtered.add(breadcrumb[1])
+    return filtered
+
+
+def selected_properties(schema, mdata):
+    """Top-level properties that survive the Transformer's metadata filter,
+    in schema order."""
+    filtered = _filtered_properties(mdata)
+    return [name for name in schema.get("properties", {}) if name not in filtered]
+
+
+def compile_transformer(schema, mdata, transformer):
+    """Return a function that transforms one record exactly like
+    transformer.transform(record, schema, mdata) would.
+
+    singer.Transformer walks the schema and metadata again for every record.
+    Here that walk happens once per stream, leaving a converter per top-level
+    property that applies the same coercions for the scalar types Pardot
+    returns. Nested properties are still handed to transformer, and any record
+    the converters can't vouch for (an unusual datetime, a value matching none
+    of its types) is transformed again by transformer from scratch, so output
+    and errors are always the ones singer would have produced.
+    """
+    if (not _compilable(schema, mdata)
+            or transformer.pre_hook
+            or transformer.integer_datetime_fmt != NO_INTEGER_DATETIME_PARSING):
+        return lambda record: transformer.transform(record, schema, mdata)
+
+    filtered = _filtered_properties(mdata)
+    filtered_paths = {name: breadcrumb_path(("properties", name)) for name in filtered}
+
+    converters = {
+        name: _compile_property(name, property_schema, transformer)
+        for name, property_schema in schema["properties"].items()
+        if name not in filtered
+    }
+
+    def transform(record):
+        if not isinstance(record, dict):
+            return transformer.transform(record, schema, mdata)
+        result = {}
+        try:
+            for key, value in record.items():
+                converter = converters.get(key)
+                if converter is not None:
+                    result[key] = converter(value)
+                elif key in filtered:
+                    transformer.filtered.add(filtered_paths[key])
+                else:
+                    transformer.removed.add(key)
+        except _Fallback:
+            return transformer.transform(record, schema, mdata)
+        return result
+
+    return transform
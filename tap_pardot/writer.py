@@ -0,0 +1,96 @@
+import sys
+import threading
+import time
+
+import singer
+
+from .config import get_float, get_int
+from .jsoncodec import JsonCodec
+
+DEFAULT_BUFFER_BYTES = 1024 * 1024
+DEFAULT_FLUSH_SECONDS = 1.0
+
+
+class MessageWriter:
+    """Writes Singer messages to stdout in large batches.
+
+    singer.write_record and friends write and flush stdout once per message,
+    which costs a pipe write for every record. Messages rendered here are
+    collected in memory and written together once the buffer reaches
+    max_bytes or max_seconds have passed since the last write. STATE is
+    always written out straight away, together with every record before it,
+    so a target never sees a bookmark ahead of the records it covers.
+    A max_bytes of 0 writes every message as it comes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_BUFFER_BYTES,
+                 max_seconds=DEFAULT_FLUSH_SECONDS, codec=None, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.codec = codec or JsonCodec()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._size = 0
+        self._last_flush = clock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_bytes=get_int(config, "output_buffer_bytes", DEFAULT_BUFFER_BYTES),
+            max_seconds=get_float(config, "output_flush_seconds", DEFAULT_FLUSH_SECONDS),
+            codec=JsonCodec.from_config(config),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def render(self, message):
+        return self.codec.encode_message(message) + "\n"
+
+    def write_message(self, message, force_flush=False):
+        self.write_lines([self.render(message)], force_flush)
+
+    def write_lines(self, lines, force_flush=False):
+        """Queue already rendered messages, keeping them together."""
+        with self._lock:
+            self._buffer.extend(lines)
+            self._size += sum(len(line) for line in lines)
+            if (force_flush
+                    or self._size >= self.max_bytes
+                    or self._clock() - self._last_flush >= self.max_seconds):
+                self._flush()
+
+    def write_record(self, stream_name, record, time_extracted=None):
+        self.write_message(
+            singer.RecordMessage(stream=stream_name, record=record, time_extracted=time_extracted)
+        )
+
+    def write_schema(self, stream_name, schema, key_properties, bookmark_properties=None):
+        self.write_message(
+            singer.SchemaMessage(
+                stream=stream_name,
+                schema=schema,
+                key_properties=key_properties,
+                bookmark_properties=bookmark_properties,
+            )
+        )
+
+    def write_state(self, value):
+        self.write_message(singer.StateMessage(value=value), force_flush=True)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            # Looked up on every flush so redirected stdout is honored.
+            sys.stdout.write("".join(self._buffer))
+            sys.stdout.flush()
+            self._buffer = []
+            self._size = 0
+        self._last_flush = self._clock()
@@ -4,9 +4,18 @@ Tests that the full discover -> sync pipeline works correctly for all streams,
 including those excluded from real integration tests due to demo account data
 limitations and those with available real data.
 """
+import json
+import threading
 import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
 
+from singer import metadata
+
+from tap_pardot import jsoncodec
+from tap_pardot.jsoncodec import ORJSON, STDLIB, JsonCodec
 from tap_pardot.streams import STREAM_OBJECTS
+from tap_pardot.v5 import to_camel
 
 from .base import (
     ALL_STREAMS,
@@ -17,6 +26,8 @@ from .base import (
     DEFAULT_RECORD_COUNT,
 )
 
+SYNC_START = datetime(2024, 7, 1, tzinfo=timezone.utc)
+
 
 class TestSyncStreamsWithData(PardotMockBaseTest, unittest.TestCase):
     """Verify streams that have real data available sync correctly."""
@@ -258,6 +269,73 @@ class TestParentChildStreamFlow(PardotMockBaseTest, unittest.TestCase):
                            "list_memberships should call client.post('listMembership', ...)")
 
 
+    def test_children_reuse_parent_stream_ids(self):
+        """Parents synced in the same run aren't paged through again."""
+        for parent, child, parent_endpoint in (('visitors', 'visits', 'visitor'),
+                                               ('lists', 'list_memberships', 'list')):
+            with self.subTest(child=child):
+                client = self._create_mock_client()
+                catalog = self.select_streams(self.run_discover(client), {child})
+                child_only = self.run_sync(client, catalog)
+
+                client = self._create_mock_client()
+                catalog = self.select_streams(self.run_discover(client), {parent, child})
+                messages = self.run_sync(client, catalog)
+
+                get_calls = [call for call in client.get.call_args_list
+                             if call[0][0] == parent_endpoint]
+                self.assertEqual(1, len(get_calls))
+                self.assertEqual(self.get_records_from_messages(child_only, child),
+                                 self.get_records_from_messages(messages, child))
+
+    def test_parent_from_later_bookmark_keeps_no_scan(self):
+        """A parent syncing incrementally doesn't cover the child's scan from
+        start_date, so the child neither waits on it nor has it keep ids."""
+        state = {'bookmarks': {'visitors': {'updated_at': '2030-01-01 00:00:00'}}}
+        for parent_state, expected in ((state, []), ({}, ['visitors'])):
+            with self.subTest(state=parent_state):
+                client = self._create_mock_client()
+                catalog = self.select_streams(self.run_discover(client), {'visitors', 'visits'})
+                with patch('tap_pardot.sync.ParentKeyCache.expect', autospec=True) as mock_expect:
+                    self.run_sync(client, catalog, state=json.loads(json.dumps(parent_state)),
+                                  config=dict(self.get_config(), max_concurrent_streams=2))
+
+                self.assertEqual(expected, [call[0][1] for call in mock_expect.call_args_list])
+
+    def test_async_sync_with_v5_parent(self):
+        """A child listed before its v5 parent doesn't wait on a parent scan
+        that hasn't started when streams sync asynchronously."""
+        stream_records = self._get_default_stream_records()
+        child_only = self.run_sync(
+            self._create_mock_client(stream_records),
+            self.select_streams(self.run_discover(self._create_mock_client()), {'list_memberships'}),
+        )
+
+        client = self._create_mock_client(stream_records)
+        client.get_v5.return_value = {
+            'values': [{to_camel(name): value for name, value in rec.items()}
+                       for rec in stream_records['lists']],
+        }
+        catalog = self.select_streams(self.run_discover(client), {'lists', 'list_memberships'})
+        stream_ids = [entry.tap_stream_id for entry in catalog.get_selected_streams({})]
+        self.assertLess(stream_ids.index('list_memberships'), stream_ids.index('lists'))
+        config = dict(self.get_config(), async_sync='true', v5_streams='lists')
+
+        result = {}
+        worker = threading.Thread(
+            target=lambda: result.update(messages=self.run_sync(client, catalog, config=config)),
+            daemon=True,
+        )
+        worker.start()
+        worker.join(timeout=10)
+
+        self.assertFalse(worker.is_alive(), 'sync is still waiting on the lists scan')
+        client.get_v5.assert_called_once()
+        self.assertEqual([], [call for call in client.get.call_args_list if call[0][0] == 'list'])
+        self.assertEqual(self.get_records_from_messages(child_only, 'list_memberships'),
+                         self.get_records_from_messages(result['messages'], 'list_memberships'))
+
+
 class TestVisitsFixPageViews(PardotMockBaseTest, unittest.TestCase):
     """Verify visits.fix_page_views() normalizes data in full pipeline."""
 
@@ -344,6 +422,128 @@ class TestZeroRecordStreams(PardotMockBaseTest, unittest.TestCase):
             self.assertEqual(len(records), 0,
                              f"{stream} should emit no RECORDs")
 
+@unittest.skipIf(jsoncodec.orjson is None, "orjson is not installed")
+class TestJsonBackendParity(PardotMockBaseTest, unittest.TestCase):
+    """The orjson backend produces the same messages and pages as stdlib."""
+
+    def _sync_all(self, json_backend):
+        client = self._create_mock_client(self.stream_records)
+        catalog = self.select_streams(self.run_discover(client), ALL_STREAMS)
+        config = dict(self.get_config(), json_backend=json_backend)
+        with patch('tap_pardot.streams.singer.utils.now', return_value=SYNC_START):
+            return self.run_sync(client, catalog, config=config)
+
+    def setUp(self):
+        self.stream_records = self._get_default_stream_records()
+
+    def test_sync_output_matches(self):
+        """Every stream syncs to identical messages with either backend."""
+        self.assertEqual(self._sync_all('json'), self._sync_all('orjson'))
+
+    def test_pages_decode_identically(self):
+        """Fixture pages for every stream decode to identical content."""
+        standard = JsonCodec(STDLIB)
+        fast = JsonCodec(ORJSON)
+        for stream_name, records in sorted(self.stream_records.items()):
+            with self.subTest(stream=stream_name):
+                response = MagicMock()
+                response.content = json.dumps(
+                    self._build_api_response(stream_name, records)
+                ).encode('utf-8')
+                response.json.side_effect = lambda: json.loads(response.content)
+                self.assertEqual(
+                    standard.decode_response(response), fast.decode_response(response)
+                )
+
+
+class TestConcurrentStreams(PardotMockBaseTest, unittest.TestCase):
+    """Streams synced concurrently produce what a sequential sync does."""
+
+    def _sync_all(self, max_concurrent_streams, state=None):
+        client = self._create_mock_client(self.stream_records)
+        catalog = self.select_streams(self.run_discover(client), ALL_STREAMS)
+        config = dict(self.get_config(), max_concurrent_streams=max_concurrent_streams)
+        state = {} if state is None else state
+        with patch('tap_pardot.streams.singer.utils.now', return_value=SYNC_START):
+            messages = self.run_sync(client, catalog, state=state, config=config)
+        return messages, state
+
+    def setUp(self):
+        self.stream_records = self._get_default_stream_records()
+
+    def test_records_and_bookmarks_match_sequential(self):
+        """Every stream emits the same records and ends with the same bookmarks."""
+        sequential, sequential_state = self._sync_all(1)
+        concurrent, concurrent_state = self._sync_all(4)
+
+        for stream in ALL_STREAMS:
+            self.assertEqual(
+                self.get_records_from_messages(sequential, stream),
+                self.get_records_from_messages(concurrent, stream),
+            )
+        self.assertEqual(sequential_state['bookmarks'], concurrent_state['bookmarks'])
+        self.assertIsNone(concurrent_state['currently_syncing'])
+
+    def test_state_follows_records_per_stream(self):
+        """No STATE carries an id bookmark ahead of that stream's records."""
+        messages, _ = self._sync_all(4)
+        max_ids = {}
+        for message in messages:
+            if message['type'] == 'RECORD':
+                stream = message['stream']
+                max_ids[stream] = max(max_ids.get(stream, 0), message['record']['id'])
+            elif message['type'] == 'STATE':
+                for stream in ('email_clicks', 'visitor_activities'):
+                    bookmark = message['value'].get('bookmarks', {}).get(stream, {})
+                    if 'id' in bookmark:
+                        self.assertLessEqual(bookmark['id'], max_ids.get(stream, 0))
+
+    def test_resumes_from_currently_syncing(self):
+        """An interrupted run starts with the stream it was syncing."""
+        state = {'currently_syncing': 'users'}
+        messages, _ = self._sync_all(1, state=state)
+        schemas = self.get_schema_messages(messages)
+        self.assertEqual('users', schemas[0]['stream'])
+
+
+class TestFieldProjection(PardotMockBaseTest, unittest.TestCase):
+    """Streams with a few selected fields emit what the Transformer alone would."""
+
+    def _sync_all(self, keep=None):
+        client = self._create_mock_client(self.stream_records)
+        catalog = self.select_streams(self.run_discover(client), ALL_STREAMS)
+        if keep is not None:
+            for entry in catalog.streams:
+                mdata = metadata.to_map(entry.metadata)
+                for breadcrumb, field_metadata in mdata.items():
+                    if breadcrumb and field_metadata.get('inclusion') != 'automatic':
+                        field_metadata['selected'] = breadcrumb[-1] in keep
+                entry.metadata = metadata.to_list(mdata)
+        state = {}
+        with patch('tap_pardot.streams.singer.utils.now', return_value=SYNC_START):
+            messages = self.run_sync(client, catalog, state=state)
+        return messages, state, client
+
+    def setUp(self):
+        self.stream_records = self._get_default_stream_records()
+
+    def test_records_and_bookmarks_match_full_selection(self):
+        """Projected records are the full records cut to the selected fields."""
+        keep = {'created_at', 'name', 'email'}
+        full, full_state, _ = self._sync_all()
+        projected, projected_state, _ = self._sync_all(keep)
+
+        for stream in ALL_STREAMS:
+            with self.subTest(stream=stream):
+                stream_cls = STREAM_OBJECTS[stream]
+                automatic = set(stream_cls.key_properties + stream_cls.replication_keys)
+                expected = [
+                    {name: value for name, value in rec.items() if name in keep | automatic}
+                    for rec in self.get_records_from_messages(full, stream)
+                ]
+                self.assertEqual(expected, self.get_records_from_messages(projected, stream))
+        self.assertEqual(full_state['bookmarks'], projected_state['bookmarks'])
+
 
 if __name__ == '__main__':
     unittest.main()
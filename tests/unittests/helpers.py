@@ -0,0 +1,31 @@
+"""Helpers shared by the unit tests."""
+import json
+
+import requests
+
+
+class MockResponse:
+    """Mock HTTP response for testing."""
+
+    def __init__(self, status_code, json_data=None, raise_for_status_error=False):
+        self.status_code = status_code
+        self.json_data = json_data or {}
+        self.raise_for_status_error = raise_for_status_error
+        self.closed = False
+
+    @property
+    def content(self):
+        return json.dumps(self.json_data).encode("utf-8")
+
+    def json(self):
+        return self.json_data
+
+    def iter_content(self, chunk_size):
+        return iter([self.content])
+
+    def close(self):
+        self.closed = True
+
+    def raise_for_status(self):
+        if self.raise_for_status_error:
+            raise requests.HTTPError(f"HTTP Error {self.status_code}")
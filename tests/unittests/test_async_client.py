@@ -0,0 +1,438 @@
+import asyncio
+import gzip
+import io
+import json
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from tap_pardot.async_client import AsyncClient
+from tap_pardot.client import Client, PardotException
+from tap_pardot.streams import Prospects
+from tap_pardot.sync import sync
+
+from test_streams import FakeProspectApi
+
+REAL_SLEEP = asyncio.sleep
+
+
+async def no_backoff_wait(seconds, *args, **kwargs):
+    await REAL_SLEEP(0)
+
+
+class StandInPardot:
+    """Answers HTTP/1.1 requests over asyncio streams on its own thread and
+    loop, so the tap's event loop talks to it over real sockets.
+
+    handler(method, path, query) is a coroutine returning status, body and
+    extra headers. A body that is a dict is sent as JSON.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait(5)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/api/".format(self.port)
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(self._serve, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        ready.set()
+        self.loop.run_forever()
+        server.close()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(5)
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                parts = urlsplit(target)
+                query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                self.requests.append((method, parts.path, query, headers))
+
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                try:
+                    status, body, extra = await self.handler(method, parts.path, query)
+                finally:
+                    self.in_flight -= 1
+
+                if isinstance(body, dict):
+                    body = json.dumps(body).encode("utf-8")
+                extra = dict(extra or {})
+                drop = extra.pop("X-Drop-Connection", None)
+                if extra.get("Transfer-Encoding") == "chunked":
+                    payload = b"".join(
+                        b"%x\r\n%s\r\n" % (len(body[index:index + 10]), body[index:index + 10])
+                        for index in range(0, len(body), 10)
+                    ) + b"0\r\n\r\n"
+                else:
+                    payload = body
+                    extra["Content-Length"] = str(len(body))
+                head = ["HTTP/1.1 {} Stand-in".format(status)]
+                head += ["{}: {}".format(name, value) for name, value in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+                await writer.drain()
+                if drop:
+                    # Gone without a Connection: close, like an idle timeout.
+                    return
+        finally:
+            writer.close()
+
+
+def make_client(url, **creds):
+    with patch.object(Client, "__init__", lambda self, c: None):
+        client = Client(None)
+    client.creds = {"email": "e", "password": "p", "user_key": "uk", "pardot_api_url": url, **creds}
+    client.endpoint_base = client._normalize_endpoint_base(url)
+    client.api_version = "4"
+    client.api_key = "key"
+    client._auth_lock = threading.Lock()
+    return client
+
+
+def ok(records=None, data_key="prospect"):
+    if not records:
+        return 200, {"result": {"total_results": 0}}, None
+    return 200, {"result": {"total_results": len(records), data_key: records}}, None
+
+
+class TestAsyncClient(unittest.TestCase):
+    """Test AsyncClient against a stand-in server."""
+
+    def serve(self, handler):
+        server = StandInPardot(handler)
+        self.addCleanup(server.stop)
+        return server
+
+    def run_client(self, client, requests_to_make):
+        async def run():
+            async with AsyncClient(client) as async_client:
+                return await requests_to_make(async_client)
+
+        # Nothing the client does may start a thread.
+        with patch.object(threading.Thread, "start", side_effect=AssertionError("thread started")):
+            return asyncio.run(run())
+
+    def test_get_post_describe_match_client(self):
+        """Test requests go out as Client sends them, on one kept-alive connection."""
+        async def handler(method, path, query):
+            return ok([{"id": 1}])
+
+        server = self.serve(handler)
+        client = make_client(server.url)
+
+        results = self.run_client(client, lambda async_client: asyncio.gather(
+            async_client.get("prospect", sort_by="id"),
+        ))
+        results += self.run_client(client, lambda async_client: self._sequential(async_client))
+
+        self.assertEqual([{"id": 1}], results[0]["result"]["prospect"])
+        methods_and_paths = [(method, path) for method, path, _, _ in server.requests]
+        self.assertEqual([
+            ("GET", "/api/prospect/version/4/do/query"),
+            ("POST", "/api/visit/version/4/do/query"),
+            ("GET", "/api/prospectAccount/version/4/do/describe"),
+        ], methods_and_paths)
+        self.assertEqual({"format": "json", "output": "bulk", "sort_by": "id"}, server.requests[0][2])
+        self.assertEqual("1,2", server.requests[1][2]["visitor_ids"])
+        self.assertEqual("Pardot api_key=key, user_key=uk", server.requests[0][3]["authorization"])
+        # One connection for each run's pool; the second run's two requests share it.
+        self.assertEqual(2, server.connections)
+
+    @staticmethod
+    async def _sequential(async_client):
+        posted = await async_client.post("visit", visitor_ids="1,2")
+        described = await async_client.describe("prospectAccount")
+        return [posted, described]
+
+    def test_pages_are_in_flight_together(self):
+        """Test concurrent requests share the wire up to the limiter's limit."""
+        for limit, expected in ((3, 3), (1, 1)):
+            with self.subTest(limit=limit):
+                arrived = []
+
+                async def handler(method, path, query, arrived=arrived, limit=limit):
+                    arrived.append(query["page"])
+                    # Hold every answer until as many requests as the limit
+                    # allows have arrived.
+                    while len(arrived) < limit:
+                        await REAL_SLEEP(0.01)
+                    return ok([{"id": int(query["page"])}])
+
+                server = self.serve(handler)
+                client = make_client(server.url, initial_concurrent_requests=limit,
+                                     max_concurrent_requests=limit)
+
+                pages = self.run_client(client, lambda async_client: asyncio.gather(
+                    *(async_client.get("prospect", page=page) for page in range(3))
+                ))
+
+                self.assertEqual([[{"id": 0}], [{"id": 1}], [{"id": 2}]],
+                                 [page["result"]["prospect"] for page in pages])
+                self.assertEqual(expected, server.max_in_flight)
+                self.assertEqual(0, client.limiter.in_flight)
+
+    def test_errors_are_classified_like_client(self):
+        """Test 5xx, error 66 and error 89 are retried and other errors raise."""
+        answers = []
+
+        async def handler(method, path, query):
+            return answers.pop(0)
+
+        server = self.serve(handler)
+        client = make_client(server.url, initial_concurrent_requests=4)
+
+        answers[:] = [
+            (503, b"", None),
+            (200, {"@attributes": {"err_code": 66}, "err": "Too many concurrent requests"}, None),
+            (200, {"@attributes": {"err_code": 89}, "err": "Use version 3"}, None),
+            ok([{"id": 5}]),
+        ]
+        with patch("asyncio.sleep", side_effect=no_backoff_wait):
+            page = self.run_client(client, lambda async_client: async_client.get("prospect"))
+
+        self.assertEqual([{"id": 5}], page["result"]["prospect"])
+        self.assertEqual(2, client.limiter.limit)
+        self.assertEqual("3", client.api_version)
+        self.assertEqual("/api/prospect/version/3/do/query", server.requests[-1][1])
+
+        answers[:] = [(200, {"@attributes": {"err_code": 15}, "err": "Login failed"}, None)]
+        with self.assertRaises(PardotException):
+            self.run_client(client, lambda async_client: async_client.get("prospect"))
+
+        answers[:] = [(404, b"", None)]
+        with self.assertRaises(requests.HTTPError):
+            self.run_client(client, lambda async_client: async_client.get("prospect"))
+        self.assertEqual(0, client.limiter.in_flight)
+
+    def test_expired_credentials_are_refreshed_and_retried(self):
+        """Test a 401 and error code 1 re-authenticate through the Client."""
+        answers = []
+
+        async def handler(method, path, query):
+            return answers.pop(0)
+
+        server = self.serve(handler)
+        client = make_client(server.url, client_id="id", client_secret="secret",
+                             refresh_token="refresh", pardot_business_unit_id="bu",
+                             access_token="old")
+
+        def refresh():
+            client.creds["access_token"] = "new"
+
+        answers[:] = [(401, b"", None), ok([{"id": 1}])]
+        with patch.object(client, "refresh_credentials", side_effect=refresh) as mock_refresh, \
+                patch("asyncio.sleep", side_effect=no_backoff_wait):
+            page = self.run_client(client, lambda async_client: async_client.get("prospect"))
+
+        mock_refresh.assert_called_once_with()
+        self.assertEqual([{"id": 1}], page["result"]["prospect"])
+        self.assertEqual(["Bearer old", "Bearer new"],
+                         [headers["authorization"] for _, _, _, headers in server.requests])
+
+        api_key_client = make_client(server.url)
+
+        def login():
+            api_key_client.api_key = "fresh"
+
+        answers[:] = [(200, {"@attributes": {"err_code": 1}, "err": "Invalid API key"}, None),
+                      ok([{"id": 2}])]
+        with patch.object(api_key_client, "login", side_effect=login):
+            page = self.run_client(api_key_client, lambda async_client: async_client.get("prospect"))
+
+        self.assertEqual([{"id": 2}], page["result"]["prospect"])
+        self.assertEqual("Pardot api_key=fresh, user_key=uk", server.requests[-1][3]["authorization"])
+
+    def test_chunked_gzip_bodies_and_dropped_connections(self):
+        """Test chunked and gzipped bodies decode and a pooled connection the
+        server dropped is replaced."""
+        body = gzip.compress(json.dumps({"result": {"total_results": 1, "prospect": {"id": 9}}}).encode())
+        answers = [
+            (200, body, {"Transfer-Encoding": "chunked", "Content-Encoding": "gzip",
+                         "X-Drop-Connection": "1"}),
+            ok([{"id": 10}]),
+        ]
+
+        async def handler(method, path, query):
+            return answers.pop(0)
+
+        server = self.serve(handler)
+        client = make_client(server.url)
+
+        async def two_pages(async_client):
+            first = await async_client.get("prospect")
+            # Let the loop see the server's side of the connection close.
+            await REAL_SLEEP(0.05)
+            return first, await async_client.get("prospect")
+
+        first, second = self.run_client(client, two_pages)
+
+        self.assertEqual({"id": 9}, first["result"]["prospect"])
+        self.assertEqual([{"id": 10}], second["result"]["prospect"])
+        self.assertEqual(2, server.connections)
+
+
+def catalog_entry(stream_id):
+    entry = MagicMock()
+    entry.tap_stream_id = stream_id
+    entry.schema.to_dict.return_value = {
+        "type": "object",
+        "properties": {
+            "id": {"type": ["integer"]},
+            "updated_at": {"type": ["null", "string"]},
+        },
+    }
+    entry.metadata = []
+    return entry
+
+
+class TestSyncAsync(unittest.TestCase):
+    """Test the async_sync path through sync."""
+
+    config = {"start_date": "2020-01-01T00:00:00Z", "async_sync": "true"}
+
+    def run_sync(self, client, stream_ids, state):
+        catalog = MagicMock()
+        catalog.get_selected_streams.return_value = [catalog_entry(stream_id) for stream_id in stream_ids]
+        output = io.StringIO()
+        with patch.object(threading.Thread, "start", side_effect=AssertionError("thread started")), \
+                patch.object(Client, "get", side_effect=AssertionError("blocking request")), \
+                redirect_stdout(output):
+            sync(client, self.config, state, catalog)
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_streams_page_together_on_one_loop(self):
+        """Test first pages of two streams are in flight at the same time,
+        without threads, and currently_syncing is kept up to date."""
+        pages = {
+            "prospect": [{"id": 1, "updated_at": "2021-01-01 00:00:00"}],
+            "emailClick": [{"id": 7}],
+        }
+        first_pages = set()
+
+        async def handler(method, path, query):
+            endpoint = path.split("/")[2]
+            if endpoint in first_pages:
+                return ok()
+            first_pages.add(endpoint)
+            # Neither stream's first page is answered before both have
+            # been asked for.
+            while len(first_pages) < 2:
+                await REAL_SLEEP(0.01)
+            return ok(pages[endpoint], endpoint)
+
+        server = StandInPardot(handler)
+        self.addCleanup(server.stop)
+        client = make_client(server.url, initial_concurrent_requests=2)
+        state = {}
+
+        messages = self.run_sync(client, ["prospects", "email_clicks"], state)
+
+        records = sorted((m["stream"], m["record"]["id"]) for m in messages if m["type"] == "RECORD")
+        self.assertEqual([("email_clicks", 7), ("prospects", 1)], records)
+        self.assertEqual(2, server.max_in_flight)
+        self.assertEqual("2021-01-01 00:00:00", state["bookmarks"]["prospects"]["updated_at"])
+        self.assertEqual(7, state["bookmarks"]["email_clicks"]["id"])
+        states = [m["value"].get("currently_syncing") for m in messages if m["type"] == "STATE"]
+        self.assertEqual("prospects", states[0])
+        self.assertIsNone(states[-1])
+
+    def test_ties_are_paged_by_id_on_the_loop(self):
+        """Test a run of ties longer than a page is paged by id through the
+        AsyncClient, with the same records and requests as sync()."""
+        tie = "2021-03-01 00:00:00"
+        records = (
+            [{"id": index, "updated_at": "2021-02-01 00:00:{:02d}".format(index)} for index in range(1, 51)]
+            + [{"id": index, "updated_at": tie} for index in range(51, 501)]
+            + [{"id": index, "updated_at": "2021-04-01 00:00:{:02d}".format(index - 500)}
+               for index in range(501, 531)]
+        )
+        api = FakeProspectApi(records)
+
+        async def handler(method, path, query):
+            params = {key: value for key, value in query.items() if key not in ("format", "output")}
+            if "id_greater_than" in params:
+                params["id_greater_than"] = int(params["id_greater_than"])
+            return 200, api.get("prospect", **params), None
+
+        server = StandInPardot(handler)
+        self.addCleanup(server.stop)
+        state = {}
+
+        messages = self.run_sync(make_client(server.url), ["prospects"], state)
+        async_ids = [m["record"]["id"] for m in messages if m["type"] == "RECORD"]
+        async_requests, api.requests = api.requests, []
+
+        blocking = MagicMock()
+        blocking.get.side_effect = api.get
+        with patch("singer.write_state"):
+            blocking_ids = [rec["id"] for rec in Prospects(blocking, self.config, {}).sync()]
+
+        self.assertEqual(sorted(rec["id"] for rec in records), sorted(async_ids))
+        self.assertEqual(blocking_ids, async_ids)
+        self.assertEqual(api.requests, async_requests)
+        self.assertEqual("2021-04-01 00:00:30", state["bookmarks"]["prospects"]["updated_at"])
+        self.assertNotIn("id", state["bookmarks"]["prospects"])
+
+    def test_child_streams_run_on_the_blocking_client_after(self):
+        """Test a child stream pages through the blocking client once the
+        loop's streams are done, reusing its parent's ids."""
+        visitors = [{"id": 3, "updated_at": "2021-01-01 00:00:00"}]
+
+        async def handler(method, path, query):
+            return ok(visitors if "updated_before" not in query and query.get("updated_after", "") < visitors[0]["updated_at"] else [], "visitor")
+
+        server = StandInPardot(handler)
+        self.addCleanup(server.stop)
+        client = make_client(server.url)
+        visit = {"id": 8, "visitor_id": 3, "updated_at": "2021-01-02 00:00:00",
+                 "visitor_page_views": {"visitor_page_view": []}}
+        state = {}
+
+        with patch.object(Client, "post", return_value={"result": {"total_results": 1, "visit": [visit]}}) as mock_post:
+            messages = self.run_sync(client, ["visits", "visitors"], state)
+
+        records = [(m["stream"], m["record"]["id"]) for m in messages if m["type"] == "RECORD"]
+        self.assertEqual([("visitors", 3), ("visits", 8)], records)
+        self.assertEqual("3", mock_post.call_args[1]["visitor_ids"])
+        # visitors only went over the wire once: visits reused its ids.
+        self.assertEqual(1, len([r for r in server.requests if r[1].startswith("/api/visitor/")]))
+        states = [m["value"].get("currently_syncing") for m in messages if m["type"] == "STATE"]
+        distinct = [name for index, name in enumerate(states) if index == 0 or states[index - 1] != name]
+        self.assertEqual(["visitors", "visits", None], distinct)
+        self.assertIsNone(states[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
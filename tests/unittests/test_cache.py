@@ -0,0 +1,162 @@
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_pardot.cache import CacheMissError, ResponseCache
+from tap_pardot.client import Client
+
+from helpers import MockResponse
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestResponseCache(CacheTestCase):
+    """Test the on-disk response cache."""
+
+    def test_from_config_disabled_without_dir(self):
+        """Test no cache is built without http_cache_dir."""
+        self.assertIsNone(ResponseCache.from_config({}))
+
+    def test_invalid_mode_raises(self):
+        """Test an unknown mode is rejected."""
+        with self.assertRaises(ValueError):
+            ResponseCache(self.directory, "rewind")
+
+    def test_key_normalizes_params(self):
+        """Test keys ignore param order, value types and None values."""
+        key = ResponseCache.key
+        self.assertEqual(
+            key("GET", "prospect", "4", {"id_greater_than": 10, "sort_by": "id", "limit": None}),
+            key("get", "prospect", 4, {"sort_by": "id", "id_greater_than": "10"}),
+        )
+        self.assertNotEqual(
+            key("get", "prospect", "4", {"id_greater_than": 10}),
+            key("get", "prospect", "3", {"id_greater_than": 10}),
+        )
+
+    def test_put_get_roundtrip_compressed(self):
+        """Test entries are stored gzip-compressed and read back."""
+        cache = ResponseCache(self.directory, "record")
+        key = cache.key("get", "prospect", "4", {})
+        cache.put(key, {"result": {"prospect": [{"id": 1}]}})
+
+        path = os.path.join(self.directory, key[:2], key + ".json.gz")
+        with gzip.open(path, "rt") as cached:
+            self.assertIn('"prospect"', cached.read())
+        self.assertEqual(cache.get(key), {"result": {"prospect": [{"id": 1}]}})
+
+    def test_replay_miss_raises(self):
+        """Test replaying an unrecorded request raises CacheMissError."""
+        cache = ResponseCache(self.directory, "replay")
+        with self.assertRaises(CacheMissError):
+            cache.replay(cache.key("get", "prospect", "4", {}), "prospect")
+
+    def test_evicts_by_age(self):
+        """Test entries older than max_age are evicted."""
+        cache = ResponseCache(self.directory, "record", max_age=60)
+        key = cache.key("get", "prospect", "4", {})
+        cache.put(key, {"result": None})
+        path = os.path.join(self.directory, key[:2], key + ".json.gz")
+        stale = time.time() - 120
+        os.utime(path, (stale, stale))
+
+        self.assertIsNone(cache.get(key))
+        cache.evict()
+        self.assertFalse(os.path.exists(path))
+
+    def test_evicts_oldest_by_size(self):
+        """Test the oldest entries go first once over max_bytes."""
+        cache = ResponseCache(self.directory, "record")
+        keys = [cache.key("get", "prospect", "4", {"offset": i}) for i in range(3)]
+        for age, key in enumerate(keys):
+            cache.put(key, {"result": {"prospect": [{"id": age, "pad": "x" * 50}]}})
+            path = os.path.join(self.directory, key[:2], key + ".json.gz")
+            stamp = time.time() - 100 + age
+            os.utime(path, (stamp, stamp))
+        entry_size = os.path.getsize(os.path.join(self.directory, keys[2][:2], keys[2] + ".json.gz"))
+
+        cache.max_bytes = entry_size * 2
+        cache.evict()
+
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+
+    def test_full_cache_is_not_walked_on_every_put(self):
+        """Test going over max_bytes trims to the low-water mark, so the next
+        puts fit without walking the directory again."""
+        cache = ResponseCache(self.directory, "record")
+        content = {"result": {"prospect": [{"id": 1, "pad": "x" * 50}]}}
+        cache.put(cache.key("get", "prospect", "4", {"offset": -1}), content)
+        entry_size = cache._size
+        cache.max_bytes = entry_size * 40
+
+        with patch.object(cache, "_entries", wraps=cache._entries) as walks:
+            for offset in range(200):
+                cache.put(cache.key("get", "prospect", "4", {"offset": offset}), content)
+
+        self.assertLessEqual(walks.call_count, 200 // 3)
+        self.assertLessEqual(cache._size, cache.max_bytes)
+
+
+class TestClientCache(CacheTestCase):
+    """Test Client records and replays responses."""
+
+    def _config(self, mode):
+        return {
+            "email": "e",
+            "password": "p",
+            "user_key": "uk",
+            "http_cache_dir": self.directory,
+            "http_cache_mode": mode,
+        }
+
+    @patch("tap_pardot.client.requests.Session.request")
+    @patch("tap_pardot.client.Client.login")
+    def test_record_then_replay(self, mock_login, mock_request):
+        """Test a recorded run replays without authenticating or requesting."""
+        mock_request.return_value = MockResponse(200, {"result": {"prospect": [{"id": 1}]}})
+        recorder = Client(self._config("record"))
+        recorded = recorder.get("prospect", id_greater_than=0)
+        mock_login.assert_called_once()
+
+        mock_request.reset_mock()
+        mock_login.reset_mock()
+        replayer = Client(self._config("replay"))
+        replayed = replayer.get("prospect", id_greater_than="0")
+
+        self.assertEqual(replayed, recorded)
+        mock_login.assert_not_called()
+        mock_request.assert_not_called()
+        with self.assertRaises(CacheMissError):
+            replayer.get("prospect", id_greater_than=5)
+
+    @patch("tap_pardot.client.requests.Session.request")
+    @patch("tap_pardot.client.Client.login")
+    def test_replay_uses_recorded_api_version(self, mock_login, mock_request):
+        """Test replay starts on the API version the recording ended on."""
+        mock_request.side_effect = [
+            MockResponse(200, {"err": "Use version 3", "@attributes": {"err_code": 89}}),
+            MockResponse(200, {"result": None}),
+        ]
+        recorder = Client(self._config("record"))
+        recorder.get("prospect")
+
+        replayer = Client(self._config("replay"))
+        self.assertEqual(replayer.api_version, "3")
+        self.assertEqual(replayer.get("prospect"), {"result": None})
+
+
+if __name__ == "__main__":
+    unittest.main()
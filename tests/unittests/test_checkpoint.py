@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_pardot.checkpoint import Checkpointer
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCheckpointer(unittest.TestCase):
+    """Test STATE checkpoint policies."""
+
+    def setUp(self):
+        self.state = {"bookmarks": {}}
+        self.write_state = MagicMock()
+
+    def _checkpointer(self, **kwargs):
+        checkpointer = Checkpointer(self.state, **kwargs)
+        checkpointer.write_state = self.write_state
+        return checkpointer
+
+    def test_from_config(self):
+        """Test the policy and thresholds are read from config."""
+        checkpointer = Checkpointer.from_config(
+            {"state_checkpoint_policy": "records", "state_checkpoint_records": "50"},
+            self.state,
+        )
+        self.assertEqual(checkpointer.policy, "records")
+        self.assertEqual(checkpointer.every_records, 50)
+
+    def test_invalid_policy_raises(self):
+        """Test an unknown policy is rejected."""
+        with self.assertRaises(ValueError):
+            Checkpointer(self.state, policy="sometimes")
+
+    def test_page_policy(self):
+        """Test the page policy flushes at the end of each page only."""
+        checkpointer = self._checkpointer()
+        checkpointer.mark()
+        checkpointer.record_done()
+        self.write_state.assert_not_called()
+
+        checkpointer.page_done()
+        self.write_state.assert_called_once_with(self.state)
+
+    def test_records_policy(self):
+        """Test the records policy flushes every N records."""
+        checkpointer = self._checkpointer(policy="records", every_records=3)
+        for _ in range(7):
+            checkpointer.mark()
+            checkpointer.record_done()
+            checkpointer.page_done()
+        self.assertEqual(self.write_state.call_count, 2)
+
+    def test_seconds_policy(self):
+        """Test the seconds policy flushes once T seconds have passed."""
+        clock = FakeClock()
+        checkpointer = self._checkpointer(policy="seconds", every_seconds=10, clock=clock)
+        checkpointer.mark()
+        checkpointer.record_done()
+        self.write_state.assert_not_called()
+
+        clock.now = 10
+        checkpointer.record_done()
+        self.write_state.assert_called_once_with(self.state)
+
+    def test_flush_skips_clean_state(self):
+        """Test nothing is written when no bookmark moved."""
+        checkpointer = self._checkpointer()
+        checkpointer.flush()
+        self.write_state.assert_not_called()
+
+    def test_no_emit(self):
+        """Test emit=False never writes STATE."""
+        checkpointer = self._checkpointer(emit=False)
+        checkpointer.mark()
+        checkpointer.flush()
+        self.write_state.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,5 @@
+import threading
+import time
 import unittest
 from unittest.mock import patch
 
@@ -13,21 +15,7 @@ from tap_pardot.client import (
     is_not_retryable_pardot_exception,
 )
 
-
-class MockResponse:
-    """Mock HTTP response for testing."""
-
-    def __init__(self, status_code, json_data=None, raise_for_status_error=False):
-        self.status_code = status_code
-        self.json_data = json_data or {}
-        self.raise_for_status_error = raise_for_status_error
-
-    def json(self):
-        return self.json_data
-
-    def raise_for_status(self):
-        if self.raise_for_status_error:
-            raise requests.HTTPError(f"HTTP Error {self.status_code}")
+from helpers import MockResponse
 
 
 class TestClientInitialization(unittest.TestCase):
@@ -116,11 +104,21 @@ class TestClientInitialization(unittest.TestCase):
         client.creds = {"email": "test@example.com"}
         self.assertFalse(client.has_api_key_auth_values())
 
+    @patch("tap_pardot.client.Client.login")
+    def test_clients_do_not_share_auth_lock(self, mock_login):
+        """Test each client re-authenticates under its own lock."""
+        creds = {
+            "email": "test@example.com",
+            "password": "pwd",
+            "user_key": "uk",
+        }
+        self.assertIsNot(Client(dict(creds))._auth_lock, Client(dict(creds))._auth_lock)
+
 
 class TestClientLogin(unittest.TestCase):
     """Test Client login method."""
 
-    @patch("tap_pardot.client.requests.post")
+    @patch("tap_pardot.client.requests.Session.post")
     def test_login_success(self, mock_post):
         """Test successful login returns api_key."""
         mock_post.return_value = MockResponse(
@@ -142,7 +140,7 @@ class TestClientLogin(unittest.TestCase):
 
         self.assertEqual(client.api_key, "test_api_key")
 
-    @patch("tap_pardot.client.requests.post")
+    @patch("tap_pardot.client.requests.Session.post")
     def test_login_pardot_error(self, mock_post):
         """Test login raises PardotException on error response."""
         mock_post.return_value = MockResponse(
@@ -168,7 +166,7 @@ class TestClientLogin(unittest.TestCase):
             with self.assertRaises(PardotException):
                 client.login()
 
-    @patch("tap_pardot.client.requests.post")
+    @patch("tap_pardot.client.requests.Session.post")
     def test_login_http_error(self, mock_post):
         """Test login raises HTTPError on non-200 response."""
         mock_post.return_value = MockResponse(
@@ -194,7 +192,7 @@ class TestClientLogin(unittest.TestCase):
 class TestClientRefreshCredentials(unittest.TestCase):
     """Test Client refresh_credentials method."""
 
-    @patch("tap_pardot.client.requests.request")
+    @patch("tap_pardot.client.requests.Session.request")
     def test_refresh_credentials_success(self, mock_request):
         """Test successful credential refresh stores access_token."""
         mock_request.return_value = MockResponse(
@@ -216,7 +214,7 @@ class TestClientRefreshCredentials(unittest.TestCase):
 
         self.assertEqual(client.creds["access_token"], "new_access_token")
 
-    @patch("tap_pardot.client.requests.request")
+    @patch("tap_pardot.client.requests.Session.request")
     def test_refresh_credentials_http_error(self, mock_request):
         """Test refresh_credentials raises on HTTP error."""
         mock_request.return_value = MockResponse(
@@ -255,6 +253,7 @@ class TestClientMakeRequest(unittest.TestCase):
             }
             client.api_version = "4"
             client.api_key = None
+            client._auth_lock = threading.Lock()
             return client
 
     def _create_client_with_api_key(self):
@@ -268,9 +267,10 @@ class TestClientMakeRequest(unittest.TestCase):
             }
             client.api_version = "4"
             client.api_key = "test_api_key"
+            client._auth_lock = threading.Lock()
             return client
 
-    @patch("tap_pardot.client.requests.request")
+    @patch("tap_pardot.client.requests.Session.request")
     def test_make_request_success(self, mock_request):
         """Test successful API request returns content."""
         mock_request.return_value = MockResponse(
@@ -281,7 +281,7 @@ class TestClientMakeRequest(unittest.TestCase):
         result = client._make_request("get", "https://pi.pardot.com/api/prospect/version/{}/do/query")
         self.assertEqual(result["result"]["total_results"], 1)
 
-    @patch("tap_pardot.client.requests.request")
+    @patch("tap_pardot.client.requests.Session.request")
     def test_make_request_401_triggers_refresh(self, mock_request):
         """Test 401 response triggers credential refresh for OAuth."""
         mock_request.return_value = MockResponse(401, json_data={})
@@ -294,7 +294,7 @@ class TestClientMakeRequest(unittest.TestCase):
             # Called on each retry attempt (backoff retries 3 times)
             self.assertEqual(mock_refresh.call_count, 3)
 
-    @patch("tap_pardot.client.requests.request")
+    @patch("tap_pardot.client.requests.Session.request")
     def test_make_request_5xx_raises_error(self, mock_request):
         """Test 5xx response raises Pardot5xxError."""
         mock_request.return_value = MockResponse(500, json_data={})
@@ -304,7 +304,7 @@ class TestClientMakeRequest(unittest.TestCase):
             client._make_request("get", "https://pi.pardot.com/api/prospect/version/{}/do/query")
 
     @patch("tap_pardot.client.Client.login")
-    @patch("tap_pardot.client.requests.request")
+    @patch("tap_pardot.client.requests.Session.request")
     def test_make_request_error_code_1_reauths(self, mock_request, mock_login):
         """Test error code 1 triggers re-authentication."""
         # First call returns error code 1, second call after re-auth succeeds
@@ -326,7 +326,23 @@ class TestClientMakeRequest(unittest.TestCase):
         # Verify the second request's response is returned after re-auth
         self.assertEqual(result, {"result": {"total_results": 1}})
 
-    @patch("tap_pardot.client.requests.request")
+    @patch("tap_pardot.client.Client.login")
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_error_code_1_retry_keeps_json_body(self, mock_request, mock_login):
+        """Test the request sent again after re-authenticating has its body."""
+        mock_request.side_effect = [
+            MockResponse(200, json_data={"err": "Invalid API key", "@attributes": {"err_code": 1}}),
+            MockResponse(200, json_data={"id": 3, "state": "Waiting"}),
+        ]
+        client = self._create_client_with_api_key()
+
+        client._make_request("post", "https://pi.pardot.com/api/v5/exports", json_body={"object": "prospect"})
+        self.assertEqual(
+            [{"object": "prospect"}] * 2,
+            [call[1]["json"] for call in mock_request.call_args_list],
+        )
+
+    @patch("tap_pardot.client.requests.Session.request")
     def test_make_request_error_code_89_switches_version(self, mock_request):
         """Test error code 89 switches API version to 3."""
         mock_request.return_value = MockResponse(
@@ -473,6 +489,183 @@ class TestClientAuthHeaders(unittest.TestCase):
             self.assertIn("my_user_key", headers["Authorization"])
 
 
+class TestClientSession(unittest.TestCase):
+    """Test the pooled session owned by Client."""
+
+    def _create_client(self, creds):
+        with patch.object(Client, "__init__", lambda self, c: None):
+            client = Client(None)
+            client.creds = creds
+            client.api_version = "4"
+            client.api_key = "key"
+            return client
+
+    def test_session_is_reused(self):
+        """Test the same session is returned on every access."""
+        client = self._create_client({"user_key": "uk"})
+        self.assertIs(client.session, client.session)
+
+    def test_session_pool_settings_from_config(self):
+        """Test pool sizes are read from config."""
+        client = self._create_client({"pool_connections": "3", "pool_maxsize": 7})
+        adapter = client.session.get_adapter("https://pi.pardot.com/api/")
+
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertTrue(adapter._pool_block)
+
+    def test_keep_alive_disabled(self):
+        """Test keep_alive=false asks the server to close connections."""
+        client = self._create_client({"keep_alive": "false"})
+        self.assertEqual(client.session.headers["Connection"], "close")
+
+    def test_default_timeout(self):
+        """Test default connect and read timeouts."""
+        client = self._create_client({})
+        self.assertEqual(client.timeout, (10, 300))
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_make_request_uses_session_and_timeout(self, mock_request):
+        """Test requests go through the session with configured timeouts."""
+        mock_request.return_value = MockResponse(200, json_data={"result": None})
+        client = self._create_client(
+            {"email": "e", "password": "p", "user_key": "uk",
+             "connect_timeout": 5, "request_timeout": "60"}
+        )
+
+        client._make_request("get", "https://pi.pardot.com/api/prospect/version/{}/do/query")
+        client._make_request("get", "https://pi.pardot.com/api/prospect/version/{}/do/query")
+
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(mock_request.call_args[1]["timeout"], (5.0, 60.0))
+
+    def test_close_discards_session(self):
+        """Test close releases the session so a new one is built on demand."""
+        client = self._create_client({})
+        session = client.session
+        client.close()
+        self.assertIsNot(client.session, session)
+
+
+class TestClientProactiveRefresh(unittest.TestCase):
+    """Test OAuth tokens are refreshed ahead of expiry, once."""
+
+    def _create_client(self, expires_in):
+        with patch.object(Client, "__init__", lambda self, c: None):
+            client = Client(None)
+            client.creds = {
+                "refresh_token": "rt",
+                "client_id": "cid",
+                "client_secret": "cs",
+                "pardot_business_unit_id": "buid",
+                "access_token": "old_token",
+            }
+            client.api_version = "4"
+            client.api_key = None
+            client.token_expires_at = time.time() + expires_in
+            client._auth_lock = threading.Lock()
+            return client
+
+    def _fake_refresh(self, client, delay=0):
+        calls = []
+
+        def refresh():
+            calls.append(1)
+            time.sleep(delay)
+            client.creds["access_token"] = "new_token_{}".format(len(calls))
+            client.token_expires_at = time.time() + 3600
+
+        return calls, refresh
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_refreshes_before_expiry(self, mock_request):
+        """Test a token inside the refresh margin is refreshed first."""
+        mock_request.return_value = MockResponse(200, json_data={"result": None})
+        client = self._create_client(expires_in=120)
+        calls, refresh = self._fake_refresh(client)
+
+        with patch.object(client, "refresh_credentials", side_effect=refresh):
+            client._make_request("get", "https://pi.pardot.com/api/prospect/version/{}/do/query")
+
+        self.assertEqual(len(calls), 1)
+        headers = mock_request.call_args[1]["headers"]
+        self.assertEqual(headers["Authorization"], "Bearer new_token_1")
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_fresh_token_not_refreshed(self, mock_request):
+        """Test a token well within its lifetime is used as is."""
+        mock_request.return_value = MockResponse(200, json_data={"result": None})
+        client = self._create_client(expires_in=3600)
+
+        with patch.object(client, "refresh_credentials") as mock_refresh:
+            client._make_request("get", "https://pi.pardot.com/api/prospect/version/{}/do/query")
+
+        mock_refresh.assert_not_called()
+
+    def test_concurrent_expiry_refreshes_once(self):
+        """Test many workers seeing an expired token trigger one refresh."""
+        client = self._create_client(expires_in=-10)
+        calls, refresh = self._fake_refresh(client, delay=0.05)
+
+        with patch.object(client, "refresh_credentials", side_effect=refresh):
+            workers = [
+                threading.Thread(target=client._ensure_fresh_credentials)
+                for _ in range(8)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(client.creds["access_token"], "new_token_1")
+
+    def test_refresh_finishing_during_expiry_check_is_not_repeated(self):
+        """Test a refresh another thread completes between this thread's
+        expiry check and its refresh isn't done a second time."""
+        client = self._create_client(expires_in=-10)
+        calls, refresh = self._fake_refresh(client)
+
+        def expired_then_refreshed_elsewhere(expires_at, margin=0):
+            # Another thread refreshes right after this one saw the expiry.
+            if not calls:
+                refresh()
+                return False
+            return expires_at > time.time() + margin
+
+        with patch("tap_pardot.client.is_fresh", side_effect=expired_then_refreshed_elsewhere), \
+                patch.object(client, "refresh_credentials", side_effect=refresh):
+            client._ensure_fresh_credentials()
+
+        self.assertEqual(len(calls), 1)
+
+    def test_token_refreshed_with_its_old_value_is_not_refreshed_again(self):
+        """Test a token that is fresh again by the time the lock is held isn't
+        refreshed, even if its value reads the same."""
+        client = self._create_client(expires_in=-10)
+
+        def renewed_in_place():
+            client.token_expires_at = time.time() + 3600
+
+        with patch.object(client, "refresh_credentials") as mock_refresh:
+            with client._auth_lock:
+                stale = client._current_credential()
+                renewed_in_place()
+            client._reauthenticate(stale, 300)
+
+        mock_refresh.assert_not_called()
+
+    def test_401_after_another_refresh_is_not_refreshed_again(self):
+        """Test a 401 for a token someone already replaced skips the refresh."""
+        client = self._create_client(expires_in=3600)
+        client.creds["access_token"] = "replaced_token"
+
+        with patch.object(client, "refresh_credentials") as mock_refresh:
+            client._reauthenticate("old_token")
+
+        mock_refresh.assert_not_called()
+
+
 class TestIsNotRetryablePardotException(unittest.TestCase):
     """Test is_not_retryable_pardot_exception function."""
 
@@ -0,0 +1,162 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from tap_pardot.client import Client
+from tap_pardot.concurrency import ConcurrencyLimiter
+
+from helpers import MockResponse
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+    """Test the AIMD concurrency governor."""
+
+    def test_from_config(self):
+        """Test limits are read from config."""
+        limiter = ConcurrencyLimiter.from_config(
+            {"initial_concurrent_requests": "2", "max_concurrent_requests": 4}
+        )
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.max_limit, 4)
+
+    def test_initial_limit_capped_by_max(self):
+        """Test the initial limit never exceeds the maximum."""
+        limiter = ConcurrencyLimiter(initial_limit=10, max_limit=3)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_additive_increase(self):
+        """Test the limit grows by one after a window of successes."""
+        limiter = ConcurrencyLimiter(initial_limit=1, max_limit=3)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 2)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 2)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+        for _ in range(10):
+            limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+
+    def test_multiplicative_decrease_sets_ceiling(self):
+        """Test error 66 halves the limit and caps future growth."""
+        limiter = ConcurrencyLimiter(initial_limit=5, max_limit=5)
+        limiter.on_limit_exceeded()
+
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.ceiling, 4)
+        for _ in range(50):
+            limiter.on_success()
+        self.assertEqual(limiter.limit, 4)
+
+    def test_limit_never_below_one(self):
+        """Test repeated error 66 keeps at least one slot."""
+        limiter = ConcurrencyLimiter(initial_limit=1, max_limit=5)
+        limiter.on_limit_exceeded()
+        limiter.on_limit_exceeded()
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(limiter.ceiling, 1)
+
+    def test_acquire_blocks_at_limit(self):
+        """Test a request waits until an in-flight slot is released."""
+        limiter = ConcurrencyLimiter(initial_limit=1, max_limit=1)
+        limiter.acquire()
+        acquired = threading.Event()
+
+        def worker():
+            with limiter:
+                acquired.set()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release()
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class TestClientUsesLimiter(unittest.TestCase):
+    """Test Client requests are governed by the limiter."""
+
+    def _create_client(self):
+        with patch.object(Client, "__init__", lambda self, c: None):
+            client = Client(None)
+            client.creds = {"email": "e", "password": "p", "user_key": "uk",
+                            "initial_concurrent_requests": 4}
+            client.api_version = "4"
+            client.api_key = "key"
+            return client
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_error_66_reduces_limit(self, mock_request):
+        """Test error code 66 responses reduce the shared limit."""
+        mock_request.return_value = MockResponse(
+            200, {"err": "Too many concurrent requests", "@attributes": {"err_code": 66}}
+        )
+        client = self._create_client()
+
+        content = client._make_request("get", "https://pi.pardot.com/api/prospect/version/{}/do/query")
+
+        self.assertEqual(content["@attributes"]["err_code"], 66)
+        self.assertEqual(client.limiter.limit, 2)
+        self.assertEqual(client.limiter.ceiling, 3)
+        self.assertEqual(client.limiter.in_flight, 0)
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_success_holds_and_releases_slot(self, mock_request):
+        """Test a request holds a slot while on the wire."""
+        client = self._create_client()
+        seen = []
+
+        def request(*args, **kwargs):
+            seen.append(client.limiter.in_flight)
+            return MockResponse(200, {"result": None})
+
+        mock_request.side_effect = request
+
+        client._make_request("get", "https://pi.pardot.com/api/prospect/version/{}/do/query")
+
+        self.assertEqual(seen, [1])
+        self.assertEqual(client.limiter.in_flight, 0)
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_streamed_page_holds_slot_until_closed(self, mock_request):
+        """Test a streamed page keeps its slot while its body is read."""
+        response = MockResponse(200, {"result": {"total_results": 2, "prospect": [{"id": 1}, {"id": 2}]}})
+        mock_request.return_value = response
+        client = self._create_client()
+
+        page = client.get_streamed("prospect", "prospect")
+        records = page.records()
+        self.assertEqual({"id": 1}, next(records))
+        self.assertEqual(client.limiter.in_flight, 1)
+
+        self.assertEqual([{"id": 2}], list(records))
+        self.assertTrue(response.closed)
+        self.assertEqual(client.limiter.in_flight, 0)
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_export_result_holds_slot_until_closed(self, mock_request):
+        """Test an export result file keeps its slot until it is closed."""
+        mock_request.return_value = MockResponse(200)
+        client = self._create_client()
+
+        with client.open_export_result("v5/exports/1/results/1"):
+            self.assertEqual(client.limiter.in_flight, 1)
+        self.assertEqual(client.limiter.in_flight, 0)
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_failed_stream_releases_slot(self, mock_request):
+        """Test a streamed request answered with an error gives its slot back."""
+        mock_request.return_value = MockResponse(404, raise_for_status_error=True)
+        client = self._create_client()
+
+        with self.assertRaises(requests.HTTPError):
+            client.open_export_result("v5/exports/1/results/1")
+        self.assertEqual(client.limiter.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_pardot.client import Client
+from tap_pardot.credentials import CredentialCache, is_fresh
+
+from helpers import MockResponse
+
+
+class CredentialsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "creds.json")
+        self.oauth_config = {
+            "refresh_token": "rt",
+            "client_id": "cid",
+            "client_secret": "cs",
+            "pardot_business_unit_id": "buid",
+            "credentials_cache_path": self.path,
+        }
+        self.api_key_config = {
+            "email": "e",
+            "password": "p",
+            "user_key": "uk",
+            "credentials_cache_path": self.path,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestCredentialCache(CredentialsTestCase):
+    """Test the credential cache file."""
+
+    def test_disabled_without_path(self):
+        """Test no cache is built without credentials_cache_path."""
+        self.assertIsNone(CredentialCache.from_config({}))
+
+    def test_missing_file_loads_empty(self):
+        """Test a missing cache file loads as empty."""
+        self.assertEqual(CredentialCache(self.path, self.oauth_config).load(), {})
+
+    def test_save_merges_values(self):
+        """Test saved values merge with what is already cached."""
+        cache = CredentialCache(self.path, self.oauth_config)
+        cache.save(access_token="t", api_version="4")
+        cache.save(api_version="3")
+
+        cached = cache.load()
+        self.assertEqual(cached["access_token"], "t")
+        self.assertEqual(cached["api_version"], "3")
+
+    def test_other_credentials_ignore_cache(self):
+        """Test a cache written for other credentials is ignored."""
+        CredentialCache(self.path, self.oauth_config).save(access_token="t")
+        other = dict(self.oauth_config, refresh_token="other")
+        self.assertEqual(CredentialCache(self.path, other).load(), {})
+
+    def test_unreadable_file_loads_empty(self):
+        """Test a corrupt cache file is ignored."""
+        with open(self.path, "w") as cache_file:
+            cache_file.write("{not json")
+        self.assertEqual(CredentialCache(self.path, self.oauth_config).load(), {})
+
+    def test_is_fresh(self):
+        """Test freshness honours the expiry margin."""
+        self.assertFalse(is_fresh(None))
+        self.assertFalse(is_fresh(time.time() + 30))
+        self.assertTrue(is_fresh(time.time() + 600))
+
+
+class TestClientCredentialReuse(CredentialsTestCase):
+    """Test Client reuses cached credentials across runs."""
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_oauth_token_cached_and_reused(self, mock_request):
+        """Test a refreshed token is reused by the next client."""
+        mock_request.return_value = MockResponse(200, {"access_token": "fresh", "expires_in": 3600})
+        Client(dict(self.oauth_config))
+        self.assertEqual(mock_request.call_count, 1)
+
+        client = Client(dict(self.oauth_config))
+
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(client.creds["access_token"], "fresh")
+        self.assertGreater(client.token_expires_at, time.time() + 3000)
+
+    @patch("tap_pardot.client.requests.Session.request")
+    def test_expired_token_refreshed(self, mock_request):
+        """Test an expired cached token triggers a refresh."""
+        CredentialCache(self.path, self.oauth_config).save(
+            access_token="stale", access_token_expires_at=time.time() - 10
+        )
+        mock_request.return_value = MockResponse(200, {"access_token": "fresh"})
+
+        client = Client(dict(self.oauth_config))
+
+        mock_request.assert_called_once()
+        self.assertEqual(client.creds["access_token"], "fresh")
+
+    @patch("tap_pardot.client.requests.Session.post")
+    def test_api_key_cached_and_reused(self, mock_post):
+        """Test an api_key from login is reused by the next client."""
+        mock_post.return_value = MockResponse(200, {"api_key": "key"})
+        Client(dict(self.api_key_config))
+        client = Client(dict(self.api_key_config))
+
+        mock_post.assert_called_once()
+        self.assertEqual(client.api_key, "key")
+
+    @patch("tap_pardot.client.requests.Session.request")
+    @patch("tap_pardot.client.requests.Session.post")
+    def test_detected_api_version_reused(self, mock_post, mock_request):
+        """Test a downgrade to version 3 is remembered for the next run."""
+        mock_post.return_value = MockResponse(200, {"api_key": "key"})
+        mock_request.side_effect = [
+            MockResponse(200, {"err": "Use version 3", "@attributes": {"err_code": 89}}),
+            MockResponse(200, {"result": None}),
+        ]
+        client = Client(dict(self.api_key_config))
+        client.get("prospect")
+
+        self.assertEqual(Client(dict(self.api_key_config)).api_version, "3")
+        with open(self.path) as cache_file:
+            self.assertEqual(json.load(cache_file)["api_version"], "3")
+
+
+class TestTokenExpiry(unittest.TestCase):
+    """Test token expiry is derived from the refresh response."""
+
+    def setUp(self):
+        with patch.object(Client, "__init__", lambda self, c: None):
+            self.client = Client(None)
+            self.client.creds = {"access_token_ttl": 100}
+
+    def test_expires_in(self):
+        """Test expires_in takes precedence."""
+        expiry = self.client._token_expiry({"expires_in": 50, "issued_at": "0"})
+        self.assertAlmostEqual(expiry, time.time() + 50, delta=5)
+
+    def test_issued_at_plus_ttl(self):
+        """Test issued_at (milliseconds) plus the configured ttl."""
+        self.assertEqual(self.client._token_expiry({"issued_at": "1000000"}), 1100)
+
+    def test_ttl_from_now(self):
+        """Test the configured ttl from now without response hints."""
+        self.assertAlmostEqual(self.client._token_expiry({}), time.time() + 100, delta=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
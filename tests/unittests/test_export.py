@@ -0,0 +1,284 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+from dateutil.parser import parse as parse_datetime
+
+import tap_pardot
+from tap_pardot.cache import RECORD, REPLAY, ResponseCache
+from tap_pardot.client import Client
+from tap_pardot.export import ExportFailedError, export_windows, from_export_row, wait_for_export
+from tap_pardot.streams import VisitorActivities
+from tap_pardot.sync import _uses_export
+
+START = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _schema(stream_name):
+    path = os.path.join(os.path.dirname(tap_pardot.__file__), "schemas", stream_name + ".json")
+    with open(path) as schema_file:
+        return json.load(schema_file)
+
+
+def activity(index, created_at):
+    return {
+        "id": index,
+        "prospectId": index % 7 or "",
+        "createdAt": created_at.isoformat(),
+    }
+
+
+class StandInExportHandler(BaseHTTPRequestHandler):
+    """Answers Pardot's v5 export endpoints and the v4 visitor activity
+    query, building each export's CSV from the records in its date range."""
+
+    def _send(self, status, content, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_json(self, body):
+        self._send(200, json.dumps(body).encode("utf-8"))
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            job = {"id": len(server.jobs) + 1, "state": "Waiting", "request": body, "polls": 0}
+            server.jobs.append(job)
+        self._send_json({"id": job["id"], "state": job["state"]})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        server = self.server
+        if parts[:3] == ["api", "v5", "exports"] and len(parts) == 4:
+            job = server.jobs[int(parts[3]) - 1]
+            job["polls"] += 1
+            if job["polls"] < 2:
+                job["state"] = "Processing"
+                return self._send_json({"id": job["id"], "state": job["state"]})
+            job["state"] = "Complete"
+            base = "http://127.0.0.1:{}".format(server.server_port)
+            return self._send_json({
+                "id": job["id"],
+                "state": job["state"],
+                # One absolute and one relative ref, as either may come back.
+                "resultRefs": [
+                    base + "/api/v5/exports/{}/results/0".format(job["id"]),
+                    "/api/v5/exports/{}/results/1".format(job["id"]),
+                ],
+            })
+        if parts[:3] == ["api", "v5", "exports"] and parts[4:5] == ["results"]:
+            return self._send_result(server.jobs[int(parts[3]) - 1], int(parts[5]))
+        if parts[:2] == ["api", "visitorActivity"]:
+            return self._send_query(parse_qs(url.query))
+        self._send(404, b"")
+
+    def _send_result(self, job, part):
+        arguments = job["request"]["procedure"]["arguments"]
+        start = parse_datetime(arguments["dateTimeStart"])
+        end = parse_datetime(arguments["dateTimeEnd"])
+        rows = [
+            rec for rec in self.server.records
+            if start <= parse_datetime(rec["createdAt"]) < end
+        ][part::2]
+        text = io.StringIO()
+        writer = csv.DictWriter(text, job["request"]["fields"], extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+        content = text.getvalue().encode("utf-8")
+        if part:
+            self._send(200, gzip.compress(content), "text/csv", {"Content-Encoding": "gzip"})
+        else:
+            self._send(200, content, "text/csv")
+
+    def _send_query(self, params):
+        after = int(params["id_greater_than"][0])
+        matching = [
+            {"id": rec["id"], "created_at": rec["createdAt"]}
+            for rec in self.server.records if rec["id"] > after
+        ]
+        self.server.queries.append(after)
+        self._send_json({"result": {"total_results": len(matching), "visitor_activity": matching[:200]}})
+
+    def log_message(self, *args):
+        pass
+
+
+class TestExportHelpers(unittest.TestCase):
+    """Test export windows, row conversion and job polling."""
+
+    def test_windows_are_consecutive_and_end_at_end(self):
+        """Test windows chain without gaps and the last one is cut short."""
+        end = START + datetime.timedelta(days=75)
+        self.assertEqual(
+            [
+                ("2023-01-01T00:00:00+00:00", "2023-01-31T00:00:00+00:00"),
+                ("2023-01-31T00:00:00+00:00", "2023-03-02T00:00:00+00:00"),
+                ("2023-03-02T00:00:00+00:00", "2023-03-17T00:00:00+00:00"),
+            ],
+            export_windows(START, end, 30),
+        )
+
+    def test_rows_take_schema_types(self):
+        """Test CSV text becomes the types and formats the schema expects."""
+        row = {
+            "id": "12",
+            "email": "a@example.com",
+            "score": "",
+            "optedOut": "false",
+            "updatedAt": "2023-02-01T10:00:00-05:00",
+        }
+        self.assertEqual(
+            {
+                "id": 12,
+                "email": "a@example.com",
+                "score": None,
+                "opted_out": False,
+                "updated_at": "2023-02-01 10:00:00",
+            },
+            from_export_row(row, _schema("prospects")),
+        )
+
+    def test_failed_export_raises(self):
+        """Test a failed job stops the sync instead of emitting nothing."""
+        client = MagicMock()
+        client.get_export.return_value = {"id": 3, "state": "Failed"}
+        with self.assertRaises(ExportFailedError):
+            wait_for_export(client, {"id": 3, "state": "Waiting"}, 0, 60)
+
+
+class TestExportBackfill(unittest.TestCase):
+    """Test backfilling visitor activities from a local stand-in export service."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInExportHandler)
+        self.server.lock = threading.Lock()
+        self.server.jobs = []
+        self.server.queries = []
+        # 1000 activities over 2023 and 2024, then five created after the backfill's
+        # cutoff that only the query endpoint returns.
+        future = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+        self.server.records = [
+            activity(index, START + datetime.timedelta(hours=16 * index)) for index in range(1, 1001)
+        ] + [activity(index, future) for index in range(1001, 1006)]
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        with patch.object(Client, "__init__", lambda self, c: None):
+            self.client = Client(None)
+        self.client.creds = {
+            "refresh_token": "refresh",
+            "client_id": "id",
+            "client_secret": "secret",
+            "pardot_business_unit_id": "0Uv000000000001",
+            "access_token": "token",
+        }
+        self.client.api_version = "4"
+        self.client.endpoint_base = "http://127.0.0.1:{}/api/".format(self.server.server_port)
+        self.addCleanup(self.client.close)
+        self.config = {
+            "start_date": "2023-01-01T00:00:00Z",
+            "export_window_days": 365,
+            "export_poll_seconds": 0,
+        }
+
+    def sync(self, state):
+        stream = VisitorActivities(self.client, self.config, state, emit=False)
+        stream.schema = _schema("visitor_activities")
+        stream.selected_fields = ["id", "prospect_id", "created_at"]
+        return list(stream.sync_export(stream.sync()))
+
+    def test_backfills_by_export_then_pages(self):
+        """Test exported windows cover the history and paging takes over after."""
+        state = {}
+        records = self.sync(state)
+
+        self.assertCountEqual(range(1, 1006), [rec["id"] for rec in records])
+        self.assertIn(
+            {"id": 7, "prospect_id": None, "created_at": "2023-01-05 16:00:00"}, records
+        )
+        requests = [job["request"] for job in self.server.jobs]
+        self.assertEqual(
+            {"object": "visitorActivity", "fields": ["id", "prospectId", "createdAt"]},
+            {"object": requests[0]["object"], "fields": requests[0]["fields"]},
+        )
+        self.assertEqual("filter_by_created_at", requests[0]["procedure"]["name"])
+        windows = [request["procedure"]["arguments"] for request in requests]
+        self.assertEqual("2023-01-01T00:00:00+00:00", windows[0]["dateTimeStart"])
+        for earlier, later in zip(windows, windows[1:]):
+            self.assertEqual(earlier["dateTimeEnd"], later["dateTimeStart"])
+        self.assertEqual([1000], self.server.queries)
+        self.assertEqual({"id": 1005}, state["bookmarks"]["visitor_activities"])
+
+    def test_full_schema_selection(self):
+        """Test an export of every schema field asks for v5 field names and
+        maps them back to schema names."""
+        stream = VisitorActivities(self.client, self.config, {}, emit=False)
+        stream.schema = _schema("visitor_activities")
+        stream.selected_fields = list(stream.schema["properties"])
+        records = list(stream.sync_export(stream.sync()))
+
+        fields = self.server.jobs[0]["request"]["fields"]
+        self.assertIn("paidSearchAdId", fields)
+        self.assertNotIn("paidSearchIdId", fields)
+        self.assertNotIn("campaign", fields)
+        self.assertIn("paid_search_id_id", records[0])
+
+    def test_resumes_unfinished_backfill(self):
+        """Test a backfill resumes with the window it stopped in."""
+        state = {
+            "bookmarks": {
+                "visitor_activities": {"id": 547, "export_through": "2024-01-01T00:00:00+00:00"}
+            }
+        }
+        records = self.sync(state)
+
+        self.assertCountEqual(range(548, 1006), [rec["id"] for rec in records])
+        self.assertEqual([1000], self.server.queries)
+        self.assertEqual(
+            "2024-01-01T00:00:00+00:00",
+            self.server.jobs[0]["request"]["procedure"]["arguments"]["dateTimeStart"],
+        )
+        self.assertEqual({"id": 1005}, state["bookmarks"]["visitor_activities"])
+
+
+class TestUsesExport(unittest.TestCase):
+    """Test which streams backfill through exports."""
+
+    def test_opt_in_per_stream_with_oauth(self):
+        """Test only listed exportable streams with OAuth credentials export."""
+        client = MagicMock(cache=None)
+        config = {"export_streams": ["prospects", "visitor_activities", "visits"]}
+        self.assertTrue(_uses_export(client, config, "prospects"))
+        self.assertTrue(_uses_export(client, config, "visitor_activities"))
+        self.assertFalse(_uses_export(client, config, "visits"))
+
+        client.has_oauth_values.return_value = False
+        self.assertFalse(_uses_export(client, config, "prospects"))
+
+    def test_replay_uses_the_recorded_v3_v4_pages(self):
+        """Test a replaying cache keeps export streams off the network."""
+        config = {"export_streams": ["prospects"]}
+        with tempfile.TemporaryDirectory() as directory:
+            client = MagicMock(cache=ResponseCache(directory, REPLAY))
+            self.assertFalse(_uses_export(client, config, "prospects"))
+
+            client.cache = ResponseCache(directory, RECORD)
+            self.assertTrue(_uses_export(client, config, "prospects"))
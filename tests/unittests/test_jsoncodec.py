@@ -0,0 +1,78 @@
+import decimal
+import json
+import math
+import unittest
+
+import singer
+
+from tap_pardot import jsoncodec
+from tap_pardot.jsoncodec import ORJSON, STDLIB, JsonCodec
+
+
+class MockResponse:
+    """Mock HTTP response for testing."""
+
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+@unittest.skipIf(jsoncodec.orjson is None, "orjson is not installed")
+class TestOrjsonParity(unittest.TestCase):
+    """orjson must fall back wherever its output would differ from singer's."""
+
+    def setUp(self):
+        self.fast = JsonCodec(ORJSON)
+        self.standard = JsonCodec(STDLIB)
+
+    def test_non_ascii_is_escaped_like_singer(self):
+        """Test non-ASCII text falls back to singer's escaped output."""
+        message = singer.RecordMessage(stream="prospects", record={"first_name": "Zoë"})
+        self.assertEqual(singer.format_message(message), self.fast.encode_message(message))
+
+    def test_unsupported_values_fall_back(self):
+        """Test Decimals and huge integers are written the way singer writes them."""
+        for value in (decimal.Decimal("1.10"), 2 ** 70):
+            message = singer.RecordMessage(stream="opportunities", record={"value": value})
+            self.assertEqual(singer.format_message(message), self.fast.encode_message(message))
+
+    def test_non_finite_floats_are_refused_like_singer(self):
+        """Test NaN and infinity raise as singer does instead of becoming null."""
+        for value in (float("nan"), float("inf"), [None, {"score": float("-inf")}]):
+            message = singer.RecordMessage(stream="prospects", record={"id": 1, "value": value})
+            with self.assertRaises(ValueError):
+                singer.format_message(message)
+            with self.assertRaises(ValueError):
+                self.fast.encode_message(message)
+
+        message = singer.RecordMessage(stream="prospects", record={"id": 1, "value": None})
+        self.assertEqual('{"type":"RECORD","stream":"prospects","record":{"id":1,"value":null}}',
+                         self.fast.encode_message(message))
+
+    def test_pages_orjson_rejects_fall_back_to_response_json(self):
+        """Test pages orjson can't parse are handled exactly as before."""
+        value = self.fast.decode_response(MockResponse(b'{"value": NaN}'))["value"]
+        self.assertTrue(math.isnan(value))
+
+        with self.assertRaises(json.JSONDecodeError):
+            self.fast.decode_response(MockResponse(b"<html>Bad gateway</html>"))
+
+
+class TestJsonCodecConfig(unittest.TestCase):
+    """Test backend selection."""
+
+    def test_auto_prefers_orjson_when_installed(self):
+        """Test auto picks orjson if it can be imported."""
+        expected = ORJSON if jsoncodec.orjson is not None else STDLIB
+        self.assertEqual(expected, JsonCodec.from_config({}).backend)
+
+    def test_stdlib_backend_can_be_forced(self):
+        """Test json_backend json keeps the standard path."""
+        self.assertEqual(STDLIB, JsonCodec.from_config({"json_backend": "json"}).backend)
+
+    def test_unknown_backend_raises(self):
+        """Test an unknown json_backend is rejected."""
+        with self.assertRaises(ValueError):
+            JsonCodec("ujson")
@@ -0,0 +1,171 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tap_pardot.client import Client
+from tap_pardot.jsonstream import StreamedPage
+from tap_pardot.streams import Prospects
+
+from test_streams import FakeProspectApi
+
+
+def chunked(content, size):
+    raw = json.dumps(content, ensure_ascii=False).encode("utf-8")
+    return [raw[index:index + size] for index in range(0, len(raw), size)]
+
+
+class TestStreamedPage(unittest.TestCase):
+    """Test decoding bulk pages one record at a time."""
+
+    page = {
+        "@attributes": {"stat": "ok", "version": 4},
+        "result": {
+            "total_results": 3,
+            "prospect": [
+                {"id": 1, "first_name": "Zoë", "score": 12345.5},
+                {"id": 2, "notes": "a \"quoted\" [value]", "lists": [1, {"id": None}]},
+                {"id": 3, "opted_out": True},
+            ],
+        },
+    }
+
+    def test_records_match_whole_page_at_any_chunk_size(self):
+        """Test records and the rest of the page decode the same as json.loads."""
+        for size in (1, 2, 5, 64, 65536):
+            page = StreamedPage.open(chunked(self.page, size), "prospect")
+            self.assertEqual(
+                {"@attributes": {"stat": "ok", "version": 4}, "result": {"total_results": 3}},
+                page.data,
+            )
+            self.assertEqual(self.page["result"]["prospect"], list(page.records()))
+
+    def test_reads_no_further_than_the_record_emitted(self):
+        """Test the body is read as records are consumed, not up front."""
+        content = {"result": {"total_results": 50, "prospect": [{"id": index} for index in range(50)]}}
+        chunks = chunked(content, 16)
+        consumed = []
+
+        def reader():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        close = MagicMock()
+        page = StreamedPage.open(reader(), "prospect", close)
+        records = page.records()
+        next(records)
+        self.assertLessEqual(len(consumed), 4)
+        list(records)
+        self.assertEqual(len(chunks), len(consumed))
+        close.assert_called_once_with()
+
+    def test_pages_without_a_records_array(self):
+        """Test empty, single-record and error pages."""
+        cases = [
+            ({"result": None}, []),
+            ({"result": {"total_results": 0}}, []),
+            ({"result": {"total_results": 1, "prospect": {"id": 9}}}, [{"id": 9}]),
+            ({"@attributes": {"err_code": 1}, "err": "Invalid API key"}, []),
+        ]
+        for content, records in cases:
+            page = StreamedPage.open(chunked(content, 3), "prospect")
+            self.assertEqual(records, list(page.records()))
+            self.assertEqual(
+                records, list(StreamedPage.from_data(content, "prospect").records())
+            )
+
+    def test_truncated_page_raises(self):
+        """Test a body cut off mid-record fails instead of ending the page."""
+        chunks = chunked(self.page, 8)[:-5]
+        page = StreamedPage.open(chunks, "prospect")
+        with self.assertRaises(json.JSONDecodeError):
+            list(page.records())
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.chunks = chunked(content, 7)
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class TestGetStreamed(unittest.TestCase):
+    """Test Client.get_streamed."""
+
+    def setUp(self):
+        with patch.object(Client, "__init__", lambda self, c: None):
+            self.client = Client(None)
+        self.client.creds = {}
+        self.client.api_version = "4"
+
+    def test_streams_page(self):
+        """Test the query is sent once and records come from the stream."""
+        content = {"result": {"total_results": 1, "prospect": [{"id": 5}]}}
+        with patch.object(self.client, "_open_stream", return_value=FakeResponse(content)) as mock_open:
+            page = self.client.get_streamed("prospect", "prospect", updated_after="2024-01-01 00:00:00")
+            self.assertEqual([{"id": 5}], list(page.records()))
+
+        url, params, endpoint = mock_open.call_args[0]
+        self.assertTrue(url.endswith("prospect/version/4/do/query"))
+        self.assertEqual(
+            {"format": "json", "output": "bulk", "updated_after": "2024-01-01 00:00:00"}, params
+        )
+        self.assertEqual("prospect", endpoint)
+
+    def test_error_page_goes_through_get(self):
+        """Test an error page is closed and retried with get()'s recovery."""
+        response = FakeResponse({"@attributes": {"err_code": 1}, "err": "Invalid API key"})
+        recovered = {"result": {"total_results": 1, "prospect": {"id": 5}}}
+        with patch.object(self.client, "_open_stream", return_value=response), \
+                patch.object(self.client, "get", return_value=recovered) as mock_get:
+            page = self.client.get_streamed("prospect", "prospect", updated_after="x")
+            self.assertEqual([{"id": 5}], list(page.records()))
+
+        self.assertTrue(response.closed)
+        mock_get.assert_called_once_with("prospect", updated_after="x")
+
+
+class TestStreamedSync(unittest.TestCase):
+    """Test streams syncing from streamed pages."""
+
+    def setUp(self):
+        tie = "2021-03-01 00:00:00"
+        self.records = (
+            [{"id": index, "updated_at": "2021-02-01 00:{:02d}:{:02d}".format(index // 60, index % 60)}
+             for index in range(1, 151)]
+            + [{"id": index, "updated_at": tie} for index in range(151, 601)]
+            + [{"id": index, "updated_at": "2021-04-01 00:00:{:02d}".format(index - 600)}
+               for index in range(601, 631)]
+        )
+
+    def sync(self, config):
+        api = FakeProspectApi(self.records)
+        client = MagicMock()
+        client.get.side_effect = api.get
+        client.get_streamed.side_effect = lambda endpoint, data_key, **params: StreamedPage.open(
+            chunked(api.get(endpoint, **params), 512), data_key
+        )
+        state = {}
+        stream = Prospects(client, dict(config, start_date="2021-01-01T00:00:00Z"), state)
+        with patch("singer.write_state"):
+            ids = [rec["id"] for rec in stream.sync()]
+        return ids, api.requests, state, client
+
+    def test_same_records_requests_and_state_as_whole_pages(self):
+        """Test streaming pages changes nothing but how they are decoded."""
+        ids, requests, state, client = self.sync({"prefetch_pages": 0})
+        streamed_ids, streamed_requests, streamed_state, streamed_client = self.sync(
+            {"stream_pages": "true"}
+        )
+
+        self.assertCountEqual(range(1, 631), streamed_ids)
+        self.assertEqual(ids, streamed_ids)
+        self.assertEqual(requests, streamed_requests)
+        self.assertEqual(state, streamed_state)
+        client.get_streamed.assert_not_called()
+        streamed_client.get.assert_not_called()
@@ -0,0 +1,62 @@
+import threading
+import unittest
+
+from tap_pardot.parents import ParentKeyCache
+
+
+def record_scan(cache, stream_name, start, keys, complete=True):
+    scan = cache.scan(stream_name)
+    scan.start = start
+    for key in keys:
+        scan.add(*key)
+    scan.finish(complete)
+
+
+class TestParentKeyCache(unittest.TestCase):
+    """Test handing a parent stream's ids to its children."""
+
+    def setUp(self):
+        self.cache = ParentKeyCache()
+        self.cache.expect("visitors")
+        self.keys = [("2024-01-01 00:00:00", 1), ("2024-02-01 00:00:00", 2)]
+
+    def test_unexpected_parent_has_no_keys(self):
+        """Test a parent no child waits on isn't recorded."""
+        self.assertIsNone(self.cache.scan("lists"))
+        self.assertIsNone(self.cache.keys_since("lists", "2024-01-01 00:00:00"))
+
+    def test_keys_since_child_start(self):
+        """Test only keys past the child's own start are handed out."""
+        record_scan(self.cache, "visitors", "2023-12-01 00:00:00", self.keys)
+        self.assertEqual(
+            [("2024-02-01 00:00:00", 2)],
+            self.cache.keys_since("visitors", "2024-01-01 00:00:00"),
+        )
+
+    def test_scan_from_later_bookmark_is_not_used(self):
+        """Test a parent synced incrementally doesn't cover a child's full scan."""
+        record_scan(self.cache, "visitors", "2024-01-15 00:00:00", self.keys[1:])
+        self.assertIsNone(self.cache.keys_since("visitors", "2024-01-01 00:00:00"))
+
+    def test_incomplete_or_oversized_scan_is_not_used(self):
+        """Test a failed scan or one past max_records falls back to paging."""
+        record_scan(self.cache, "visitors", "2023-12-01 00:00:00", self.keys, complete=False)
+        self.assertIsNone(self.cache.keys_since("visitors", "2023-12-01 00:00:00"))
+
+        cache = ParentKeyCache(max_records=1)
+        cache.expect("visitors")
+        record_scan(cache, "visitors", "2023-12-01 00:00:00", self.keys)
+        self.assertIsNone(cache.keys_since("visitors", "2023-12-01 00:00:00"))
+
+    def test_child_waits_for_running_parent(self):
+        """Test a child asking early gets the keys once the parent finishes."""
+        result = []
+        child = threading.Thread(
+            target=lambda: result.append(
+                self.cache.keys_since("visitors", "2023-12-01 00:00:00")
+            )
+        )
+        child.start()
+        record_scan(self.cache, "visitors", "2023-12-01 00:00:00", self.keys)
+        child.join(timeout=5)
+        self.assertEqual([self.keys], result)
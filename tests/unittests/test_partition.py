@@ -0,0 +1,330 @@
+import datetime
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from tap_pardot.partition import (
+    IdBatcher,
+    MergeOrderError,
+    id_shards,
+    merge_ascending,
+    time_windows,
+)
+from tap_pardot.streams import Opportunities, VisitorActivities, Visits
+
+
+class TestTimeWindows(unittest.TestCase):
+    """Test splitting the created_after range into windows."""
+
+    def test_windows_cover_range_without_gaps(self):
+        """Test windows chain together and the last one is open-ended."""
+        windows = time_windows(
+            datetime.datetime(2024, 1, 1), datetime.datetime(2024, 3, 15), 30
+        )
+        self.assertEqual(
+            [
+                ("2024-01-01 00:00:00", "2024-01-31 00:00:00"),
+                ("2024-01-30 23:59:59", "2024-03-01 00:00:00"),
+                ("2024-02-29 23:59:59", None),
+            ],
+            windows,
+        )
+
+    def test_short_range_is_one_window(self):
+        """Test a range shorter than a window isn't split."""
+        windows = time_windows(
+            datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 2), 30
+        )
+        self.assertEqual([("2024-01-01 00:00:00", None)], windows)
+
+
+class TestIdShards(unittest.TestCase):
+    """Test splitting an id range into shards."""
+
+    def test_shards_cover_range_without_gaps(self):
+        """Test consecutive shards meet and the last one is open-ended."""
+        self.assertEqual([(0, 5), (4, 9), (8, None)], id_shards(0, 10, 3))
+
+    def test_empty_range_is_one_open_shard(self):
+        """Test nothing past the bookmark still scans for new ids."""
+        self.assertEqual([(7, None)], id_shards(7, 7, 4))
+
+
+class TestMergeAscending(unittest.TestCase):
+    """Test merging sorted sources."""
+
+    def test_merges_overlapping_sources_and_drops_duplicates(self):
+        """Test output is ascending and boundary duplicates appear once."""
+        sources = [lambda: iter([1, 3, 5]), lambda: iter([2, 5, 6]), lambda: iter([])]
+        self.assertEqual([1, 2, 3, 5, 6], list(merge_ascending(sources, lambda x: x, 2)))
+
+    def test_limits_open_sources(self):
+        """Test later sources open only once an earlier one runs out."""
+        opened = []
+
+        def source(index, items):
+            def open_source():
+                opened.append(index)
+                return iter(items)
+            return open_source
+
+        merged = merge_ascending(
+            [source(0, [1, 2]), source(1, [3]), source(2, [4])], lambda x: x, 2
+        )
+        self.assertEqual(1, next(merged))
+        self.assertEqual([0, 1], opened)
+        self.assertEqual([2, 3, 4], list(merged))
+        self.assertEqual([0, 1, 2], opened)
+
+    def test_late_source_below_yielded_key_raises(self):
+        """Test a source opened late that starts below the output isn't merged."""
+        merged = merge_ascending(
+            [lambda: iter([1, 4]), lambda: iter([2, 3])], lambda x: x, 1
+        )
+        self.assertEqual([1, 4], [next(merged), next(merged)])
+        with self.assertRaises(MergeOrderError):
+            next(merged)
+
+
+class FakeVisitorActivityApi:
+    """Serves visitor activities filtered like Pardot's query endpoint."""
+
+    def __init__(self, records):
+        self.records = records
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get(self, endpoint, **params):
+        with self.lock:
+            self.requests.append(params)
+        matching = [
+            rec for rec in self.records
+            if rec["created_at"] > params["created_after"]
+            and (params.get("created_before") is None or rec["created_at"] < params["created_before"])
+            and rec["id"] > params["id_greater_than"]
+        ]
+        page = sorted(matching, key=lambda rec: rec["id"])[:200]
+        if not page:
+            return {"result": {"total_results": 0}}
+        return {"result": {"total_results": len(matching), "visitor_activity": page}}
+
+
+class TestPartitionedIdReplication(unittest.TestCase):
+    """Test windowed extraction of IdReplicationStreams."""
+
+    def setUp(self):
+        start = datetime.datetime(2024, 1, 1)
+        self.records = [
+            {"id": index + 1,
+             "created_at": (start + datetime.timedelta(hours=6 * index)).strftime("%Y-%m-%d %H:%M:%S")}
+            for index in range(1000)
+        ]
+        self.api = FakeVisitorActivityApi(self.records)
+        self.config = {
+            "start_date": "2023-12-31T00:00:00Z",
+            "partition_workers": 3,
+            "partition_window_days": 30,
+        }
+
+    def sync(self, state):
+        client = MagicMock()
+        client.get.side_effect = self.api.get
+        stream = VisitorActivities(client, self.config, state)
+        return [rec["id"] for rec in stream.sync()]
+
+    def test_emits_every_record_in_id_order(self):
+        """Test windows are merged back into ascending id order."""
+        state = {}
+        ids = self.sync(state)
+
+        self.assertEqual(list(range(1, 1001)), ids)
+        self.assertEqual(1000, state["bookmarks"]["visitor_activities"]["id"])
+        windows = {params["created_after"] for params in self.api.requests}
+        self.assertGreater(len(windows), 3)
+
+    def test_resumes_from_bookmark_without_windows(self):
+        """Test a sync with an id bookmark pages past it serially instead of
+        querying every window since start_date again."""
+        state = {"bookmarks": {"visitor_activities": {"id": 600}}}
+        ids = self.sync(state)
+
+        self.assertEqual(list(range(601, 1001)), ids)
+        self.assertEqual([600, 800], [params["id_greater_than"] for params in self.api.requests])
+        self.assertFalse(any("created_before" in params for params in self.api.requests))
+
+    def test_ids_out_of_created_at_order_fall_back_to_serial(self):
+        """Test a record created late with a low id isn't skipped: the
+        windows are dropped and the stream pages serially from the start."""
+        self.records[4]["created_at"] = "2024-09-01 00:00:00"
+        state = {}
+        ids = self.sync(state)
+
+        self.assertEqual(list(range(1, 1001)), ids[-1000:])
+        self.assertEqual(list(range(1, 5)), ids[:4])
+        self.assertEqual(1000, state["bookmarks"]["visitor_activities"]["id"])
+
+
+class FakeOpportunityApi:
+    """Serves opportunities filtered and sorted like Pardot's query endpoint."""
+
+    def __init__(self, records):
+        self.records = records
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get(self, endpoint, **params):
+        with self.lock:
+            self.requests.append(params)
+        matching = sorted(
+            (
+                rec for rec in self.records
+                if rec["id"] > params["id_greater_than"]
+                and (params.get("id_less_than") is None or rec["id"] < params["id_less_than"])
+            ),
+            key=lambda rec: rec["id"],
+            reverse=params["sort_order"] == "descending",
+        )
+        page = matching[:params.get("limit", 200)]
+        if not page:
+            return {"result": {"total_results": 0}}
+        return {"result": {"total_results": len(matching), "opportunity": page}}
+
+
+class TestShardedNoUpdatedAtSorting(unittest.TestCase):
+    """Test id-sharded scans of NoUpdatedAtSortingStreams."""
+
+    def setUp(self):
+        # Every third opportunity changed since the last sync.
+        self.records = [
+            {"id": index,
+             "updated_at": "2024-03-{:02d} 00:00:00".format(index % 28 + 1)
+             if index % 3 == 0 else "2024-01-01 00:00:00"}
+            for index in range(1, 1001)
+        ]
+        self.api = FakeOpportunityApi(self.records)
+        self.config = {
+            "start_date": "2024-01-01T00:00:00Z",
+            "partition_workers": 4,
+        }
+
+    def sync(self, state):
+        client = MagicMock()
+        client.get.side_effect = self.api.get
+        stream = Opportunities(client, self.config, state)
+        return [rec["id"] for rec in stream.sync()]
+
+    def test_emits_updated_records_in_id_order(self):
+        """Test shards are merged in id order and bookmarks are finalized."""
+        state = {"bookmarks": {"opportunities": {"updated_at": "2024-02-01 00:00:00"}}}
+        ids = self.sync(state)
+
+        self.assertEqual([index for index in range(1, 1001) if index % 3 == 0], ids)
+        self.assertEqual(
+            {"updated_at": "2024-03-28 00:00:00"}, state["bookmarks"]["opportunities"]
+        )
+        self.assertEqual(1, self.api.requests[0]["limit"])
+        shard_starts = {params["id_greater_than"] for params in self.api.requests[1:]}
+        self.assertTrue({0, 250, 500, 750}.issubset(shard_starts))
+
+    def test_resume_keeps_max_updated_at_from_interrupted_scan(self):
+        """Test a resumed scan finishes with the max updated_at of both runs."""
+        self.records[-1]["updated_at"] = "2024-01-01 00:00:00"
+        state = {
+            "bookmarks": {
+                "opportunities": {
+                    "updated_at": "2024-02-01 00:00:00",
+                    "id": 990,
+                    "max_updated_at": "2024-05-01 00:00:00",
+                }
+            }
+        }
+        ids = self.sync(state)
+
+        self.assertEqual([993, 996, 999], ids)
+        self.assertEqual(
+            {"updated_at": "2024-05-01 00:00:00"}, state["bookmarks"]["opportunities"]
+        )
+
+
+class TestIdBatcher(unittest.TestCase):
+    """Test sizing batches of parent ids."""
+
+    def test_batch_size_follows_observed_children(self):
+        """Test parents with many children get smaller batches and vice versa."""
+        batcher = IdBatcher(200)
+        self.assertEqual(200, batcher.batch_size())
+        batcher.observe(99, 399)
+        self.assertEqual(50, batcher.batch_size())
+
+        batcher = IdBatcher(200)
+        batcher.observe(199, 99)
+        self.assertEqual(400, batcher.batch_size())
+
+    def test_batches_respect_size_and_length(self):
+        """Test batches are cut at the batch size or the joined length."""
+        self.assertEqual([[1, 2], [3, 4], [5]], IdBatcher(2).batches([1, 2, 3, 4, 5]))
+        self.assertEqual(
+            [[1000, 2000], [3000]], IdBatcher(200, max_length=9).batches([1000, 2000, 3000])
+        )
+
+
+class FakeVisitApi:
+    """Serves visitors and their visits like Pardot's query endpoints."""
+
+    def __init__(self, visitors, visits):
+        self.visitors = visitors
+        self.visits = visits
+        self.posts = []
+        self.lock = threading.Lock()
+
+    def get(self, endpoint, **params):
+        matching = [rec for rec in self.visitors if rec["updated_at"] > params["updated_after"]]
+        page = matching[:200]
+        return {"result": {"total_results": len(matching), "visitor": page}}
+
+    def post(self, endpoint, **params):
+        with self.lock:
+            self.posts.append(params)
+        visitor_ids = {int(_id) for _id in params["visitor_ids"].split(",")}
+        matching = [rec for rec in self.visits if rec["visitor_id"] in visitor_ids]
+        page = matching[params["offset"]:params["offset"] + 200]
+        if not page:
+            return {"result": {"total_results": 0}}
+        return {"result": {"total_results": len(matching), "visit": page}}
+
+
+class TestBatchedVisits(unittest.TestCase):
+    """Test Visits fetched in parallel batches of visitor ids."""
+
+    def setUp(self):
+        self.visitors = [
+            {"id": index, "updated_at": "2024-01-01 00:{:02d}:{:02d}".format(index // 60, index % 60)}
+            for index in range(1, 701)
+        ]
+        # Four visits per visitor.
+        self.visits = [
+            {"id": visitor["id"] * 10 + n,
+             "visitor_id": visitor["id"],
+             "updated_at": "2024-02-01 00:00:00",
+             "visitor_page_views": {"visitor_page_view": {"id": 1}}}
+            for visitor in self.visitors for n in range(4)
+        ]
+        self.api = FakeVisitApi(self.visitors, self.visits)
+        self.config = {"start_date": "2023-12-31T00:00:00Z", "visit_batch_workers": 2}
+
+    def test_emits_every_visit_in_right_sized_batches(self):
+        """Test every visit is emitted once and batches shrink to about a page."""
+        client = MagicMock()
+        client.get.side_effect = self.api.get
+        client.post.side_effect = self.api.post
+        state = {}
+        stream = Visits(client, self.config, state)
+        ids = [rec["id"] for rec in stream.sync()]
+
+        self.assertCountEqual([rec["id"] for rec in self.visits], ids)
+        batch_sizes = [len(params["visitor_ids"].split(",")) for params in self.api.posts]
+        self.assertEqual(200, batch_sizes[0])
+        self.assertEqual([3, 50, 50], sorted(batch_sizes[-3:]))
+        self.assertEqual(
+            {"updated_at": "2024-02-01 00:00:00"}, state["bookmarks"]["visits"]
+        )
@@ -0,0 +1,161 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from tap_pardot.prefetch import PagePipeline
+from tap_pardot.streams import EmailClicks, Opportunities, Prospects
+
+
+def next_params(params, page):
+    if not page:
+        return None
+    return {"id_greater_than": page[-1]}
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for condition")
+        time.sleep(0.01)
+
+
+class TestPagePipeline(unittest.TestCase):
+    """Test the background page producer."""
+
+    def test_next_page_requested_before_current_is_consumed(self):
+        """Test page N+1 is fetched while page N is still with the consumer."""
+        pages = {0: [1, 2], 2: [3, 4], 4: []}
+        requested = []
+
+        def fetch(params):
+            requested.append(params["id_greater_than"])
+            return pages[params["id_greater_than"]]
+
+        pipeline = PagePipeline(fetch, {"id_greater_than": 0}, next_params)
+        self.assertEqual([1, 2], pipeline.take({"id_greater_than": 0}))
+        wait_for(lambda: 2 in requested)
+        self.assertEqual([3, 4], pipeline.take({"id_greater_than": 2}))
+        self.assertEqual([], pipeline.take({"id_greater_than": 4}))
+        self.assertEqual([0, 2, 4], requested)
+
+    def test_queue_bounds_how_far_ahead_it_fetches(self):
+        """Test the producer stops once depth pages are waiting."""
+        requested = []
+
+        def fetch(params):
+            requested.append(params["id_greater_than"])
+            return [params["id_greater_than"] + 1]
+
+        pipeline = PagePipeline(fetch, {"id_greater_than": 0}, next_params, depth=2)
+        wait_for(lambda: len(requested) >= 3)
+        time.sleep(0.2)
+        # Two pages queued plus one fetched and waiting for room.
+        self.assertEqual([0, 1, 2], requested)
+        pipeline.close()
+
+    def test_unexpected_params_close_the_pipeline(self):
+        """Test a page requested with other params is never handed over."""
+        pipeline = PagePipeline(lambda params: [1], {"id_greater_than": 0}, next_params)
+        self.assertIsNone(pipeline.take({"id_greater_than": 5}))
+        self.assertIsNone(pipeline.take({"id_greater_than": 1}))
+
+    def test_fetch_error_raised_for_its_page(self):
+        """Test an error is raised from take() for the page that failed."""
+        def fetch(params):
+            if params["id_greater_than"]:
+                raise RuntimeError("boom")
+            return [1]
+
+        pipeline = PagePipeline(fetch, {"id_greater_than": 0}, next_params)
+        self.assertEqual([1], pipeline.take({"id_greater_than": 0}))
+        with self.assertRaises(RuntimeError):
+            pipeline.take({"id_greater_than": 1})
+
+    def test_close_releases_blocked_producer(self):
+        """Test close() lets a producer blocked on a full queue exit."""
+        pipeline = PagePipeline(lambda params: [params["id_greater_than"] + 1],
+                                {"id_greater_than": 0}, next_params)
+        time.sleep(0.1)
+        pipeline.close()
+        pipeline._thread.join(timeout=2)
+        self.assertFalse(pipeline._thread.is_alive())
+
+
+def page(data_key, records, total_results=None):
+    if not records:
+        return {"result": None}
+    if total_results is None:
+        total_results = len(records)
+    return {"result": {"total_results": total_results, data_key: records}}
+
+
+class TestStreamPrefetch(unittest.TestCase):
+    """Streams make the same requests with and without prefetching."""
+
+    def sync_requests(self, stream_cls, pages, prefetch_pages, state=None):
+        client = MagicMock()
+        responses = iter(pages)
+        lock = threading.Lock()
+
+        def get(endpoint, **params):
+            with lock:
+                return next(responses)
+
+        client.get.side_effect = get
+        config = {"start_date": "2024-01-01T00:00:00Z", "prefetch_pages": prefetch_pages}
+        stream = stream_cls(client, config, state or {})
+        records = list(stream.sync())
+        return records, [call[1] for call in client.get.call_args_list], stream.state
+
+    def test_id_stream_uses_prefetched_pages(self):
+        """Test an id-paged stream gets identical records, requests and state."""
+        pages = [
+            page("emailClick", [{"id": 1}, {"id": 2}], total_results=3),
+            page("emailClick", [{"id": 3}]),
+        ]
+        sequential = self.sync_requests(EmailClicks, pages, 0)
+        prefetched = self.sync_requests(EmailClicks, pages, 1)
+        self.assertEqual(sequential, prefetched)
+        self.assertEqual(2, len(prefetched[1]))
+        self.assertEqual(2, prefetched[1][1]["id_greater_than"])
+
+    def test_updated_at_stream_uses_prefetched_pages(self):
+        """Test an updated_at-paged stream gets identical records, requests and state."""
+        pages = [
+            page("prospect", [{"id": 1, "updated_at": "2024-02-01 00:00:00"},
+                              {"id": 2, "updated_at": "2024-02-02 00:00:00"}],
+                 total_results=3),
+            # The last updated_at of a full page is fetched again.
+            page("prospect", [{"id": 2, "updated_at": "2024-02-02 00:00:00"},
+                              {"id": 3, "updated_at": "2024-02-03 00:00:00"}]),
+        ]
+        sequential = self.sync_requests(Prospects, pages, 0)
+        prefetched = self.sync_requests(Prospects, pages, 1)
+        self.assertEqual(sequential, prefetched)
+        self.assertEqual([1, 2, 3], [rec["id"] for rec in prefetched[0]])
+        self.assertEqual("2024-02-01 00:00:00", prefetched[1][1]["updated_after"])
+
+    def test_filtered_id_scan_is_not_prefetched(self):
+        """Test a stream whose id bookmark skips filtered records makes no
+        speculative requests on an incremental run."""
+        records = [
+            {"id": index, "updated_at": "2024-05-01 00:00:00" if 3 <= index <= 5 else "2024-01-02 00:00:00"}
+            for index in range(1, 451)
+        ]
+        requests = []
+
+        def get(endpoint, **params):
+            requests.append(params["id_greater_than"])
+            matching = [rec for rec in records if rec["id"] > params["id_greater_than"]]
+            return page("opportunity", matching[:200], total_results=len(matching))
+
+        client = MagicMock()
+        client.get.side_effect = get
+        state = {"bookmarks": {"opportunities": {"updated_at": "2024-03-01 00:00:00"}}}
+        config = {"start_date": "2024-01-01T00:00:00Z", "prefetch_pages": 1}
+        synced = list(Opportunities(client, config, state).sync())
+
+        self.assertEqual([3, 4, 5], [rec["id"] for rec in synced])
+        self.assertEqual([0, 5], requests)
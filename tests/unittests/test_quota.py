@@ -0,0 +1,168 @@
+import datetime
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tap_pardot.client import Client
+from tap_pardot.quota import QuotaBudgeter, QuotaExhaustedError
+from tap_pardot.sync import sync
+
+
+def fixed_now(hour=12):
+    return lambda: datetime.datetime(2024, 6, 15, hour, 0, 0, tzinfo=datetime.timezone.utc)
+
+
+class TestQuotaBudgeter(unittest.TestCase):
+    """Test the daily API call budgeter."""
+
+    def test_from_config(self):
+        """Test budget settings are read from config."""
+        quota = QuotaBudgeter.from_config(
+            {"daily_api_call_budget": "1000", "low_priority_streams": "visits, users"}
+        )
+        self.assertEqual(quota.daily_budget, 1000)
+        self.assertEqual(quota.low_priority_streams, {"visits", "users"})
+
+    def test_counts_per_stream_in_state(self):
+        """Test calls are counted per stream and persisted in state."""
+        state = {}
+        quota = QuotaBudgeter(now=fixed_now())
+        quota.bind_state(state, {"prospect": "prospects"})
+
+        quota.record_call("prospect")
+        quota.record_call("prospect")
+        quota.record_call("visit")
+
+        self.assertEqual(
+            state["api_quota"],
+            {"date": "2024-06-15", "total": 3, "streams": {"prospects": 2, "visit": 1}},
+        )
+
+    def test_resumes_counts_from_same_day(self):
+        """Test counts from an earlier run today carry over."""
+        state = {"api_quota": {"date": "2024-06-15", "total": 5, "streams": {"prospects": 5}}}
+        quota = QuotaBudgeter(now=fixed_now())
+        quota.bind_state(state)
+        self.assertEqual(quota.total, 5)
+
+    def test_resets_counts_from_previous_day(self):
+        """Test counts from a previous day are discarded."""
+        state = {"api_quota": {"date": "2024-06-14", "total": 5, "streams": {"prospects": 5}}}
+        quota = QuotaBudgeter(now=fixed_now())
+        quota.bind_state(state)
+        self.assertEqual(quota.total, 0)
+        self.assertEqual(state["api_quota"]["date"], "2024-06-15")
+
+    def test_no_budget_never_paces(self):
+        """Test nothing is paced or deferred without a budget."""
+        sleep = MagicMock()
+        quota = QuotaBudgeter(now=fixed_now(), sleep=sleep)
+        for _ in range(10):
+            quota.before_call("prospect")
+            quota.record_call("prospect")
+        sleep.assert_not_called()
+
+    def test_paces_above_threshold(self):
+        """Test calls are spread over the rest of the day near the budget."""
+        sleep = MagicMock()
+        quota = QuotaBudgeter(daily_budget=10, pacing_threshold=0.5,
+                              max_pace_seconds=10000, now=fixed_now(), sleep=sleep)
+        quota.bind_state({})
+        for _ in range(4):
+            quota.record_call("prospect")
+        quota.before_call("prospect")
+        sleep.assert_not_called()
+
+        quota.record_call("prospect")
+        quota.before_call("prospect")
+        # 12 hours left in the day, 5 calls left in the budget
+        sleep.assert_called_once_with(12 * 3600 / 5)
+
+    def test_pacing_is_capped(self):
+        """Test a single pacing delay never exceeds max_pace_seconds."""
+        sleep = MagicMock()
+        quota = QuotaBudgeter(daily_budget=2, pacing_threshold=0.5,
+                              max_pace_seconds=3, now=fixed_now(), sleep=sleep)
+        quota.record_call("prospect")
+        quota.before_call("prospect")
+        sleep.assert_called_once_with(3)
+
+    def test_defers_low_priority_above_threshold(self):
+        """Test low-priority streams are deferred near the budget."""
+        quota = QuotaBudgeter(daily_budget=10, low_priority_streams=["visits"],
+                              pacing_threshold=0.5, now=fixed_now(), sleep=MagicMock())
+        quota.bind_state({}, {"visit": "visits"})
+        for _ in range(5):
+            quota.record_call("prospect")
+
+        with self.assertRaises(QuotaExhaustedError):
+            quota.before_call("visit")
+        quota.before_call("prospect")
+
+    def test_defers_everything_when_spent(self):
+        """Test every stream is deferred once the budget is spent."""
+        quota = QuotaBudgeter(daily_budget=2, now=fixed_now(), sleep=MagicMock())
+        quota.record_call("prospect")
+        quota.record_call("prospect")
+        with self.assertRaises(QuotaExhaustedError):
+            quota.before_call("prospect")
+
+
+class TestClientQuota(unittest.TestCase):
+    """Test Client charges requests to the budget."""
+
+    @patch("tap_pardot.client.Client._make_request")
+    def test_fetch_consults_and_charges_budget(self, mock_make_request):
+        """Test _fetch checks the budget and passes the endpoint down."""
+        mock_make_request.return_value = {"result": None}
+        with patch.object(Client, "__init__", lambda self, c: None):
+            client = Client(None)
+            client.creds = {"daily_api_call_budget": 1}
+            client.api_version = "4"
+            client.api_key = "key"
+
+        client.get("prospect")
+        self.assertEqual(mock_make_request.call_args[1]["endpoint"], "prospect")
+
+        client.quota.record_call("prospect")
+        with self.assertRaises(QuotaExhaustedError):
+            client.get("prospect")
+
+
+class TestSyncDefersStreams(unittest.TestCase):
+    """Test sync defers streams that run out of budget."""
+
+    @patch("tap_pardot.sync.MessageWriter.write_state")
+    @patch("tap_pardot.sync.MessageWriter.write_record")
+    @patch("tap_pardot.sync.MessageWriter.write_schema")
+    def test_deferred_stream_does_not_stop_sync(self, mock_write_schema, mock_write_record, mock_write_state):
+        """Test a deferred stream is skipped and later streams still sync."""
+        def get(endpoint, **params):
+            if endpoint == "visitorActivity":
+                raise QuotaExhaustedError("deferred")
+            if params.get("id_greater_than"):
+                return {"result": None}
+            return {"result": {"total_results": 1, "emailClick": [{"id": 1}]}}
+
+        client = MagicMock()
+        client.get.side_effect = get
+        entries = []
+        for stream_id in ("visitor_activities", "email_clicks"):
+            entry = MagicMock()
+            entry.tap_stream_id = stream_id
+            entry.schema.to_dict.return_value = {"type": "object", "properties": {"id": {"type": ["integer"]}}}
+            entry.metadata = []
+            entries.append(entry)
+        catalog = MagicMock()
+        catalog.get_selected_streams.return_value = entries
+        state = {}
+
+        sync(client, {"start_date": "2020-01-01T00:00:00Z"}, state, catalog)
+
+        mock_write_state.assert_any_call(state)
+        self.assertNotIn("visitor_activities", state.get("bookmarks", {}))
+        self.assertEqual(mock_write_record.call_count, 1)
+        self.assertEqual(mock_write_record.call_args[0][0], "email_clicks")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import io
+import json
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock
+
+from tap_pardot.scheduler import StreamScheduler
+from tap_pardot.writer import MessageWriter
+
+
+def catalog_stream(stream_id):
+    stream = MagicMock()
+    stream.tap_stream_id = stream_id
+    return stream
+
+
+def write_bookmark(state, stream_id, value):
+    state.setdefault("bookmarks", {})[stream_id] = {"id": value}
+
+
+class TestStreamScheduler(unittest.TestCase):
+    """Test concurrent stream scheduling and output ordering."""
+
+    def setUp(self):
+        self.stdout = io.StringIO()
+        self.writer = MessageWriter(max_bytes=0)
+
+    def messages(self):
+        return [json.loads(line) for line in self.stdout.getvalue().splitlines()]
+
+    def run_scheduler(self, streams, sync_stream, state=None, max_workers=2):
+        state = {} if state is None else state
+        with redirect_stdout(self.stdout):
+            StreamScheduler(self.writer, state, max_workers).run(streams, sync_stream)
+        return state
+
+    def test_streams_run_concurrently(self):
+        """Test a stream can finish while an earlier one is still running."""
+        slow_release = threading.Event()
+        finished = []
+
+        def sync_stream(stream, state, output):
+            if stream.tap_stream_id == "slow":
+                self.assertTrue(slow_release.wait(timeout=5))
+            else:
+                slow_release.set()
+            finished.append(stream.tap_stream_id)
+
+        self.run_scheduler([catalog_stream("slow"), catalog_stream("fast")], sync_stream)
+        self.assertEqual(["fast", "slow"], finished)
+
+    def test_state_only_carries_written_bookmarks(self):
+        """Test STATE never includes bookmarks for records still buffered."""
+        slow_has_bookmark = threading.Event()
+        fast_done = threading.Event()
+
+        def sync_stream(stream, state, output):
+            stream_id = stream.tap_stream_id
+            output.write_record(stream_id, {"id": 1})
+            write_bookmark(state, stream_id, 1)
+            if stream_id == "slow":
+                slow_has_bookmark.set()
+                self.assertTrue(fast_done.wait(timeout=5))
+            else:
+                self.assertTrue(slow_has_bookmark.wait(timeout=5))
+            output.write_state(state)
+            if stream_id == "fast":
+                fast_done.set()
+
+        self.run_scheduler([catalog_stream("slow"), catalog_stream("fast")], sync_stream)
+
+        messages = self.messages()
+        seen_records = set()
+        for message in messages:
+            if message["type"] == "RECORD":
+                seen_records.add(message["stream"])
+            elif message["type"] == "STATE":
+                for stream_id in message["value"].get("bookmarks", {}):
+                    self.assertIn(stream_id, seen_records)
+        self.assertEqual(
+            {"slow": {"id": 1}, "fast": {"id": 1}}, messages[-1]["value"]["bookmarks"]
+        )
+
+    def test_currently_syncing_is_first_unfinished_stream(self):
+        """Test currently_syncing stays on an unfinished earlier stream."""
+        slow_release = threading.Event()
+
+        def sync_stream(stream, state, output):
+            if stream.tap_stream_id == "slow":
+                self.assertTrue(slow_release.wait(timeout=5))
+                return
+            write_bookmark(state, "fast", 5)
+            output.write_state(state)
+            slow_release.set()
+
+        state = self.run_scheduler(
+            [catalog_stream("slow"), catalog_stream("fast")], sync_stream
+        )
+
+        states = [m["value"] for m in self.messages() if m["type"] == "STATE"]
+        self.assertEqual("slow", states[0]["currently_syncing"])
+        self.assertIsNone(states[-1]["currently_syncing"])
+        self.assertIsNone(state["currently_syncing"])
+
+    def test_failure_stops_other_streams_and_raises(self):
+        """Test an error in one stream cancels the rest and is raised."""
+        started = threading.Event()
+
+        def sync_stream(stream, state, output):
+            if stream.tap_stream_id == "broken":
+                self.assertTrue(started.wait(timeout=5))
+                raise RuntimeError("boom")
+            started.set()
+            while True:
+                output.write_record(stream.tap_stream_id, {"id": 1})
+
+        with self.assertRaises(RuntimeError):
+            self.run_scheduler(
+                [catalog_stream("broken"), catalog_stream("endless"), catalog_stream("never")],
+                sync_stream,
+            )
+
+        self.assertNotIn(
+            "never", {m.get("stream") for m in self.messages()}
+        )
@@ -92,6 +92,9 @@ class TestStreamBase(unittest.TestCase):
             self.state["bookmarks"]["prospects"]["updated_at"],
             "2021-07-01T00:00:00Z",
         )
+        # STATE is only emitted when the checkpointer flushes
+        mock_write_state.assert_not_called()
+        stream.checkpointer.flush()
         mock_write_state.assert_called_once_with(self.state)
 
     @patch("singer.write_state")
@@ -99,6 +102,7 @@ class TestStreamBase(unittest.TestCase):
         """Test update_bookmark doesn't emit state when emit=False."""
         stream = Prospects(self.client, self.config, self.state, emit=False)
         stream.update_bookmark("2021-07-01T00:00:00Z")
+        stream.checkpointer.flush()
 
         mock_write_state.assert_not_called()
 
@@ -250,6 +254,109 @@ class TestUpdatedAtReplicationStream(unittest.TestCase):
         )
 
 
+class FakeProspectApi:
+    """Serves prospects filtered and paged like Pardot's query endpoint.
+
+    Ties on updated_at come back in descending id order, so nothing relies on
+    ids being sorted within an updated_at.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.requests = []
+
+    def get(self, endpoint, **params):
+        self.requests.append(params)
+        matching = [
+            rec for rec in self.records
+            if rec["updated_at"] > params["updated_after"]
+            and rec["updated_at"] < params.get("updated_before", "9999")
+            and rec["id"] > params.get("id_greater_than", 0)
+        ]
+        if params["sort_by"] == "id":
+            matching.sort(key=lambda rec: rec["id"])
+        else:
+            matching.sort(key=lambda rec: (rec["updated_at"], -rec["id"]))
+        if not matching:
+            return {"result": {"total_results": 0}}
+        return {"result": {"total_results": len(matching), "prospect": matching[:200]}}
+
+
+class TestUpdatedAtCompoundCursor(unittest.TestCase):
+    """Test paging through records that share an updated_at."""
+
+    def setUp(self):
+        tie = "2021-03-01 00:00:00"
+        self.records = (
+            [{"id": index, "updated_at": "2021-02-01 00:00:{:02d}".format(index)}
+             for index in range(1, 51)]
+            + [{"id": index, "updated_at": tie} for index in range(51, 501)]
+            + [{"id": index, "updated_at": "2021-04-01 00:00:{:02d}".format(index - 500)}
+               for index in range(501, 531)]
+        )
+        self.api = FakeProspectApi(self.records)
+
+    def sync(self, state):
+        client = MagicMock()
+        client.get.side_effect = self.api.get
+        stream = Prospects(client, {"start_date": "2021-01-01T00:00:00Z"}, state)
+        return [rec["id"] for rec in stream.sync()]
+
+    @patch("singer.write_state")
+    def test_tie_block_larger_than_a_page(self, mock_write_state):
+        """Test every record is emitted once and ties are paged by id."""
+        state = {}
+        ids = self.sync(state)
+
+        self.assertCountEqual(range(1, 531), ids)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertLessEqual(len(self.api.requests), 6)
+        tie_requests = [params for params in self.api.requests if params["sort_by"] == "id"]
+        self.assertEqual([0, 250, 450], [params["id_greater_than"] for params in tie_requests])
+        self.assertEqual(
+            {"updated_at": "2021-04-01 00:00:30"}, state["bookmarks"]["prospects"]
+        )
+
+    @patch("singer.write_state")
+    def test_resumes_inside_tie_block(self, mock_write_state):
+        """Test a persisted (updated_at, id) cursor picks up after that id."""
+        state = {"bookmarks": {"prospects": {"updated_at": "2021-03-01 00:00:00", "id": 400}}}
+        ids = self.sync(state)
+
+        self.assertEqual(list(range(401, 531)), ids)
+        self.assertNotIn("id", state["bookmarks"]["prospects"])
+
+    @patch("singer.write_state")
+    def test_tie_page_of_neighbours_moves_id_cursor(self, mock_write_state):
+        """Test a tie page holding only records from the seconds around the
+        tie still moves the id cursor, instead of stopping the sync there."""
+        tie = "2021-03-01 00:00:00"
+        self.api.records = (
+            [{"id": index, "updated_at": "2021-03-01 00:00:01"} for index in range(1, 201)]
+            + [{"id": index, "updated_at": tie} for index in range(201, 451)]
+        )
+        get = self.api.get
+
+        def inclusive_window(endpoint, **params):
+            # Pardot may count records at either end of the window.
+            if "updated_before" in params:
+                params = dict(
+                    params, updated_after="2021-02-28 23:59:58", updated_before="2021-03-01 00:00:02"
+                )
+            return get(endpoint, **params)
+
+        client = MagicMock()
+        client.get.side_effect = inclusive_window
+        state = {}
+        stream = Prospects(client, {"start_date": "2021-01-01T00:00:00Z"}, state)
+        ids = [rec["id"] for rec in stream.sync()]
+
+        self.assertCountEqual(range(1, 451), ids)
+        self.assertEqual(
+            {"updated_at": "2021-03-01 00:00:01"}, state["bookmarks"]["prospects"]
+        )
+
+
 class TestNoUpdatedAtSortingStream(unittest.TestCase):
     """Test NoUpdatedAtSortingStream class."""
 
@@ -547,6 +654,47 @@ class TestVisitsStream(unittest.TestCase):
         self.assertEqual(len(record["visitor_page_views"]["visitor_page_view"]), 2)
 
 
+class TestListMembershipsScan(unittest.TestCase):
+    """Test scanning memberships of every list at once."""
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.get.return_value = {
+            "result": {
+                "total_results": 2,
+                "list": [
+                    {"id": 1, "updated_at": "2021-01-01 00:00:00"},
+                    {"id": 2, "updated_at": "2021-01-02 00:00:00"},
+                ],
+            }
+        }
+        self.client.post.return_value = {
+            "result": {
+                "total_results": 3,
+                "list_membership": [
+                    {"id": 10, "list_id": 1, "updated_at": "2021-02-01 00:00:00"},
+                    {"id": 11, "list_id": 3, "updated_at": "2021-02-03 00:00:00"},
+                    {"id": 12, "list_id": 2, "updated_at": "2021-02-02 00:00:00"},
+                ],
+            }
+        }
+        self.config = {"start_date": "2020-01-01T00:00:00Z", "list_memberships_scan": "true"}
+        self.state = {"bookmarks": {}}
+
+    @patch("singer.write_state")
+    def test_one_scan_filtered_to_parent_lists(self, mock_write_state):
+        """Test memberships come from one query and only for the parent's lists."""
+        stream = ListMemberships(self.client, self.config, self.state)
+        records = list(stream.sync())
+
+        self.assertEqual([10, 12], [rec["id"] for rec in records])
+        self.client.post.assert_called_once()
+        self.assertNotIn("list_id", self.client.post.call_args[1])
+        self.assertEqual(
+            {"updated_at": "2021-02-02 00:00:00"}, self.state["bookmarks"]["list_memberships"]
+        )
+
+
 class TestComplexBookmarkStream(unittest.TestCase):
     """Test ComplexBookmarkStream class."""
 
@@ -633,6 +781,143 @@ class TestFullSync(unittest.TestCase):
 
         self.assertEqual(len(records), 2)
 
+    @patch("singer.write_state")
+    def test_sync_emits_state_per_page_after_records(self, mock_write_state):
+        """Test STATE is emitted once per page, after the page's records."""
+        self.client.get.side_effect = [
+            {
+                "result": {
+                    "total_results": 2,
+                    "prospect": [
+                        {"id": 1, "updated_at": "2021-01-01 00:00:00"},
+                        {"id": 2, "updated_at": "2021-01-02 00:00:00"},
+                    ],
+                }
+            },
+            {"result": None},
+        ]
+        stream = Prospects(self.client, self.config, self.state)
+        sync_iter = stream.sync()
+
+        next(sync_iter)
+        next(sync_iter)
+        mock_write_state.assert_not_called()
+
+        self.assertEqual(list(sync_iter), [])
+        mock_write_state.assert_called_once_with(self.state)
+
+    @patch("singer.write_state")
+    def test_sync_stops_after_page_reaching_total_results(self, mock_write_state):
+        """Test no request follows a page that reaches total_results."""
+        self.client.get.side_effect = [
+            {"result": {"total_results": 3, "emailClick": [{"id": 1}, {"id": 2}]}},
+            {"result": {"total_results": 1, "emailClick": {"id": 3}}},
+        ]
+        stream = EmailClicks(self.client, self.config, self.state)
+        records = list(stream.sync())
+
+        self.assertEqual([1, 2, 3], [rec["id"] for rec in records])
+        self.assertEqual(2, self.client.get.call_count)
+
+    @patch("singer.write_state")
+    def test_sync_without_total_results_stops_after_short_page(self, mock_write_state):
+        """Test a full page without total_results is followed by another request."""
+        full_page = [{"id": _id} for _id in range(1, 201)]
+        self.client.get.side_effect = [
+            {"result": {"emailClick": full_page}},
+            {"result": {"emailClick": [{"id": 201}]}},
+        ]
+        stream = EmailClicks(self.client, self.config, self.state)
+        records = list(stream.sync())
+
+        self.assertEqual(201, len(records))
+        self.assertEqual(2, self.client.get.call_count)
+
+    @patch("singer.write_state")
+    def test_child_sync_stops_after_last_page_of_each_batch(self, mock_write_state):
+        """Test visits and visitors are only requested until their last page."""
+        self.client.get.return_value = {
+            "result": {
+                "total_results": 1,
+                "visitor": {"id": 7, "updated_at": "2021-01-01 00:00:00"},
+            }
+        }
+        self.client.post.return_value = {
+            "result": {
+                "total_results": 1,
+                "visit": {
+                    "id": 70,
+                    "updated_at": "2021-01-02 00:00:00",
+                    "visitor_page_views": {"visitor_page_view": {"id": 700}},
+                },
+            }
+        }
+        stream = Visits(self.client, self.config, self.state)
+        records = list(stream.sync())
+
+        self.assertEqual([70], [rec["id"] for rec in records])
+        self.assertEqual(1, self.client.get.call_count)
+        self.assertEqual(1, self.client.post.call_count)
+
+
+class TestFieldProjection(unittest.TestCase):
+    """Test records are cut to the selected fields as pages arrive."""
+
+    def setUp(self):
+        self.config = {"start_date": "2021-01-01T00:00:00Z", "prefetch_pages": 1}
+        self.client = MagicMock()
+
+    @patch("singer.write_state")
+    def test_pages_keep_selected_and_needed_fields(self, mock_write_state):
+        """Test unselected fields are dropped and sync's own fields are kept."""
+        records = [
+            {"id": index, "updated_at": "2021-02-01 00:00:{:02d}".format(index),
+             "email": "p{}@example.com".format(index), "custom_{}".format(index): "x",
+             "score": index}
+            for index in range(1, 4)
+        ]
+        self.client.get.return_value = {"result": {"total_results": 3, "prospect": records}}
+        stream = Prospects(self.client, self.config, {})
+        stream.selected_fields = ["email"]
+
+        self.assertEqual(
+            [{"id": index, "updated_at": "2021-02-01 00:00:{:02d}".format(index),
+              "email": "p{}@example.com".format(index)} for index in range(1, 4)],
+            list(stream.sync()),
+        )
+
+    def test_unset_selection_keeps_whole_records(self):
+        """Test streams synced as another stream's parent aren't projected."""
+        page = {"result": {"total_results": 1, "prospect": {"id": 1, "extra": True}}}
+        stream = Prospects(self.client, self.config, {})
+        self.assertEqual({"id": 1, "extra": True}, stream._project_page(page)["result"]["prospect"])
+
+    @patch("singer.write_state")
+    def test_visits_keep_page_views(self, mock_write_state):
+        """Test fields a stream fixes up itself survive projection."""
+        self.client.get.return_value = {
+            "result": {"total_results": 1, "visitor": {"id": 7, "updated_at": "2021-01-05 00:00:00"}}
+        }
+        self.client.post.return_value = {
+            "result": {
+                "total_results": 1,
+                "visit": {
+                    "id": 70,
+                    "updated_at": "2021-01-06 00:00:00",
+                    "visitor_page_views": {"visitor_page_view": {"id": 700}},
+                    "duration_in_seconds": 12,
+                },
+            }
+        }
+        stream = Visits(self.client, self.config, {"bookmarks": {}})
+        stream.selected_fields = ["id"]
+
+        self.assertEqual(
+            [{"id": 70, "updated_at": "2021-01-06 00:00:00",
+              "visitor_page_views": {"visitor_page_view": [{"id": 700}]}}],
+            list(stream.sync()),
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
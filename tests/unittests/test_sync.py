@@ -7,8 +7,8 @@ from tap_pardot.sync import sync
 class TestSync(unittest.TestCase):
     """Test sync function."""
 
-    @patch("tap_pardot.sync.singer.write_record")
-    @patch("tap_pardot.sync.singer.write_schema")
+    @patch("tap_pardot.sync.MessageWriter.write_record")
+    @patch("tap_pardot.sync.MessageWriter.write_schema")
     @patch("tap_pardot.sync.Transformer")
     def test_sync_calls_write_schema(self, mock_transformer_cls, mock_write_schema, mock_write_record):
         """Test sync writes schema for selected streams."""
@@ -44,8 +44,8 @@ class TestSync(unittest.TestCase):
             ["updated_at"],
         )
 
-    @patch("tap_pardot.sync.singer.write_record")
-    @patch("tap_pardot.sync.singer.write_schema")
+    @patch("tap_pardot.sync.MessageWriter.write_record")
+    @patch("tap_pardot.sync.MessageWriter.write_schema")
     @patch("tap_pardot.sync.Transformer")
     def test_sync_writes_records(self, mock_transformer_cls, mock_write_schema, mock_write_record):
         """Test sync writes records for selected streams."""
@@ -82,8 +82,8 @@ class TestSync(unittest.TestCase):
         written_records = [call[0][1] for call in mock_write_record.call_args_list]
         self.assertEqual(written_records, [{"id": 1}, {"id": 2}, {"id": 3}])
 
-    @patch("tap_pardot.sync.singer.write_record")
-    @patch("tap_pardot.sync.singer.write_schema")
+    @patch("tap_pardot.sync.MessageWriter.write_record")
+    @patch("tap_pardot.sync.MessageWriter.write_schema")
     @patch("tap_pardot.sync.Transformer")
     def test_sync_multiple_streams(self, mock_transformer_cls, mock_write_schema, mock_write_record):
         """Test sync processes multiple selected streams."""
@@ -124,8 +124,43 @@ class TestSync(unittest.TestCase):
         self.assertEqual(mock_write_schema.call_count, 2)
         self.assertEqual(mock_write_record.call_count, 2)
 
-    @patch("tap_pardot.sync.singer.write_record")
-    @patch("tap_pardot.sync.singer.write_schema")
+    @patch("tap_pardot.sync.MessageWriter.write_record")
+    @patch("tap_pardot.sync.MessageWriter.write_schema")
+    @patch("tap_pardot.sync.metadata.to_map")
+    @patch("tap_pardot.sync.Transformer")
+    def test_sync_builds_transform_context_once(self, mock_transformer_cls, mock_to_map, mock_write_schema, mock_write_record):
+        """Test schema and metadata are built once per stream, not per record."""
+        mock_transformer = MagicMock()
+        mock_transformer_cls.return_value.__enter__ = MagicMock(return_value=mock_transformer)
+        mock_transformer_cls.return_value.__exit__ = MagicMock(return_value=False)
+        mock_transformer.transform.side_effect = lambda rec, schema, mdata: rec
+        mock_to_map.return_value = {(): {"selected": True}}
+
+        mock_catalog = MagicMock()
+        mock_stream = MagicMock()
+        mock_stream.tap_stream_id = "campaigns"
+        schema = {"type": "object", "properties": {"id": {"type": ["integer"]}}}
+        mock_stream.schema.to_dict.return_value = schema
+        mock_stream.metadata = []
+        mock_catalog.get_selected_streams.return_value = [mock_stream]
+
+        with patch("tap_pardot.sync.STREAM_OBJECTS") as mock_stream_objects:
+            mock_stream_instance = MagicMock()
+            mock_stream_instance.key_properties = ["id"]
+            mock_stream_instance.replication_keys = ["id"]
+            mock_stream_instance.sync.return_value = iter([{"id": 1}, {"id": 2}, {"id": 3}])
+            mock_stream_objects.get.return_value = MagicMock(return_value=mock_stream_instance)
+
+            sync(MagicMock(), {"start_date": "2020-01-01T00:00:00Z"}, {}, mock_catalog)
+
+        mock_stream.schema.to_dict.assert_called_once()
+        mock_to_map.assert_called_once()
+        for call in mock_transformer.transform.call_args_list:
+            self.assertIs(call[0][1], schema)
+            self.assertIs(call[0][2], mock_to_map.return_value)
+
+    @patch("tap_pardot.sync.MessageWriter.write_record")
+    @patch("tap_pardot.sync.MessageWriter.write_schema")
     @patch("tap_pardot.sync.Transformer")
     def test_sync_no_selected_streams(self, mock_transformer_cls, mock_write_schema, mock_write_record):
         """Test sync does nothing when no streams are selected."""
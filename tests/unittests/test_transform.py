@@ -0,0 +1,145 @@
+import copy
+import json
+import os
+import unittest
+
+from singer import Transformer, metadata
+from singer.transform import SchemaMismatch
+
+from tap_pardot.transform import compile_transformer
+
+SCHEMAS_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "..", "tap_pardot", "schemas"
+)
+
+DYNAMIC_FIELD = {
+    "type": ["null", "string", "object"],
+    "properties": {"value": {"type": ["null", "integer", "string"]}},
+}
+
+
+def load_schema(stream_name):
+    with open(os.path.join(SCHEMAS_DIR, stream_name + ".json")) as schema_file:
+        return json.load(schema_file)
+
+
+def standard_metadata(schema, unselected=()):
+    mdata = metadata.to_map(
+        metadata.get_standard_metadata(
+            schema=schema, key_properties=["id"], valid_replication_keys=["id"]
+        )
+    )
+    for field in unselected:
+        mdata[("properties", field)]["selected"] = False
+    return mdata
+
+
+def sample_value(field_schema, seed):
+    types = field_schema.get("type", [])
+    if not isinstance(types, list):
+        types = [types]
+    if field_schema.get("format") == "date-time":
+        return "2024-01-{:02d} 10:{:02d}:00".format(seed % 28 + 1, seed % 60)
+    if "integer" in types:
+        return str(seed) if seed % 2 else seed
+    if "number" in types:
+        return "{}.5".format(seed)
+    if "boolean" in types:
+        return ["true", "false", True, 0][seed % 4]
+    if "array" in types:
+        return [{"id": str(seed), "created_at": "2024-01-01 00:00:00"}]
+    if "object" in types:
+        return {"visitor_page_view": [{"id": seed, "url": "https://example.com"}]}
+    return "value {}".format(seed)
+
+
+def sample_records(schema, count=5):
+    return [
+        {name: sample_value(field_schema, seed) for name, field_schema in schema["properties"].items()}
+        for seed in range(1, count + 1)
+    ]
+
+
+class TestCompiledTransformerParity(unittest.TestCase):
+    """Compiled transformers must produce exactly what singer.Transformer does."""
+
+    def assert_parity(self, records, schema, mdata):
+        with Transformer() as expected_transformer, Transformer() as actual_transformer:
+            transform = compile_transformer(copy.deepcopy(schema), mdata, actual_transformer)
+            for record in records:
+                expected = expected_transformer.transform(
+                    copy.deepcopy(record), copy.deepcopy(schema), mdata
+                )
+                actual = transform(copy.deepcopy(record))
+                self.assertEqual(expected, actual)
+                self.assertEqual(list(expected), list(actual))
+            self.assertEqual(expected_transformer.filtered, actual_transformer.filtered)
+            self.assertEqual(expected_transformer.removed, actual_transformer.removed)
+
+    def test_every_stream_schema(self):
+        """Test generated Pardot-format records for every schema."""
+        for schema_file in sorted(os.listdir(SCHEMAS_DIR)):
+            stream_name = schema_file[: -len(".json")]
+            with self.subTest(stream=stream_name):
+                schema = load_schema(stream_name)
+                self.assert_parity(sample_records(schema), schema, standard_metadata(schema))
+
+    def test_dynamic_fields(self):
+        """Test prospect_account custom fields holding strings, dicts and blanks."""
+        schema = load_schema("prospect_accounts")
+        schema["properties"]["custom_a"] = copy.deepcopy(DYNAMIC_FIELD)
+        schema["properties"]["custom_b"] = copy.deepcopy(DYNAMIC_FIELD)
+        records = [
+            {"id": 1, "custom_a": "plain", "custom_b": {"value": "12"}},
+            {"id": 2, "custom_a": {"value": ["a", "b"]}, "custom_b": None},
+            {"id": 3, "custom_a": "", "custom_b": 7},
+        ]
+        self.assert_parity(records, schema, standard_metadata(schema))
+
+    def test_datetime_shapes(self):
+        """Test the datetime formats Pardot and bookmarks use, plus odd ones."""
+        schema = load_schema("prospects")
+        values = [
+            "2024-06-15 10:00:00",
+            "2024-06-15T10:00:00Z",
+            "2024-06-15T10:00:00.123456+02:00",
+            "2024-06-15 10:00:00.123",
+            "2024-06-15",
+            "June 15 2024",
+            "",
+            None,
+        ]
+        records = [{"id": index, "updated_at": value} for index, value in enumerate(values)]
+        self.assert_parity(records, schema, standard_metadata(schema))
+
+    def test_unselected_and_unknown_fields(self):
+        """Test unselected fields are filtered and unknown fields removed."""
+        schema = load_schema("campaigns")
+        mdata = standard_metadata(schema, unselected=["name"])
+        records = [{"id": 1, "name": "dropped", "cost": "3", "not_in_schema": "x"}]
+        self.assert_parity(records, schema, mdata)
+
+        with Transformer() as transformer:
+            transform = compile_transformer(schema, mdata, transformer)
+            self.assertEqual({"id": 1, "cost": 3}, transform(records[0]))
+            self.assertEqual({"name"}, transformer.filtered)
+            self.assertEqual({"not_in_schema"}, transformer.removed)
+
+    def test_mismatch_raises_like_singer(self):
+        """Test a value matching none of its types raises SchemaMismatch."""
+        schema = load_schema("campaigns")
+        mdata = standard_metadata(schema)
+        record = {"id": "not a number", "name": "x"}
+
+        with Transformer() as transformer:
+            with self.assertRaises(SchemaMismatch) as expected:
+                transformer.transform(copy.deepcopy(record), copy.deepcopy(schema), mdata)
+            expected_errors = len(transformer.errors)
+
+        with Transformer() as transformer:
+            transform = compile_transformer(schema, mdata, transformer)
+            with self.assertRaises(SchemaMismatch) as actual:
+                transform(copy.deepcopy(record))
+            self.assertEqual(expected_errors, len(transformer.errors))
+
+        self.assertEqual(str(expected.exception), str(actual.exception))
@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+import tap_pardot
+from tap_pardot.client import Client
+from tap_pardot.streams import STREAM_OBJECTS, Prospects
+from tap_pardot.sync import _uses_v5
+from tap_pardot.v5 import from_v5_record, to_camel, to_snake, v5_field_map
+
+BASE = datetime(2024, 1, 1)
+
+# Fields of the v5 prospect object.
+V5_PROSPECT_FIELDS = {
+    "id", "campaignId", "salutation", "firstName", "lastName", "email", "company",
+    "prospectAccountId", "website", "jobTitle", "department", "country", "addressOne",
+    "addressTwo", "city", "state", "territory", "zip", "phone", "fax", "source",
+    "annualRevenue", "employees", "industry", "yearsInBusiness", "comments", "notes",
+    "score", "grade", "lastActivityAt", "recentInteraction", "salesforceLeadId",
+    "salesforceContactId", "salesforceOwnerId", "salesforceAccountId", "salesforceId",
+    "salesforceLastSync", "salesforceUrl", "isDoNotEmail", "isDoNotCall", "optedOut",
+    "isReviewed", "isStarred", "createdAt", "updatedAt",
+}
+
+
+def _schema(stream_name):
+    path = os.path.join(os.path.dirname(tap_pardot.__file__), "schemas", stream_name + ".json")
+    with open(path) as schema_file:
+        return json.load(schema_file)
+
+
+def prospect(index):
+    updated_at = BASE + timedelta(minutes=index // 2)
+    return {
+        "id": index,
+        "email": "prospect{}@example.com".format(index),
+        "firstName": "Prospect {}".format(index),
+        "updatedAt": updated_at.strftime("%Y-%m-%dT%H:%M:%S-04:00"),
+    }
+
+
+class StandInV5Handler(BaseHTTPRequestHandler):
+    """Answers /api/v5/objects/prospects like Pardot's v5 query endpoint."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append((url.path, params))
+        if url.path != "/api/v5/objects/prospects" or self.headers["Authorization"] != "Bearer token":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        if "nextPageToken" in params:
+            query = self.server.tokens[params["nextPageToken"]]
+        else:
+            query = dict(params, offset=0)
+        if "updatedAtAfterOrEqualTo" in query:
+            matching = [
+                rec for rec in self.server.records
+                if rec["updatedAt"][:19] >= query["updatedAtAfterOrEqualTo"]
+            ]
+        else:
+            matching = [
+                rec for rec in self.server.records
+                if rec["updatedAt"][:19] > query["updatedAtAfter"]
+            ]
+        offset, limit = query["offset"], int(query["limit"])
+        fields = query["fields"].split(",")
+        unknown = [name for name in fields if name not in V5_PROSPECT_FIELDS]
+        if unknown:
+            self.send_response(400)
+            self.end_headers()
+            return
+        body = {
+            "values": [
+                {name: rec.get(name) for name in fields} for rec in matching[offset:offset + limit]
+            ]
+        }
+        if offset + limit < len(matching):
+            token = "page-{}".format(len(self.server.tokens))
+            self.server.tokens[token] = dict(query, offset=offset + limit)
+            body["nextPageToken"] = token
+
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestV5Names(unittest.TestCase):
+    """Test mapping between schema and v5 field names."""
+
+    def test_names_round_trip(self):
+        """Test snake_case and camelCase map onto each other."""
+        self.assertEqual("prospectAccountId", to_camel("prospect_account_id"))
+        self.assertEqual("prospect_account_id", to_snake("prospectAccountId"))
+
+    def test_records_look_like_bulk_output(self):
+        """Test v5 records get snake_case keys and v3/v4 datetimes."""
+        self.assertEqual(
+            {"id": 1, "updated_at": "2024-01-01 10:00:00", "first_name": "A"},
+            from_v5_record({"id": 1, "updatedAt": "2024-01-01T10:00:00-04:00", "firstName": "A"}),
+        )
+
+    def test_schema_fields_map_to_v5_fields(self):
+        """Test every schema field of a v5 stream maps to a v5 field, other
+        than the few v5 doesn't have, which are left out."""
+        expected_missing = {
+            "prospects": ["password"],
+            "lists": ["is_crm_visible"],
+            "visitor_activities": ["campaign"],
+            "visitors": [],
+        }
+        for stream_name, stream_class in STREAM_OBJECTS.items():
+            if stream_class.v5_object is None:
+                continue
+            with self.subTest(stream=stream_name):
+                fields = list(_schema(stream_name)["properties"])
+                field_map = v5_field_map(stream_name, fields)
+                self.assertEqual(
+                    expected_missing[stream_name],
+                    [name for name in fields if name not in field_map],
+                )
+
+        field_map = v5_field_map("prospects", list(_schema("prospects")["properties"]))
+        self.assertLessEqual(set(field_map.values()), V5_PROSPECT_FIELDS)
+        self.assertEqual("salesforceLeadId", field_map["crm_lead_fid"])
+        self.assertEqual(
+            {"crm_url": "https://example.my.salesforce.com/00Q1"},
+            from_v5_record({"salesforceUrl": "https://example.my.salesforce.com/00Q1"},
+                           {"salesforceUrl": "crm_url"}),
+        )
+
+
+class TestV5Sync(unittest.TestCase):
+    """Test syncing a stream from a local stand-in for the v5 API."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInV5Handler)
+        self.server.records = [prospect(index) for index in range(1, 2501)]
+        self.server.requests = []
+        self.server.tokens = {}
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        creds = {
+            "refresh_token": "refresh",
+            "client_id": "id",
+            "client_secret": "secret",
+            "pardot_business_unit_id": "0Uv000000000001",
+            "access_token": "token",
+        }
+        with patch.object(Client, "__init__", lambda self, c: None):
+            self.client = Client(None)
+        self.client.creds = creds
+        self.client.api_version = "4"
+        self.client.endpoint_base = "http://127.0.0.1:{}/api/".format(self.server.server_port)
+        self.addCleanup(self.client.close)
+        self.config = {"start_date": "2024-01-01T00:00:00Z"}
+
+    def sync(self, state):
+        stream = Prospects(self.client, self.config, state, emit=False)
+        stream.selected_fields = ["id", "email"]
+        return list(stream.sync_v5())
+
+    def test_pages_by_token_with_selected_fields(self):
+        """Test one token-paged query fetches only the selected fields."""
+        state = {}
+        records = self.sync(state)
+
+        self.assertEqual(2499, len(records))
+        self.assertEqual(
+            {"id": 2, "email": "prospect2@example.com", "updated_at": "2024-01-01 00:01:00"},
+            records[0],
+        )
+        first, *rest = [params for _, params in self.server.requests]
+        self.assertEqual(3, 1 + len(rest))
+        self.assertEqual("id,email,updatedAt", first["fields"])
+        self.assertEqual("1000", first["limit"])
+        self.assertEqual("updatedAt ASC", first["orderBy"])
+        self.assertTrue(all(list(params) == ["nextPageToken"] for params in rest))
+        self.assertEqual(
+            {"updated_at": "2024-01-01 20:50:00"}, state["bookmarks"]["prospects"]
+        )
+
+    def test_full_schema_selection(self):
+        """Test selecting every schema field asks only for fields v5 has and
+        maps renamed ones back to their schema names."""
+        self.server.records[1]["salesforceLeadId"] = "00Q000000000001"
+        stream = Prospects(self.client, self.config, {}, emit=False)
+        stream.selected_fields = list(_schema("prospects")["properties"])
+        records = list(stream.sync_v5())
+
+        self.assertEqual(2499, len(records))
+        self.assertEqual("00Q000000000001", records[0]["crm_lead_fid"])
+        self.assertNotIn("password", records[0])
+        fields = self.server.requests[0][1]["fields"].split(",")
+        self.assertIn("salesforceUrl", fields)
+        self.assertNotIn("crmUrl", fields)
+
+    def test_resumes_inside_v3_tie_block(self):
+        """Test ties an interrupted v3/v4 sync already emitted are skipped."""
+        state = {"bookmarks": {"prospects": {"updated_at": "2024-01-01 20:49:00", "id": 2498}}}
+        records = self.sync(state)
+
+        self.assertEqual([2499, 2500], [rec["id"] for rec in records])
+        self.assertEqual(
+            {"updated_at": "2024-01-01 20:50:00"}, state["bookmarks"]["prospects"]
+        )
+
+
+class TestUsesV5(unittest.TestCase):
+    """Test which streams sync from the v5 API."""
+
+    def test_opt_in_per_stream_with_oauth(self):
+        """Test only listed v5-capable streams with OAuth credentials use v5."""
+        client = MagicMock()
+        config = {"v5_streams": "prospects,visits"}
+        self.assertTrue(_uses_v5(client, config, "prospects"))
+        self.assertFalse(_uses_v5(client, config, "visits"))
+        self.assertFalse(_uses_v5(client, config, "lists"))
+
+        client.has_oauth_values.return_value = False
+        self.assertFalse(_uses_v5(client, config, "prospects"))
@@ -0,0 +1,101 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+
+import singer
+
+from tap_pardot.jsoncodec import STDLIB, JsonCodec
+from tap_pardot.writer import MessageWriter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMessageWriter(unittest.TestCase):
+    """Test batching of Singer messages written to stdout."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stdout = io.StringIO()
+
+    def lines(self):
+        return [json.loads(line) for line in self.stdout.getvalue().splitlines()]
+
+    def test_records_are_buffered_until_flush(self):
+        """Test nothing is written before the buffer fills or is flushed."""
+        writer = MessageWriter(max_bytes=10000, max_seconds=60, clock=self.clock)
+        with redirect_stdout(self.stdout):
+            writer.write_record("campaigns", {"id": 1})
+            writer.write_record("campaigns", {"id": 2})
+            self.assertEqual("", self.stdout.getvalue())
+
+            writer.flush()
+
+        self.assertEqual([1, 2], [line["record"]["id"] for line in self.lines()])
+
+    def test_flushes_when_buffer_is_full(self):
+        """Test the buffer is written once it reaches max_bytes."""
+        writer = MessageWriter(max_bytes=100, max_seconds=60, clock=self.clock)
+        with redirect_stdout(self.stdout):
+            writer.write_record("campaigns", {"id": 1, "name": "x" * 100})
+
+        self.assertEqual(1, len(self.lines()))
+
+    def test_flushes_after_max_seconds(self):
+        """Test the buffer is written once max_seconds have passed."""
+        writer = MessageWriter(max_bytes=10000, max_seconds=5, clock=self.clock)
+        with redirect_stdout(self.stdout):
+            writer.write_record("campaigns", {"id": 1})
+            self.clock.now = 5
+            writer.write_record("campaigns", {"id": 2})
+
+        self.assertEqual(2, len(self.lines()))
+
+    def test_state_forces_flush_after_its_records(self):
+        """Test STATE is written immediately, after the records before it."""
+        writer = MessageWriter(max_bytes=10000, max_seconds=60, clock=self.clock)
+        state = {"bookmarks": {"campaigns": {"id": 2}}}
+        with redirect_stdout(self.stdout):
+            writer.write_schema("campaigns", {"type": "object"}, ["id"], ["id"])
+            writer.write_record("campaigns", {"id": 1})
+            writer.write_record("campaigns", {"id": 2})
+            writer.write_state(state)
+            # Later changes to the state dict must not leak into what was written.
+            state["bookmarks"]["campaigns"]["id"] = 3
+
+        self.assertEqual(
+            ["SCHEMA", "RECORD", "RECORD", "STATE"],
+            [line["type"] for line in self.lines()],
+        )
+        self.assertEqual({"bookmarks": {"campaigns": {"id": 2}}}, self.lines()[-1]["value"])
+
+    def test_output_matches_singer(self):
+        """Test messages are rendered exactly as singer renders them."""
+        writer = MessageWriter(codec=JsonCodec(STDLIB), clock=self.clock)
+        with redirect_stdout(self.stdout):
+            with writer:
+                writer.write_schema("users", {"type": "object"}, ["id"])
+                writer.write_record("users", {"id": 1, "email": "a@example.com"})
+                writer.write_state({"bookmarks": {}})
+
+        expected = io.StringIO()
+        with redirect_stdout(expected):
+            singer.write_schema("users", {"type": "object"}, ["id"])
+            singer.write_record("users", {"id": 1, "email": "a@example.com"})
+            singer.write_state({"bookmarks": {}})
+
+        self.assertEqual(expected.getvalue(), self.stdout.getvalue())
+
+    def test_zero_buffer_writes_every_message(self):
+        """Test max_bytes of 0 disables buffering."""
+        writer = MessageWriter.from_config({"output_buffer_bytes": "0"})
+        with redirect_stdout(self.stdout):
+            writer.write_record("users", {"id": 1})
+
+        self.assertEqual(1, len(self.lines()))